@@ -0,0 +1,139 @@
+"""營收分析：以 NumPy 把訂單展開成每晚資料，依房型與日 / 週 / 月彙總入住率、ADR、RevPAR
+
+- 入住率 occupancy = 售出房晚 / 可售房晚
+- ADR（平均房價）= 客房營收 / 售出房晚
+- RevPAR（每間可售房營收）= 客房營收 / 可售房晚
+
+每筆訂單的總價平均攤到住宿的每一晚，依住宿日期（不是下訂日期）計入；
+可售房晚以目前各房型的房間數計算。
+"""
+import numpy as np
+
+import archive
+
+# 計入營收的訂單狀態
+REVENUE_STATUSES = ('confirmed', 'checked_in', 'checked_out', 'completed')
+
+GROUP_BY = ('day', 'week', 'month')
+
+# 1970-01-01 是星期四，週一為一週的第一天
+_EPOCH_WEEKDAY = 3
+
+
+def _period_starts(start_day, end_day, group_by):
+    """每一天所屬期間的第一天（整數天數）"""
+    days = np.arange(start_day, end_day, dtype=np.int64)
+    if group_by == 'day':
+        return days
+    if group_by == 'week':
+        return days - (days + _EPOCH_WEEKDAY) % 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]')
+    return months.astype('datetime64[D]').astype(np.int64)
+
+
+def _load(conn, start_day, end_day, room_type=None, include_archive=False):
+    """回傳 (房型名稱, 各房型房間數, 以及每組訂單的房型索引 / 入住日 / 退房日 / 間數 / 總價陣列)
+
+    相同房型、入住日與退房日的訂單先在 SQL 端合併成一組，大量訂單時
+    送進 Python 的資料列只剩「房型 × 日期組合」的數量。
+    include_archive=True 時一併計入封存檔中的訂單（需先 archive.attached()）。
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    type_filter = ''
+    params = []
+    if room_type is not None:
+        type_filter = ' AND r.room_type = ?'
+        params.append(room_type)
+
+    rooms = cursor.execute(f'''
+        SELECT COALESCE(r.room_type, ''), COUNT(*) FROM rooms r
+        WHERE 1=1{type_filter}
+        GROUP BY 1 ORDER BY 1
+    ''', params).fetchall()
+    room_types = [row[0] for row in rooms]
+    room_counts = np.array([row[1] for row in rooms], dtype=np.int64)
+
+    source = 'bookings'
+    if include_archive:
+        source = archive.union_sql(('room_id', 'status', 'check_in_day', 'check_out_day', 'total_price'))
+
+    groups = cursor.execute(f'''
+        SELECT COALESCE(r.room_type, ''), b.check_in_day, b.check_out_day, COUNT(*), SUM(b.total_price)
+        FROM {source} b
+        JOIN rooms r ON r.id = b.room_id
+        WHERE b.status IN ({','.join('?' * len(REVENUE_STATUSES))})
+        AND b.check_in_day < ? AND b.check_out_day > ?{type_filter}
+        GROUP BY 1, 2, 3
+    ''', REVENUE_STATUSES + (end_day, start_day) + tuple(params)).fetchall()
+    cursor.close()
+
+    type_index = {name: index for index, name in enumerate(room_types)}
+    types = np.array([type_index[row[0]] for row in groups], dtype=np.int64)
+    data = np.array([row[1:] for row in groups], dtype=np.float64).reshape(-1, 4)
+    return (room_types, room_counts, types,
+            data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2], data[:, 3])
+
+
+def occupancy_report(conn, start_day, end_day, group_by='day', room_type=None, include_archive=False):
+    """[start_day, end_day) 期間依房型與期間彙總的入住率、ADR、RevPAR
+
+    回傳 (各期間依房型的列表, 各期間全館合計的列表)，期間以第一天的整數天數表示。
+    """
+    room_types, room_counts, types, check_ins, check_outs, counts, prices = \
+        _load(conn, start_day, end_day, room_type, include_archive)
+    n_days = end_day - start_day
+    n_types = len(room_types)
+
+    # 每組每晚的營收（總價平均攤到每一晚）
+    nightly_revenue = prices / np.maximum(check_outs - check_ins, 1)
+
+    # 只展開落在查詢期間內的夜晚
+    first = np.maximum(check_ins, start_day)
+    last = np.minimum(check_outs, end_day)
+    lengths = np.maximum(last - first, 0)
+    total_nights = int(lengths.sum())
+
+    booking_index = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.arange(total_nights) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    day_index = first[booking_index] - start_day + offsets
+
+    cells = types[booking_index] * n_days + day_index
+    sold = np.bincount(cells, weights=counts[booking_index],
+                       minlength=n_types * n_days).reshape(n_types, n_days)
+    revenue = np.bincount(cells, weights=nightly_revenue[booking_index],
+                          minlength=n_types * n_days).reshape(n_types, n_days)
+
+    # 依期間彙總（各期間在 days 中是連續的一段）
+    period_starts = _period_starts(start_day, end_day, group_by)
+    boundaries = np.flatnonzero(np.r_[True, period_starts[1:] != period_starts[:-1]])
+    period_days = np.diff(np.r_[boundaries, n_days])
+    sold_by_period = np.add.reduceat(sold, boundaries, axis=1) if n_types else np.zeros((0, len(boundaries)))
+    revenue_by_period = np.add.reduceat(revenue, boundaries, axis=1) if n_types else np.zeros((0, len(boundaries)))
+    supply_by_period = np.outer(room_counts, period_days)
+
+    by_type = []
+    totals = []
+    for column, period_start in enumerate(period_starts[boundaries]):
+        for row, name in enumerate(room_types):
+            by_type.append(_metrics(int(period_start), name, sold_by_period[row, column],
+                                    revenue_by_period[row, column], supply_by_period[row, column]))
+        totals.append(_metrics(int(period_start), None, sold_by_period[:, column].sum(),
+                               revenue_by_period[:, column].sum(), supply_by_period[:, column].sum()))
+    return by_type, totals
+
+
+def _metrics(period_start, room_type, sold, revenue, supply):
+    sold = int(sold)
+    supply = int(supply)
+    revenue = float(revenue)
+    return {
+        'period_start': period_start,
+        'room_type': room_type,
+        'room_nights_sold': sold,
+        'room_nights_available': supply,
+        'revenue': round(revenue, 2),
+        'occupancy': round(sold / supply, 4) if supply else 0.0,
+        'adr': round(revenue / sold, 2) if sold else 0.0,
+        'revpar': round(revenue / supply, 2) if supply else 0.0
+    }
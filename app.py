@@ -1,8 +1,35 @@
-from flask import Flask, jsonify, request, abort
+from flask import Flask, jsonify, request, abort, has_request_context, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+import click
+import fcntl
+import heapq
+import json
 import sqlite3
 import os
-from datetime import datetime
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from write_queue import WriteQueue
+import idempotency
+import rate_limit
+from coalesce import SingleFlight
+from result_cache import ResultCache, BYPASS
+from db_pool import ConnectionPool
+from replica import ReplicaRefresher
+from shards import ShardRouter
+import query_builder
+import dates
+import inventory
+import rates
+import quotes
+import analytics
+import archive
+import backup
+import changes
+import holds
+import storage
 
 app = Flask(__name__)
 CORS(app)
@@ -10,11 +37,130 @@ CORS(app)
 # 管理員密碼（實際部署時應該使用環境變數）
 ADMIN_PASSWORD = 'admin123'
 
-# 資料庫初始化
-def init_db():
-    conn = sqlite3.connect('hotel.db')
+DATABASE = 'hotel.db'
+
+# 多館別分片：預設館別使用 DATABASE，其他館別各自使用 SHARD_DIR 下的 {property_id}.db
+DEFAULT_PROPERTY = os.environ.get('DEFAULT_PROPERTY', 'default')
+SHARD_DIR = os.environ.get('SHARD_DIR', 'shards')
+SHARD_PROPERTIES = set(filter(None, os.environ.get('SHARD_PROPERTIES', '').split(',')))
+# 跨館別管理查詢同時查詢的分片數
+SHARD_FANOUT_WORKERS = int(os.environ.get('SHARD_FANOUT_WORKERS', 8))
+
+# 寫入佇列：WRITE_QUEUE=1 時由單一寫入執行緒批次提交訂單與房間的寫入
+WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE', '0') == '1'
+WRITE_QUEUE_BATCH_SIZE = int(os.environ.get('WRITE_QUEUE_BATCH_SIZE', 32))
+
+# 每個連線池保留的閒置連線數（同時借出的連線數不受限制）與每條連線的預備語句快取數量
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+STATEMENT_CACHE_SIZE = int(os.environ.get('STATEMENT_CACHE_SIZE', 256))
+
+# 讀寫分離：GET 請求改用唯讀連線（mode=ro + PRAGMA query_only），寫入一律使用主資料庫
+READ_ONLY_ROUTING = os.environ.get('READ_ONLY_ROUTING', '1') == '1'
+# 讀取複本檔路徑（空字串表示直接以唯讀方式開啟主資料庫）與複本更新間隔（秒）
+READ_REPLICA = os.environ.get('READ_REPLICA', '')
+READ_REPLICA_INTERVAL = float(os.environ.get('READ_REPLICA_INTERVAL', 5))
+# 寫入成功後多少秒內，同一個呼叫端的讀取仍走主資料庫（讀得到自己剛寫入的資料）
+READ_STICKY_SECONDS = float(os.environ.get('READ_STICKY_SECONDS', 5))
+
+# Idempotency-Key：保存第一次回應的秒數，以及等待處理中重複請求的秒數
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 5))
+
+# 速率限制（每個 IP / API 金鑰每秒補充的請求數與桶容量）與每個 worker 的處理中請求上限
+# （MAX_INFLIGHT 需小於 gunicorn 的 --threads，見 Procfile）
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT', '1') == '1'
+RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', 20))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 100))
+RATE_LIMIT_FILE = os.environ.get('RATE_LIMIT_FILE', rate_limit.default_state_path())
+MAX_INFLIGHT = int(os.environ.get('MAX_INFLIGHT', 24))
+# 已登記的 API 金鑰（以逗號分隔，X-API-Key 標頭帶入時各自一個 bucket）
+API_KEYS = frozenset(filter(None, os.environ.get('API_KEYS', '').split(',')))
+# 前方的反向代理層數（0 表示直接對外）；設定後才以 X-Forwarded-For 中由代理加上的位址當作客戶端 IP
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+
+# 啟用請求合併的路由（以逗號分隔的函數名稱，設為空字串則全部關閉）
+COALESCE_ROUTES = set(filter(None, os.environ.get(
+    'COALESCE_ROUTES', 'get_rooms,get_bookings,get_room_types,get_stats,get_occupancy_analytics'
+).split(',')))
+
+# 統計類端點的結果快取（設為 0 關閉）
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE', '1') == '1'
+
+# 就緒檢查門檻：磁碟剩餘空間下限與 WAL 檔大小上限（MB）
+READY_MIN_FREE_MB = int(os.environ.get('READY_MIN_FREE_MB', 100))
+READY_MAX_WAL_MB = int(os.environ.get('READY_MAX_WAL_MB', 256))
+
+# 夜間稽核時間（HH:MM，空字串表示不在行程內排程，改用 flask night-audit 搭配 cron）
+NIGHT_AUDIT_TIME = os.environ.get('NIGHT_AUDIT_TIME', '')
+
+# 房型庫存帳預先建立的天數（夜間稽核時往後延伸）
+INVENTORY_HORIZON_DAYS = int(os.environ.get('INVENTORY_HORIZON_DAYS', 365))
+
+# 每晚房價預先編譯的天數（夜間稽核時往後延伸）
+RATE_HORIZON_DAYS = int(os.environ.get('RATE_HORIZON_DAYS', 365))
+
+# 退房超過幾天的 completed / cancelled 訂單在夜間稽核時移到封存檔（0 表示不自動封存）與每批筆數
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+
+# 變更紀錄保留天數（夜間稽核時清理），以及 SSE 串流的輪詢間隔、心跳間隔、單次連線秒數與每個 worker 的連線上限
+CHANGES_RETENTION_DAYS = int(os.environ.get('CHANGES_RETENTION_DAYS', 30))
+CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', 0.5))
+CHANGES_HEARTBEAT_SECONDS = float(os.environ.get('CHANGES_HEARTBEAT_SECONDS', 15))
+CHANGES_STREAM_SECONDS = float(os.environ.get('CHANGES_STREAM_SECONDS', 300))
+# （每條串流佔用一個執行緒，MAX_INFLIGHT + CHANGES_MAX_STREAMS 需小於 gunicorn 的 --threads，見 Procfile）
+CHANGES_MAX_STREAMS = int(os.environ.get('CHANGES_MAX_STREAMS', 8))
+CHANGES_RETRY_MS = 3000
+
+# 結帳期間暫時保留房間的預設秒數與上限
+HOLD_TTL_SECONDS = int(os.environ.get('HOLD_TTL_SECONDS', 600))
+HOLD_MAX_TTL_SECONDS = int(os.environ.get('HOLD_MAX_TTL_SECONDS', 1800))
+# 每個呼叫端（IP 或 API 金鑰）同時有效的保留上限（0 表示不限制；管理員不受限制）
+HOLD_MAX_PER_CLIENT = int(os.environ.get('HOLD_MAX_PER_CLIENT', 5))
+
+# 線上備份：備份目錄、每天完整備份的時間（HH:MM，空字串表示不在行程內排程）、增量快照的間隔秒數（0 表示不做）、
+# 每個資料庫保留的完整備份份數、是否以 gzip 壓縮，以及線上備份 API 每步複製的頁數與步間暫停秒數
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+BACKUP_TIME = os.environ.get('BACKUP_TIME', '')
+BACKUP_INCREMENTAL_SECONDS = int(os.environ.get('BACKUP_INCREMENTAL_SECONDS', 0))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 7))
+BACKUP_COMPRESS = os.environ.get('BACKUP_COMPRESS', '1') == '1'
+BACKUP_PAGES = int(os.environ.get('BACKUP_PAGES', 256))
+BACKUP_SLEEP = float(os.environ.get('BACKUP_SLEEP', 0.005))
+
+# 訂單狀態機：每個狀態允許轉換到的下一個狀態
+BOOKING_TRANSITIONS = {
+    'confirmed': {'checked_in', 'cancelled'},
+    'checked_in': {'checked_out'},
+    'checked_out': {'completed'},
+    'cancelled': set(),
+    'completed': set()
+}
+
+# 依訂單表重新計算房間上的訂單計數
+RECOUNT_BOOKINGS_SQL = '''
+    UPDATE rooms SET
+        total_booking_count = (SELECT COUNT(*) FROM bookings WHERE room_id = rooms.id),
+        active_booking_count = (SELECT COUNT(*) FROM bookings
+                                WHERE room_id = rooms.id AND status IN ('confirmed', 'checked_in'))
+'''
+
+def _add_column_if_missing(c, table, column, definition):
+    """舊資料庫升級用：欄位不存在時新增，回傳是否有新增"""
+    columns = [row[1] for row in c.execute(f'PRAGMA table_info({table})').fetchall()]
+    if column in columns:
+        return False
+    c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+# 資料庫初始化（各館別的資料庫檔使用相同結構，新館別不插入範例資料）
+def init_db(database=DATABASE, sample_data=True):
+    conn = sqlite3.connect(database)
     c = conn.cursor()
     
+    # WAL 模式讓讀取不會被寫入阻擋，也讓批次提交只需一次 fsync
+    c.execute('PRAGMA journal_mode=WAL')
+    
     # 創建房間表
     c.execute('''
         CREATE TABLE IF NOT EXISTS rooms (
@@ -27,6 +173,9 @@ def init_db():
             amenities TEXT DEFAULT '',  -- JSON格式存儲設施
             available INTEGER DEFAULT 1,
             image_url TEXT,
+            active_booking_count INTEGER NOT NULL DEFAULT 0,  -- confirmed / checked_in 訂單數（由觸發器維護）
+            total_booking_count INTEGER NOT NULL DEFAULT 0,   -- 所有訂單數（由觸發器維護）
+            archived_booking_count INTEGER NOT NULL DEFAULT 0,  -- 已移到封存檔的訂單數
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -42,6 +191,8 @@ def init_db():
             guest_phone TEXT,
             check_in DATE NOT NULL,
             check_out DATE NOT NULL,
+            check_in_day INTEGER,   -- check_in 的整數天數（1970-01-01 起算）
+            check_out_day INTEGER,  -- check_out 的整數天數
             nights INTEGER NOT NULL,
             guests INTEGER DEFAULT 1,
             total_price INTEGER NOT NULL,
@@ -54,6 +205,61 @@ def init_db():
         )
     ''')
     
+    # 舊資料庫升級：補上訂單計數欄位並重新計算
+    if _add_column_if_missing(c, 'rooms', 'active_booking_count', 'INTEGER NOT NULL DEFAULT 0'):
+        _add_column_if_missing(c, 'rooms', 'total_booking_count', 'INTEGER NOT NULL DEFAULT 0')
+        c.execute(RECOUNT_BOOKINGS_SQL)
+    _add_column_if_missing(c, 'rooms', 'archived_booking_count', 'INTEGER NOT NULL DEFAULT 0')
+    
+    # 整數天數欄位（check_in_day / check_out_day）：重疊判斷改用整數比較
+    dates.migrate_booking_days(c)
+    
+    # 訂單計數觸發器：任何寫入訂單的路徑都會同步更新房間上的計數
+    c.executescript('''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_count_insert AFTER INSERT ON bookings
+        BEGIN
+            UPDATE rooms SET
+                total_booking_count = total_booking_count + 1,
+                active_booking_count = active_booking_count + (NEW.status IN ('confirmed', 'checked_in'))
+            WHERE id = NEW.room_id;
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_count_delete AFTER DELETE ON bookings
+        BEGIN
+            UPDATE rooms SET
+                total_booking_count = total_booking_count - 1,
+                active_booking_count = active_booking_count - (OLD.status IN ('confirmed', 'checked_in'))
+            WHERE id = OLD.room_id;
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_count_update AFTER UPDATE OF status, room_id ON bookings
+        BEGIN
+            UPDATE rooms SET
+                total_booking_count = total_booking_count - 1,
+                active_booking_count = active_booking_count - (OLD.status IN ('confirmed', 'checked_in'))
+            WHERE id = OLD.room_id;
+            UPDATE rooms SET
+                total_booking_count = total_booking_count + 1,
+                active_booking_count = active_booking_count + (NEW.status IN ('confirmed', 'checked_in'))
+            WHERE id = NEW.room_id;
+        END;
+    ''')
+    
+    # 房型庫存帳：(room_type, night) 的可售 / 已售房數，由觸發器同步維護
+    inventory.install(c)
+    
+    # 房價規則與預先編譯的每晚房價
+    rates.install(c)
+    
+    # 變更紀錄：房間、訂單與房型訂單的寫入由觸發器記錄，供增量同步與 SSE 串流
+    changes.install(c)
+    
+    # 暫時保留：結帳期間的房間保留（到期時間存在表中，重啟後仍有效）
+    holds.install(c)
+    
+    # 冷資料封存：封存狀態表與封存檔（{資料庫}.archive.db）
+    archive.install(c, database)
+    
     # 創建用戶表（用於擴展）
     c.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -66,9 +272,22 @@ def init_db():
         )
     ''')
     
+    # 創建 Idempotency-Key 回應表（status_code 為 NULL 表示處理中）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            request_hash TEXT NOT NULL,
+            status_code INTEGER,
+            body BLOB,
+            locked_until REAL NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys (expires_at)')
+    
     # 插入範例資料（如果表是空的）
     c.execute('SELECT COUNT(*) FROM rooms')
-    if c.fetchone()[0] == 0:
+    if sample_data and c.fetchone()[0] == 0:
         sample_rooms = [
             ('豪華海景雙人房', 3500, '180度海景陽台、免費早餐、迷你吧', 'deluxe', 2, '["wifi", "breakfast", "ocean_view", "minibar"]', 1, 'https://example.com/room1.jpg'),
             ('標準單人房', 1800, '市景、辦公桌、高速網路', 'standard', 1, '["wifi", "desk", "tv"]', 1, 'https://example.com/room2.jpg'),
@@ -81,28 +300,288 @@ def init_db():
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', sample_rooms)
     
+    # 預先建立未來一段期間的庫存帳列與每晚房價
+    today = dates.today_day()
+    inventory.ensure_inventory(c, today, today + INVENTORY_HORIZON_DAYS)
+    rates.extend(c, today + RATE_HORIZON_DAYS)
+    
     conn.commit()
     conn.close()
 
 # 初始化資料庫
 init_db()
 
-# 資料庫連接函數
+# 資料庫連接函數（連線來自各館別分片的連線池，conn.close() 會歸還連線）
+
+# 讀取複本：由背景執行緒以線上備份 API 定期更新，複本檔換新後唯讀連線會重開
+# （複本只涵蓋預設館別，其他館別的 GET 請求以唯讀方式直接開啟各自的資料庫檔）
+replica_refresher = None
+if READ_ONLY_ROUTING and READ_REPLICA:
+    replica_refresher = ReplicaRefresher(DATABASE, READ_REPLICA, interval=READ_REPLICA_INTERVAL)
+    replica_refresher.start()
+
+def _open_shard(shard):
+    """初始化館別的資料庫並建立主資料庫與唯讀連線池"""
+    is_default = shard.property_id == DEFAULT_PROPERTY
+    if not is_default:
+        init_db(shard.database, sample_data=False)
+    shard.pool = ConnectionPool(shard.database, size=DB_POOL_SIZE, cached_statements=STATEMENT_CACHE_SIZE)
+    replica = replica_refresher if is_default else None
+    shard.read_pool = ConnectionPool(
+        f'file:{os.path.abspath(READ_REPLICA if replica else shard.database)}?mode=ro', uri=True,
+        size=DB_POOL_SIZE, cached_statements=STATEMENT_CACHE_SIZE, read_only=True,
+        generation=replica.generation if replica else None
+    )
+    shard.holds = holds.HoldBook()
+
+shard_router = ShardRouter(DEFAULT_PROPERTY, DATABASE, SHARD_DIR, _open_shard,
+                           properties=SHARD_PROPERTIES, max_workers=SHARD_FANOUT_WORKERS)
+
+def current_shard():
+    """目前請求的館別分片（?property_id=，未指定或不在請求中時為預設館別）"""
+    if not has_request_context():
+        return shard_router.get()
+    return shard_router.get(request.args.get('property_id'))
+
+@app.before_request
+def resolve_property():
+    """未知的館別直接回 404，不讓請求進入路由"""
+    property_id = request.args.get('property_id')
+    if property_id:
+        try:
+            shard_router.get(property_id)
+        except KeyError:
+            return jsonify({"status": "error", "message": f"找不到館別: {property_id}"}), 404
+    return None
+
+READ_STICKY_COOKIE = 'read_primary_until'
+
+# 以 POST 傳參數但不寫入的端點，也使用唯讀連線
+READ_ONLY_ENDPOINTS = {'get_rooms_batch', 'get_bookings_batch', 'batch_quotes'}
+
+def _is_read_request():
+    return request.method in ('GET', 'HEAD') or request.endpoint in READ_ONLY_ENDPOINTS
+
+def _read_your_writes():
+    """呼叫端要求讀到自己剛寫入的資料（X-Read-Primary: 1，或寫入後的黏著 cookie 尚未到期）"""
+    if request.headers.get('X-Read-Primary') == '1':
+        return True
+    try:
+        return float(request.cookies.get(READ_STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def _reads_primary():
+    """這個請求的讀取是否必須走主資料庫"""
+    if not READ_ONLY_ROUTING or not has_request_context():
+        return True
+    if not _is_read_request():
+        return True
+    return _read_your_writes()
+
 def get_db_connection():
-    conn = sqlite3.connect('hotel.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """GET 請求取得唯讀連線，其餘（寫入請求、管理指令、背景工作）取得主資料庫連線"""
+    shard = current_shard()
+    if _reads_primary():
+        return shard.pool.acquire()
+    return shard.read_pool.acquire()
+
+@app.after_request
+def stick_to_primary(response):
+    """寫入成功後設定 cookie，讓呼叫端接下來幾秒的讀取走主資料庫（複本可能還沒更新）"""
+    if (replica_refresher is not None and READ_STICKY_SECONDS > 0
+            and request.method != 'OPTIONS' and not _is_read_request() and response.status_code < 400):
+        response.set_cookie(READ_STICKY_COOKIE, str(time.time() + READ_STICKY_SECONDS),
+                            max_age=int(READ_STICKY_SECONDS) + 1, httponly=True, samesite='Lax')
+    return response
+
+def get_write_queue(shard=None):
+    """延遲建立館別的寫入佇列（在 gunicorn fork 之後才啟動執行緒）"""
+    shard = shard or current_shard()
+    if shard.write_queue is None:
+        with shard.lock:
+            if shard.write_queue is None:
+                shard.write_queue = WriteQueue(shard.database, batch_size=WRITE_QUEUE_BATCH_SIZE)
+    return shard.write_queue
+
+def run_write(job, *args):
+    """在目前請求的館別執行寫入工作 job(conn, *args)
+
+    啟用寫入佇列時交給寫入執行緒與其他請求合併提交；
+    否則直接在自己的 BEGIN IMMEDIATE 交易中執行。job 不可自行 commit。
+    """
+    return run_write_on(current_shard(), job, *args)
+
+def run_write_on(shard, job, *args):
+    """在指定館別執行寫入工作（背景工作與跨館別作業使用）"""
+    if WRITE_QUEUE_ENABLED:
+        return get_write_queue(shard).submit(job, *args)
+    
+    conn = shard.pool.acquire()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        result = job(conn, *args)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 # 權限檢查裝飾器
+def is_admin_request():
+    password = request.args.get('password') or request.headers.get('X-Admin-Password')
+    return password == ADMIN_PASSWORD
+
 def admin_required(f):
     def decorated_function(*args, **kwargs):
-        password = request.args.get('password') or request.headers.get('X-Admin-Password')
-        if password != ADMIN_PASSWORD:
+        if not is_admin_request():
             return jsonify({"status": "error", "message": "權限不足，需要管理員密碼"}), 401
         return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+def client_identity():
+    """速率限制的 key：只有驗證過的管理員密碼或已登記的 API 金鑰才有自己的 bucket，其餘以 IP 計算"""
+    if is_admin_request():
+        return rate_limit.client_identity(ADMIN_PASSWORD)
+    api_key = request.headers.get('X-API-Key')
+    if api_key in API_KEYS:
+        return rate_limit.client_identity(api_key)
+    return rate_limit.client_identity()
+
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+# 速率限制與負載卸除（健康檢查不受限制）
+rate_limiter = None
+if RATE_LIMIT_ENABLED:
+    rate_limiter = rate_limit.TokenBucketLimiter(RATE_LIMIT_FILE, RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+load_shedder = rate_limit.LoadShedder(MAX_INFLIGHT)
+rate_limit.init_app(app, rate_limiter, load_shedder, exempt={'/api/health', '/livez', '/readyz'},
+                    long_lived={'/api/changes/stream'}, identity=client_identity)
+
+idempotency_store = idempotency.IdempotencyStore(DATABASE, ttl=IDEMPOTENCY_TTL)
+
+single_flight = SingleFlight()
+result_cache = ResultCache()
+
+def _render_view(f, args, kwargs):
+    response = app.make_response(f(*args, **kwargs))
+    return response.status_code, response.get_data(), response.mimetype
+
+# 請求合併裝飾器
+def coalesced(f):
+    """相同路由與相同查詢參數的讀取請求同時進行時，只讓其中一個查詢資料庫，
+    其餘請求等待並共用它的回應（只對 COALESCE_ROUTES 中的路由生效）。
+    要求讀到自己寫入的請求不合併：進行中的查詢可能早於它的寫入開始"""
+    if f.__name__ not in COALESCE_ROUTES:
+        return f
+    
+    def decorated_function(*args, **kwargs):
+        if _read_your_writes():
+            return f(*args, **kwargs)
+        key = (f.__name__, tuple(sorted(kwargs.items())),
+               tuple(sorted(request.args.items(multi=True))))
+        
+        def compute():
+            return _render_view(f, args, kwargs)
+        
+        (status_code, body, mimetype), shared = single_flight.do(key, compute, group=f.__name__)
+        response = app.response_class(body, status=status_code, mimetype=mimetype)
+        if shared:
+            response.headers['X-Coalesced'] = 'true'
+        return response
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+# 結果快取裝飾器
+def cached(ttl, stale=0):
+    """快取路由回應 ttl 秒（對齊時間區間），過期後 stale 秒內先回舊資料並在背景更新。
+    管理員可加上 fresh=1 略過快取；要求讀到自己寫入的請求也不使用快取。"""
+    def decorator(f):
+        if not RESULT_CACHE_ENABLED:
+            return f
+        
+        def decorated_function(*args, **kwargs):
+            if _read_your_writes():
+                response = app.make_response(f(*args, **kwargs))
+                response.headers['X-Cache'] = BYPASS
+                return response
+            params = tuple(sorted(
+                (k, v) for k, v in request.args.items(multi=True) if k not in ('fresh', 'password')
+            ))
+            key = (f.__name__, tuple(sorted(kwargs.items())), params)
+            force = request.args.get('fresh') == '1' and is_admin_request()
+            path, query_string = request.path, request.query_string
+            
+            def compute():
+                if has_request_context():
+                    return _render_view(f, args, kwargs)
+                # 背景更新時沒有請求上下文，以原本的路徑與參數重建
+                with app.test_request_context(path, query_string=query_string):
+                    return _render_view(f, args, kwargs)
+            
+            (status_code, body, mimetype), state = result_cache.get_or_compute(
+                key, compute, ttl, stale, force=force,
+                should_cache=lambda result: result[0] == 200
+            )
+            response = app.response_class(body, status=status_code, mimetype=mimetype)
+            response.headers['X-Cache'] = state
+            return response
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
+# Idempotency-Key 裝飾器
+def idempotent(f):
+    """帶有 Idempotency-Key 標頭的寫入請求：第一次的回應會被保存，
+    重試時直接回放，不再執行寫入流程"""
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        
+        scoped_key = f'{request.method} {request.path} {key}'
+        property_id = request.args.get('property_id')
+        if property_id:
+            scoped_key = f'{property_id} {scoped_key}'
+        request_hash = idempotency.fingerprint(request.method, request.path, request.get_data())
+        
+        # 相同 key 的請求正在處理中：短暫等待它完成
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        while True:
+            state, stored = idempotency_store.begin(scoped_key, request_hash)
+            if state != idempotency.IN_FLIGHT or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        
+        if state == idempotency.DONE:
+            status_code, body = stored
+            response = app.response_class(body, status=status_code, mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        if state == idempotency.IN_FLIGHT:
+            return jsonify({"status": "error", "message": "相同 Idempotency-Key 的請求正在處理中"}), 409
+        if state == idempotency.MISMATCH:
+            return jsonify({"status": "error", "message": "Idempotency-Key 已用於不同的請求內容"}), 422
+        
+        try:
+            response = app.make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(scoped_key)
+            raise
+        
+        # 伺服器錯誤不保存，讓客戶端可以重試
+        if response.status_code >= 500:
+            idempotency_store.release(scoped_key)
+        else:
+            idempotency_store.complete(scoped_key, response.status_code, response.get_data())
+        return response
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
 # 輸入驗證函數
 def validate_room_data(data):
     errors = []
@@ -120,11 +599,74 @@ def validate_room_data(data):
     
     return errors
 
+# 批次查詢：單次請求最多的 id 數，以及每個 IN (...) 查詢的參數上限（低於 SQLite 的 999）
+BATCH_MAX_IDS = 1000
+BATCH_CHUNK_SIZE = 500
+
+def parse_id_list():
+    """從 ?ids=1,2,3 或 JSON {"ids": [...]} 取得不重複的 id 清單，回傳 (ids, 錯誤訊息)"""
+    if request.method == 'POST':
+        raw_ids = (request.get_json(silent=True) or {}).get('ids')
+    else:
+        raw_ids = [v for v in request.args.get('ids', '').split(',') if v.strip()]
+    
+    if not raw_ids or not isinstance(raw_ids, list):
+        return None, "需要 ids 參數"
+    try:
+        ids = list(dict.fromkeys(int(v) for v in raw_ids))
+    except (TypeError, ValueError):
+        return None, "ids 必須是整數"
+    if len(ids) > BATCH_MAX_IDS:
+        return None, f"ids 最多 {BATCH_MAX_IDS} 個"
+    return ids, None
+
+def fetch_by_ids(conn, query, ids):
+    """以 IN (...) 分批查詢，query 中的 {placeholders} 會替換成參數佔位符，回傳 {id: row}"""
+    rows = {}
+    for start in range(0, len(ids), BATCH_CHUNK_SIZE):
+        chunk = ids[start:start + BATCH_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        for row in conn.execute(query.format(placeholders=placeholders), chunk):
+            rows[row['id']] = row
+    return rows
+
+# 稀疏欄位（?fields=）與房間、訂單的查詢在 storage.py（HotelStorage）
+ROOM_FIELDS = storage.HOTEL_ROOM_FIELDS
+BOOKING_FIELDS = storage.HOTEL_BOOKING_FIELDS
+
+def parse_fields(fieldset, default='full'):
+    """?fields=（POST 時也可放在 JSON 的 fields）-> 欄位形狀，未知欄位拋出 ValueError"""
+    value = request.args.get('fields')
+    if value is None and request.method == 'POST':
+        value = (request.get_json(silent=True) or {}).get('fields')
+        if isinstance(value, list):
+            value = ','.join(str(name) for name in value)
+    return fieldset.parse(value, default)
+
+def parse_booking_filters():
+    """訂單列表的篩選參數（?status=&room_id=&guest_email=&start=&end=），日期格式錯誤時拋出 ValueError"""
+    filters = {
+        'status': request.args.get('status') or None,
+        'room_id': request.args.get('room_id', type=int) or None,
+        'guest_email': request.args.get('guest_email') or None,
+        'start': None,
+        'end': None
+    }
+    for name in ('start', 'end'):
+        if request.args.get(name):
+            filters[name] = dates.parse_day(request.args[name])
+    return filters
+
+def current_store():
+    """目前請求的館別與讀取路徑（讀取複本或主資料庫）的存取層"""
+    return storage.HotelSQLiteStorage(get_db_connection, current_shard().database)
+
 # ==================== ROOMS CRUD API ====================
 
 # CREATE - 新增房間
 @app.route('/api/rooms', methods=['POST'])
 @admin_required
+@idempotent
 def create_room():
     """新增房間 (需管理員權限)"""
     data = request.get_json()
@@ -133,92 +675,68 @@ def create_room():
     errors = validate_room_data(data)
     if errors:
         return jsonify({"status": "error", "messages": errors}), 400
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+
     try:
-        cursor.execute('''
-            INSERT INTO rooms (name, price, description, room_type, capacity, amenities, available, image_url)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['name'].strip(),
-            data['price'],
-            data.get('description', ''),
-            data.get('room_type', 'standard'),
-            data.get('capacity', 2),
-            data.get('amenities', '[]'),
-            data.get('available', 1),
-            data.get('image_url', '')
-        ))
-        
-        conn.commit()
-        room_id = cursor.lastrowid
-        
-        # 取得新增的房間
-        new_room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
-        
-        # 更新時間戳
-        conn.execute('UPDATE rooms SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (room_id,))
-        conn.commit()
-        
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "message": "房間新增成功",
-            "data": dict(new_room)
-        }), 201
-        
+        payload, status_code = run_write(_create_room_tx, data)
+        return jsonify(payload), status_code
+
     except Exception as e:
-        conn.close()
         return jsonify({"status": "error", "message": f"新增失敗: {str(e)}"}), 500
 
+def _create_room_tx(conn, data):
+    cursor = conn.execute('''
+        INSERT INTO rooms (name, price, description, room_type, capacity, amenities, available, image_url)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        data['name'].strip(),
+        data['price'],
+        data.get('description', ''),
+        data.get('room_type', 'standard'),
+        data.get('capacity', 2),
+        data.get('amenities', '[]'),
+        data.get('available', 1),
+        data.get('image_url', '')
+    ))
+    room_id = cursor.lastrowid
+    rates.extend(conn, dates.today_day() + RATE_HORIZON_DAYS, [room_id])
+
+    # 取得新增的房間
+    new_room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
+
+    return {
+        "status": "success",
+        "message": "房間新增成功",
+        "data": dict(new_room)
+    }, 201
+
 # READ - 取得所有房間
 @app.route('/api/rooms')
+@coalesced
 def get_rooms():
-    """取得所有房間（可篩選）"""
+    """取得所有房間（可篩選，?fields= 指定回傳欄位）"""
+    try:
+        shape = parse_fields(ROOM_FIELDS)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
     # 獲取查詢參數
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
     room_type = request.args.get('type')
     available_only = request.args.get('available', type=lambda v: v.lower() == 'true')
     
-    conn = get_db_connection()
-    
-    # 動態構建查詢
-    query = 'SELECT * FROM rooms WHERE 1=1'
-    params = []
-    
-    if min_price is not None:
-        query += ' AND price >= ?'
-        params.append(min_price)
-    
-    if max_price is not None:
-        query += ' AND price <= ?'
-        params.append(max_price)
-    
-    if room_type:
-        query += ' AND room_type = ?'
-        params.append(room_type)
-    
-    if available_only:
-        query += ' AND available = 1'
-    
     # 排序
     sort_by = request.args.get('sort_by', 'price')
-    sort_order = request.args.get('sort_order', 'asc')
-    valid_sort_fields = ['price', 'capacity', 'created_at', 'name']
+    descending = request.args.get('sort_order', 'asc').lower() == 'desc'
     
-    if sort_by in valid_sort_fields:
-        query += f' ORDER BY {sort_by} {sort_order.upper()}'
-    else:
-        query += ' ORDER BY price ASC'
-    
-    rooms = conn.execute(query, params).fetchall()
-    conn.close()
+    rooms = current_store().list_rooms({
+        'min_price': min_price,
+        'max_price': max_price,
+        'room_type': room_type or None,
+        'available': True if available_only else None
+    }, sort_by, descending, shape)
     
-    rooms_list = [dict(room) for room in rooms]
+    rooms_list = [ROOM_FIELDS.serialize(room, shape) for room in rooms]
     
     return jsonify({
         "status": "success",
@@ -226,118 +744,74 @@ def get_rooms():
         "data": rooms_list
     })
 
+# READ - 批次取得多個房間
+@app.route('/api/rooms/batch', methods=['GET', 'POST'])
+def get_rooms_batch():
+    """一次取得多個房間（?ids=1,2,3 或 POST {"ids": [...]}），格式與單一房間相同"""
+    ids, error = parse_id_list()
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    try:
+        shape = parse_fields(ROOM_FIELDS)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    rooms = current_store().rooms_by_ids(ids, shape)
+    
+    rooms_list = [ROOM_FIELDS.serialize(rooms[room_id], shape) for room_id in ids if room_id in rooms]
+    
+    return jsonify({
+        "status": "success",
+        "count": len(rooms_list),
+        "data": rooms_list,
+        "missing": [room_id for room_id in ids if room_id not in rooms]
+    })
+
 # READ - 取得單一房間
 @app.route('/api/rooms/<int:room_id>')
 def get_room(room_id):
     """取得特定房間詳細資訊"""
-    conn = get_db_connection()
+    try:
+        shape = parse_fields(ROOM_FIELDS)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     
-    room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
+    room = current_store().get_room(room_id, shape)
     
     if room is None:
-        conn.close()
         return jsonify({"status": "error", "message": "房間不存在"}), 404
     
-    # 獲取該房間的訂單數
-    booking_count = conn.execute('SELECT COUNT(*) FROM bookings WHERE room_id = ?', (room_id,)).fetchone()[0]
-    
-    conn.close()
-    
-    room_data = dict(room)
-    room_data['booking_count'] = booking_count
-    
     return jsonify({
         "status": "success",
-        "data": room_data
+        "data": ROOM_FIELDS.serialize(room, shape)
     })
 
 # UPDATE - 更新房間
 @app.route('/api/rooms/<int:room_id>', methods=['PUT'])
 @admin_required
+@idempotent
 def update_room(room_id):
     """更新房間資訊 (需管理員權限)"""
     data = request.get_json()
     
-    conn = get_db_connection()
-    
-    # 檢查房間是否存在
-    room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
-    if room is None:
-        conn.close()
-        return jsonify({"status": "error", "message": "房間不存在"}), 404
-    
-    # 構建更新語句
-    update_fields = []
-    update_values = []
-    
-    if 'name' in data:
-        update_fields.append('name = ?')
-        update_values.append(data['name'].strip())
-    
-    if 'price' in data:
-        if not isinstance(data['price'], (int, float)) or data['price'] <= 0:
-            conn.close()
-            return jsonify({"status": "error", "message": "價格必須是正數"}), 400
-        update_fields.append('price = ?')
-        update_values.append(data['price'])
-    
-    if 'description' in data:
-        update_fields.append('description = ?')
-        update_values.append(data['description'])
-    
-    if 'room_type' in data:
-        update_fields.append('room_type = ?')
-        update_values.append(data['room_type'])
-    
-    if 'capacity' in data:
-        update_fields.append('capacity = ?')
-        update_values.append(data['capacity'])
-    
-    if 'amenities' in data:
-        update_fields.append('amenities = ?')
-        update_values.append(data.get('amenities', '[]'))
-    
-    if 'available' in data:
-        update_fields.append('available = ?')
-        update_values.append(1 if data['available'] else 0)
+    if 'price' in data and (not isinstance(data['price'], (int, float)) or data['price'] <= 0):
+        return jsonify({"status": "error", "message": "價格必須是正數"}), 400
     
-    if 'image_url' in data:
-        update_fields.append('image_url = ?')
-        update_values.append(data['image_url'])
-    
-    if not update_fields:
-        conn.close()
+    values = _room_update_values(data, query_builder.update_fields('rooms', data))
+    if not values:
         return jsonify({"status": "error", "message": "沒有提供更新資料"}), 400
     
-    # 添加更新時間
-    update_fields.append('updated_at = CURRENT_TIMESTAMP')
-    
-    # 執行更新
-    update_values.append(room_id)
-    update_query = f'UPDATE rooms SET {", ".join(update_fields)} WHERE id = ?'
-    
     try:
-        conn.execute(update_query, update_values)
-        conn.commit()
-        
-        # 取得更新後的房間資料
-        updated_room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
-        
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "message": "房間更新成功",
-            "data": dict(updated_room)
-        })
+        payload, status_code = run_write(_update_room_tx, room_id, values, "房間更新成功")
+        return jsonify(payload), status_code
         
     except Exception as e:
-        conn.close()
         return jsonify({"status": "error", "message": f"更新失敗: {str(e)}"}), 500
 
 # PARTIAL UPDATE - 部分更新房間
 @app.route('/api/rooms/<int:room_id>', methods=['PATCH'])
 @admin_required
+@idempotent
 def patch_room(room_id):
     """部分更新房間（例如只更新可用狀態）"""
     data = request.get_json()
@@ -345,87 +819,89 @@ def patch_room(room_id):
     if not data:
         return jsonify({"status": "error", "message": "沒有提供更新資料"}), 400
     
-    conn = get_db_connection()
-    
-    # 檢查房間是否存在
-    room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
-    if room is None:
-        conn.close()
-        return jsonify({"status": "error", "message": "房間不存在"}), 404
-    
     # 只允許更新特定欄位
     allowed_fields = ['available', 'price', 'description']
-    update_data = {k: v for k, v in data.items() if k in allowed_fields}
+    values = _room_update_values(data, query_builder.update_fields('rooms', data, allowed_fields))
     
-    if not update_data:
-        conn.close()
+    if not values:
         return jsonify({"status": "error", "message": "沒有有效的更新欄位"}), 400
     
     # 執行更新
     try:
-        for field, value in update_data.items():
-            if field == 'available':
-                value = 1 if value else 0
-            conn.execute(f'UPDATE rooms SET {field} = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?', 
-                        (value, room_id))
-        
-        conn.commit()
-        updated_room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "message": "房間部分更新成功",
-            "data": dict(updated_room)
-        })
+        payload, status_code = run_write(_update_room_tx, room_id, values, "房間部分更新成功")
+        return jsonify(payload), status_code
         
     except Exception as e:
-        conn.close()
         return jsonify({"status": "error", "message": f"更新失敗: {str(e)}"}), 500
 
+def _room_update_values(data, fields):
+    """整理房間更新欄位的值"""
+    values = {field: data[field] for field in fields}
+    if 'name' in values:
+        values['name'] = values['name'].strip()
+    if 'available' in values:
+        values['available'] = 1 if values['available'] else 0
+    return values
+
+def _update_room_tx(conn, room_id, values, message):
+    # 單一 UPDATE ... RETURNING，房間不存在時不會回傳資料列
+    updated_room = query_builder.execute_update(conn, 'rooms', room_id, values)
+    if updated_room is None:
+        return {"status": "error", "message": "房間不存在"}, 404
+    
+    # 底價或房型變更時重新編譯這間房的每晚房價
+    if 'price' in values or 'room_type' in values:
+        rates.recompile(conn, [room_id])
+    
+    return {
+        "status": "success",
+        "message": message,
+        "data": dict(updated_room)
+    }, 200
+
 # DELETE - 刪除房間
 @app.route('/api/rooms/<int:room_id>', methods=['DELETE'])
 @admin_required
+@idempotent
 def delete_room(room_id):
     """刪除房間 (需管理員權限)"""
-    conn = get_db_connection()
-    
+    try:
+        payload, status_code = run_write(_delete_room_tx, room_id)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"刪除失敗: {str(e)}"}), 500
+
+def _delete_room_tx(conn, room_id):
     # 檢查房間是否存在
     room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
     if room is None:
-        conn.close()
-        return jsonify({"status": "error", "message": "房間不存在"}), 404
+        return {"status": "error", "message": "房間不存在"}, 404
     
     # 檢查是否有關聯的訂單
-    booking_count = conn.execute('SELECT COUNT(*) FROM bookings WHERE room_id = ?', (room_id,)).fetchone()[0]
+    booking_count = room['total_booking_count'] + room['archived_booking_count']
     if booking_count > 0:
-        conn.close()
-        return jsonify({
+        return {
             "status": "error", 
             "message": "無法刪除，此房間有相關訂單",
             "booking_count": booking_count
-        }), 400
+        }, 400
     
     # 執行刪除
-    try:
-        conn.execute('DELETE FROM rooms WHERE id = ?', (room_id,))
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "message": "房間刪除成功",
-            "deleted_room_id": room_id
-        })
-        
-    except Exception as e:
-        conn.close()
-        return jsonify({"status": "error", "message": f"刪除失敗: {str(e)}"}), 500
+    conn.execute('DELETE FROM rooms WHERE id = ?', (room_id,))
+    rates.remove(conn, room_id)
+
+    return {
+        "status": "success",
+        "message": "房間刪除成功",
+        "deleted_room_id": room_id
+    }, 200
 
 # ==================== BOOKINGS CRUD API ====================
 
 # CREATE - 新增訂單
 @app.route('/api/bookings', methods=['POST'])
+@idempotent
 def create_booking():
     """創建新訂單"""
     data = request.get_json()
@@ -436,283 +912,1185 @@ def create_booking():
         if field not in data:
             return jsonify({"status": "error", "message": f"缺少必要欄位: {field}"}), 400
     
-    conn = get_db_connection()
-    
+    # 計算住宿天數（以整數天數計算）
     try:
-        # 檢查房間是否存在且可用
-        room = conn.execute('SELECT * FROM rooms WHERE id = ? AND available = 1', 
-                          (data['room_id'],)).fetchone()
-        if room is None:
-            conn.close()
-            return jsonify({"status": "error", "message": "房間不存在或不可預訂"}), 400
+        check_in_day = dates.parse_day(data['check_in'])
+        check_out_day = dates.parse_day(data['check_out'])
+        nights = check_out_day - check_in_day
         
-        # 計算住宿天數
-        try:
-            check_in_date = datetime.strptime(data['check_in'], '%Y-%m-%d')
-            check_out_date = datetime.strptime(data['check_out'], '%Y-%m-%d')
-            nights = (check_out_date - check_in_date).days
+        if nights <= 0:
+            return jsonify({"status": "error", "message": "退房日期必須晚於入住日期"}), 400
             
-            if nights <= 0:
-                return jsonify({"status": "error", "message": "退房日期必須晚於入住日期"}), 400
-                
-        except ValueError:
-            return jsonify({"status": "error", "message": "日期格式錯誤，請使用 YYYY-MM-DD"}), 400
-        
-        # 檢查日期衝突
-        conflicting = conn.execute('''
-            SELECT COUNT(*) FROM bookings 
-            WHERE room_id = ? 
-            AND status NOT IN ('cancelled')
-            AND NOT (check_out <= ? OR check_in >= ?)
-        ''', (data['room_id'], data['check_in'], data['check_out'])).fetchone()[0]
-        
-        if conflicting > 0:
-            conn.close()
-            return jsonify({"status": "error", "message": "該日期區間已被預訂"}), 400
-        
-        # 計算總價
-        total_price = nights * room['price']
-        
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO bookings (room_id, guest_name, guest_email, guest_phone, 
-                                 check_in, check_out, nights, guests, total_price, 
-                                 special_requests)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['room_id'],
-            data['guest_name'],
-            data['guest_email'],
-            data.get('guest_phone', ''),
-            data['check_in'],
-            data['check_out'],
-            nights,
-            data.get('guests', 1),
-            total_price,
-            data.get('special_requests', '')
-        ))
-        
-        conn.commit()
-        booking_id = cursor.lastrowid
-        
-        # 取得新增的訂單
-        new_booking = conn.execute('''
-            SELECT b.*, r.name as room_name, r.price as room_price 
-            FROM bookings b
-            JOIN rooms r ON b.room_id = r.id
-            WHERE b.id = ?
-        ''', (booking_id,)).fetchone()
-        
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "message": "訂單創建成功",
-            "data": dict(new_booking)
-        }), 201
+    except ValueError:
+        return jsonify({"status": "error", "message": "日期格式錯誤，請使用 YYYY-MM-DD"}), 400
+    
+    try:
+        payload, status_code = run_write(_create_booking_tx, data, check_in_day, check_out_day)
+        # 日期衝突時附上最近的替代日期與相近房間（寫入交易之外另外查詢，不佔住寫入鎖）
+        if payload.get('conflict'):
+            conn = get_db_connection()
+            try:
+                _, payload['suggestions'] = suggest_alternatives(
+                    conn, data['room_id'], check_in_day, check_out_day,
+                    data['guests'] if isinstance(data.get('guests'), int) else 1, data.get('hold_token'))
+            finally:
+                conn.close()
+        return jsonify(payload), status_code
         
     except Exception as e:
-        conn.close()
         return jsonify({"status": "error", "message": f"創建訂單失敗: {str(e)}"}), 500
 
-# READ - 取得所有訂單
-@app.route('/api/bookings')
-def get_bookings():
-    """取得所有訂單（可篩選）"""
-    # 獲取查詢參數
-    status = request.args.get('status')
-    room_id = request.args.get('room_id', type=int)
-    guest_email = request.args.get('guest_email')
-    
-    conn = get_db_connection()
+def _create_booking_tx(conn, data, check_in_day, check_out_day):
+    # 檢查房間是否存在且可用
+    room = conn.execute('SELECT * FROM rooms WHERE id = ? AND available = 1', 
+                      (data['room_id'],)).fetchone()
+    if room is None:
+        return {"status": "error", "message": "房間不存在或不可預訂"}, 400
     
-    query = '''
+    # 檢查日期衝突（與新增在同一個寫入交易內，不會重複訂房）
+    conflicting = conn.execute('''
+        SELECT COUNT(*) FROM bookings 
+        WHERE room_id = ? 
+        AND status NOT IN ('cancelled')
+        AND check_in_day < ? AND check_out_day > ?
+    ''', (data['room_id'], check_out_day, check_in_day)).fetchone()[0]
+    
+    if conflicting > 0:
+        return {"status": "error", "message": "該日期區間已被預訂", "conflict": True}, 400
+    
+    # 暫時保留：帶入自己的 hold_token 時略過該保留，其他客人的保留視同已預訂
+    hold_token = data.get('hold_token')
+    if hold_token:
+        hold = holds.active(conn, hold_token)
+        if hold is None:
+            return {"status": "error", "message": "保留不存在或已過期"}, 400
+        if (hold.room_id, hold.check_in_day, hold.check_out_day) != (data['room_id'], check_in_day, check_out_day):
+            return {"status": "error", "message": "保留的房間或日期與訂單不符"}, 400
+    if holds.conflicts(conn, data['room_id'], check_in_day, check_out_day, exclude=hold_token) > 0:
+        return {"status": "error", "message": "該日期區間已被其他客人暫時保留", "conflict": True}, 400
+    
+    # 房型庫存：房型訂單已保留的房數與其他客人暫時保留的房間也要扣掉
+    # （沒有房型的房間不在房型庫存帳中，只檢查這間房本身的衝突）
+    if (room['room_type'] is not None
+            and _unheld_type_free(conn, room['room_type'], check_in_day, check_out_day, hold_token) <= 0):
+        return {"status": "error", "message": "該房型在此日期區間已售完", "conflict": True}, 400
+    
+    # 計算總價（預先編譯的每晚房價累計和相減）
+    nights = check_out_day - check_in_day
+    total_price = rates.stay_total(conn, room, check_in_day, check_out_day)
+    
+    cursor = conn.execute('''
+        INSERT INTO bookings (room_id, guest_name, guest_email, guest_phone, 
+                             check_in, check_out, check_in_day, check_out_day,
+                             nights, guests, total_price, special_requests)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        data['room_id'],
+        data['guest_name'],
+        data['guest_email'],
+        data.get('guest_phone', ''),
+        data['check_in'],
+        data['check_out'],
+        check_in_day,
+        check_out_day,
+        nights,
+        data.get('guests', 1),
+        total_price,
+        data.get('special_requests', '')
+    ))
+    booking_id = cursor.lastrowid
+    if hold_token:
+        holds.release(conn, hold_token)
+    
+    # 取得新增的訂單
+    new_booking = conn.execute('''
         SELECT b.*, r.name as room_name, r.price as room_price 
         FROM bookings b
         JOIN rooms r ON b.room_id = r.id
-        WHERE 1=1
-    '''
-    params = []
-    
-    if status:
-        query += ' AND b.status = ?'
-        params.append(status)
-    
-    if room_id:
-        query += ' AND b.room_id = ?'
-        params.append(room_id)
+        WHERE b.id = ?
+    ''', (booking_id,)).fetchone()
     
-    if guest_email:
-        query += ' AND b.guest_email = ?'
-        params.append(guest_email)
+    return {
+        "status": "success",
+        "message": "訂單創建成功",
+        "data": dates.without_day_columns(new_booking)
+    }, 201
+
+# READ - 取得所有訂單
+@app.route('/api/bookings')
+@coalesced
+def get_bookings():
+    """取得所有訂單（可篩選；指定 start / end 住宿區間且涵蓋已封存的期間時包含封存的訂單）"""
+    try:
+        filters = parse_booking_filters()
+    except ValueError:
+        return jsonify({"status": "error", "message": "日期格式錯誤，請使用 YYYY-MM-DD"}), 400
+    try:
+        shape = parse_fields(BOOKING_FIELDS, 'list')
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     
-    query += ' ORDER BY b.created_at DESC'
+    rows = current_store().list_bookings(filters, shape)
+    bookings_list = [BOOKING_FIELDS.serialize(row, shape) for row in rows]
     
-    bookings = conn.execute(query, params).fetchall()
-    conn.close()
+    return jsonify({
+        "status": "success",
+        "count": len(bookings_list),
+        "data": bookings_list
+    })
+
+# READ - 批次取得多筆訂單
+@app.route('/api/bookings/batch', methods=['GET', 'POST'])
+def get_bookings_batch():
+    """一次取得多筆訂單（?ids=1,2,3 或 POST {"ids": [...]}），格式與單一訂單相同"""
+    ids, error = parse_id_list()
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    try:
+        shape = parse_fields(BOOKING_FIELDS)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    bookings = current_store().bookings_by_ids(ids, shape)
     
-    bookings_list = [dict(booking) for booking in bookings]
+    bookings_list = [BOOKING_FIELDS.serialize(bookings[booking_id], shape)
+                     for booking_id in ids if booking_id in bookings]
     
     return jsonify({
         "status": "success",
         "count": len(bookings_list),
-        "data": bookings_list
+        "data": bookings_list,
+        "missing": [booking_id for booking_id in ids if booking_id not in bookings]
     })
 
 # READ - 取得單一訂單
 @app.route('/api/bookings/<int:booking_id>')
 def get_booking(booking_id):
     """取得特定訂單詳細資訊"""
-    conn = get_db_connection()
+    try:
+        shape = parse_fields(BOOKING_FIELDS)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     
-    booking = conn.execute('''
-        SELECT b.*, r.name as room_name, r.price as room_price, 
-               r.description as room_description, r.image_url as room_image
-        FROM bookings b
-        JOIN rooms r ON b.room_id = r.id
-        WHERE b.id = ?
-    ''', (booking_id,)).fetchone()
+    # 熱資料中沒有時會再查封存檔（已封存的訂單帶有 archived_at）
+    booking = current_store().get_booking(booking_id, shape)
     
     if booking is None:
-        conn.close()
         return jsonify({"status": "error", "message": "訂單不存在"}), 404
     
-    conn.close()
-    
     return jsonify({
         "status": "success",
-        "data": dict(booking)
+        "data": BOOKING_FIELDS.serialize(booking, shape)
     })
 
 # UPDATE - 更新訂單
 @app.route('/api/bookings/<int:booking_id>', methods=['PUT'])
+@idempotent
 def update_booking(booking_id):
     """更新訂單資訊"""
     data = request.get_json()
     
-    # 檢查訂單是否存在
-    conn = get_db_connection()
-    booking = conn.execute('SELECT * FROM bookings WHERE id = ?', (booking_id,)).fetchone()
-    
-    if booking is None:
-        conn.close()
-        return jsonify({"status": "error", "message": "訂單不存在"}), 404
-    
     # 只允許更新特定欄位
-    allowed_fields = ['guest_name', 'guest_email', 'guest_phone', 'guests', 'special_requests']
-    update_data = {k: v for k, v in data.items() if k in allowed_fields}
+    values = {field: data[field] for field in query_builder.update_fields('bookings', data)}
     
-    if not update_data:
-        conn.close()
+    if not values:
         return jsonify({"status": "error", "message": "沒有有效的更新欄位"}), 400
     
     try:
-        for field, value in update_data.items():
-            conn.execute(f'UPDATE bookings SET {field} = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?', 
-                        (value, booking_id))
-        
-        conn.commit()
-        
-        # 取得更新後的訂單
-        updated_booking = conn.execute('''
-            SELECT b.*, r.name as room_name, r.price as room_price 
-            FROM bookings b
-            JOIN rooms r ON b.room_id = r.id
-            WHERE b.id = ?
-        ''', (booking_id,)).fetchone()
-        
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "message": "訂單更新成功",
-            "data": dict(updated_booking)
-        })
+        payload, status_code = run_write(_update_booking_tx, booking_id, values)
+        return jsonify(payload), status_code
         
     except Exception as e:
-        conn.close()
         return jsonify({"status": "error", "message": f"更新失敗: {str(e)}"}), 500
 
+def _update_booking_tx(conn, booking_id, values):
+    # 單一 UPDATE ... RETURNING（含房間名稱與價格），訂單不存在時不會回傳資料列
+    updated_booking = query_builder.execute_update(conn, 'bookings', booking_id, values)
+    if updated_booking is None:
+        return {"status": "error", "message": "訂單不存在"}, 404
+    
+    return {
+        "status": "success",
+        "message": "訂單更新成功",
+        "data": dates.without_day_columns(updated_booking)
+    }, 200
+
 # DELETE - 刪除訂單
 @app.route('/api/bookings/<int:booking_id>', methods=['DELETE'])
 @admin_required
+@idempotent
 def delete_booking(booking_id):
     """刪除訂單 (需管理員權限)"""
-    conn = get_db_connection()
-    
+    try:
+        payload, status_code = run_write(_cancel_booking_tx, booking_id)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"刪除失敗: {str(e)}"}), 500
+
+def _cancel_booking_tx(conn, booking_id):
     # 檢查訂單是否存在
     booking = conn.execute('SELECT * FROM bookings WHERE id = ?', (booking_id,)).fetchone()
     if booking is None:
+        return {"status": "error", "message": "訂單不存在"}, 404
+    
+    # 軟刪除：將狀態改為 cancelled
+    conn.execute('''
+        UPDATE bookings 
+        SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP 
+        WHERE id = ?
+    ''', (booking_id,))
+    
+    return {
+        "status": "success",
+        "message": "訂單已取消",
+        "cancelled_booking_id": booking_id
+    }, 200
+
+# BULK UPDATE - 批次變更訂單狀態
+@app.route('/api/bookings/status', methods=['POST'])
+@admin_required
+@idempotent
+def bulk_update_booking_status():
+    """批次變更訂單狀態 (需管理員權限)
+
+    {"ids": [1, 2], "status": "checked_in"} 或
+    {"transitions": [{"id": 1, "status": "checked_in"}, {"id": 2, "status": "checked_out"}]}
+    """
+    data = request.get_json() or {}
+    
+    if 'transitions' in data:
+        transitions = data['transitions']
+    else:
+        transitions = [{"id": booking_id, "status": data.get('status')} for booking_id in data.get('ids', [])]
+    
+    if not transitions or not isinstance(transitions, list):
+        return jsonify({"status": "error", "message": "沒有提供狀態變更"}), 400
+    if len(transitions) > BATCH_MAX_IDS:
+        return jsonify({"status": "error", "message": f"一次最多 {BATCH_MAX_IDS} 筆"}), 400
+    
+    targets = {}
+    for item in transitions:
+        try:
+            booking_id = int(item['id'])
+        except (TypeError, KeyError, ValueError):
+            return jsonify({"status": "error", "message": "訂單 id 必須是整數"}), 400
+        if item.get('status') not in BOOKING_TRANSITIONS:
+            return jsonify({"status": "error", "message": f"無效的訂單狀態: {item.get('status')}"}), 400
+        targets[booking_id] = item['status']
+    
+    try:
+        payload, status_code = run_write(_bulk_status_tx, targets)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"更新失敗: {str(e)}"}), 500
+
+def _bulk_status_tx(conn, targets):
+    current = fetch_by_ids(conn, 'SELECT id, status FROM bookings WHERE id IN ({placeholders})', list(targets))
+    
+    # 依目標狀態分組，不合法的轉換列入 rejected
+    by_status = {}
+    rejected = []
+    for booking_id, new_status in targets.items():
+        row = current.get(booking_id)
+        if row is None:
+            rejected.append({"id": booking_id, "status": new_status, "reason": "訂單不存在"})
+        elif new_status not in BOOKING_TRANSITIONS.get(row['status'], ()):
+            rejected.append({"id": booking_id, "status": new_status,
+                             "reason": f"無法從 {row['status']} 變更為 {new_status}"})
+        else:
+            by_status.setdefault(new_status, []).append(booking_id)
+    
+    # 每個目標狀態一條 UPDATE ... WHERE id IN (...)
+    updated = {}
+    for new_status, ids in by_status.items():
+        for start in range(0, len(ids), BATCH_CHUNK_SIZE):
+            chunk = ids[start:start + BATCH_CHUNK_SIZE]
+            conn.execute(f'''
+                UPDATE bookings SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id IN ({','.join('?' * len(chunk))})
+            ''', [new_status] + chunk)
+        updated[new_status] = ids
+    
+    return {
+        "status": "success",
+        "message": "訂單狀態已更新",
+        "updated": updated,
+        "updated_count": sum(len(ids) for ids in updated.values()),
+        "rejected": rejected
+    }, 200
+
+def _night_audit_tx(conn):
+    """夜間稽核：所有已退房的訂單標記為完成，把庫存帳與每晚房價往後延伸，並清理過期的變更紀錄與保留"""
+    cursor = conn.execute('''
+        UPDATE bookings SET status = 'completed', updated_at = CURRENT_TIMESTAMP
+        WHERE status = 'checked_out'
+    ''')
+    today = dates.today_day()
+    inventory.ensure_inventory(conn, today, today + INVENTORY_HORIZON_DAYS)
+    rates.extend(conn, today + RATE_HORIZON_DAYS)
+    completed = cursor.rowcount
+    changes.prune(conn, CHANGES_RETENTION_DAYS)
+    holds.prune(conn)
+    return completed
+
+def run_night_audit():
+    """對所有館別執行夜間稽核（各館別平行執行），回傳完成的訂單總數"""
+    results = shard_router.fan_out(lambda shard: run_write_on(shard, _night_audit_tx))
+    completed = sum(results.values())
+    app.logger.info(f"夜間稽核完成：{completed} 筆訂單標記為 completed")
+    if ARCHIVE_AFTER_DAYS > 0:
+        run_archive(ARCHIVE_AFTER_DAYS)
+    return completed
+
+def run_archive(days, property_ids=None):
+    """把各館別退房超過 days 天的 completed / cancelled 訂單分批移到封存檔，回傳移動筆數"""
+    before_day = dates.today_day() - days
+    results = shard_router.fan_out(
+        lambda shard: archive.archive_bookings(shard.database, before_day, batch_size=ARCHIVE_BATCH_SIZE),
+        property_ids
+    )
+    archived = sum(results.values())
+    app.logger.info(f"封存完成：{archived} 筆訂單移到封存檔")
+    return archived
+
+def run_backup(incremental=False, property_ids=None, min_age=0):
+    """以線上備份 API 備份各館別的資料庫與封存檔（寫入不必停下來），回傳各檔案的 manifest
+
+    其他行程正在備份時回傳 None；min_age 秒內已有快照的檔案略過（完整備份只看完整快照），
+    每個 worker 各自排程時不重複備份。
+    """
+    with backup.exclusive(BACKUP_DIR) as acquired:
+        if not acquired:
+            return None
+        results = []
+        for property_id in property_ids or shard_router.properties():
+            database = shard_router.get(property_id).database
+            for label, path in ((property_id, database), (f'{property_id}.archive', archive.path_for(database))):
+                if not os.path.exists(path):
+                    continue
+                if min_age:
+                    last = backup.latest(BACKUP_DIR, label, None if incremental else 'full')
+                    if last and time.time() - datetime.fromisoformat(last['created_at']).timestamp() < min_age:
+                        continue
+                manifest = backup.snapshot(path, BACKUP_DIR, label, incremental,
+                                           BACKUP_PAGES, BACKUP_SLEEP, BACKUP_COMPRESS)
+                if manifest['kind'] == 'full' and BACKUP_KEEP > 0:
+                    backup.prune(BACKUP_DIR, label, BACKUP_KEEP)
+                results.append(dict(manifest, property_id=property_id))
+    written = [manifest for manifest in results if not manifest.get('unchanged')]
+    app.logger.info(f"備份完成：{len(written)} 份{'增量' if incremental else '完整'}快照")
+    return results
+
+def _claim_daily_run(name):
+    """跨行程認領今天的排程工作：同一天只有第一個呼叫的行程回傳 True
+
+    每個 gunicorn worker 都會啟動排程執行緒，以檔案鎖保護記錄上次執行日期的檔案，
+    同一天其他 worker（包括稍晚才醒來的）都會略過。
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    path = os.path.join(os.path.dirname(os.path.abspath(DATABASE)), f'.{name}.last-run')
+    with open(path, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            if f.read().strip() == today:
+                return False
+            f.seek(0)
+            f.truncate()
+            f.write(today)
+            f.flush()
+            return True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _daily_scheduler(at, job, description, claim=None):
+    """每天 at（HH:MM）執行 job；有 claim 時以 _claim_daily_run(claim) 確保所有行程合計只執行一次"""
+    hour, minute = (int(part) for part in at.split(':'))
+    while True:
+        now = datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if next_run <= now:
+            next_run = next_run + timedelta(days=1)
+        time.sleep((next_run - now).total_seconds())
+        if claim and not _claim_daily_run(claim):
+            continue
+        try:
+            job()
+        except Exception as e:
+            app.logger.error(f"{description}失敗: {e}")
+
+def _incremental_backup_scheduler(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            run_backup(incremental=True, min_age=interval / 2)
+        except Exception as e:
+            app.logger.error(f"增量備份失敗: {e}")
+
+if NIGHT_AUDIT_TIME:
+    threading.Thread(target=_daily_scheduler, args=(NIGHT_AUDIT_TIME, run_night_audit, '夜間稽核', 'night-audit'),
+                     name='night-audit', daemon=True).start()
+
+if BACKUP_TIME:
+    # 認領當天的備份；認領檔遺失時仍以 min_age 略過半天內已有的完整快照
+    threading.Thread(target=_daily_scheduler,
+                     args=(BACKUP_TIME, lambda: run_backup(min_age=12 * 3600), '備份', 'backup'),
+                     name='backup', daemon=True).start()
+
+if BACKUP_INCREMENTAL_SECONDS > 0:
+    threading.Thread(target=_incremental_backup_scheduler, args=(BACKUP_INCREMENTAL_SECONDS,),
+                     name='incremental-backup', daemon=True).start()
+
+# ==================== 暫時保留 API ====================
+
+def _hold_data(hold, status='active'):
+    return {
+        "token": hold[0],
+        "room_id": hold[1],
+        "check_in": dates.format_day(hold[2]),
+        "check_out": dates.format_day(hold[3]),
+        "expires_at": datetime.fromtimestamp(hold[4]).isoformat(timespec='seconds'),
+        "expires_in": max(int(hold[4] - time.time()), 0),
+        "status": status
+    }
+
+def _unheld_type_free(conn, room_type, check_in_day, check_out_day, hold_token=None):
+    """房型每晚剩餘房數扣掉當晚被其他暫時保留佔住的房間後的最小值（需在寫入交易中呼叫）"""
+    free = _type_free(conn, room_type, check_in_day, check_out_day)
+    held = holds.held_by_night(conn, room_type, check_in_day, check_out_day, exclude=hold_token)
+    if not held:
+        return free
+    nightly = {row[1]: row[2] - row[3]
+               for row in inventory.nightly(conn, check_in_day, check_out_day, room_type)}
+    return min(nightly.get(night, 0) - held.get(night, 0) for night in range(check_in_day, check_out_day))
+
+# CREATE - 暫時保留房間
+@app.route('/api/holds', methods=['POST'])
+@idempotent
+def create_hold():
+    """結帳前暫時保留房間與日期，回傳 token（建立訂單時帶入 hold_token）"""
+    data = request.get_json(silent=True) or {}
+    
+    for field in ('room_id', 'check_in', 'check_out'):
+        if field not in data:
+            return jsonify({"status": "error", "message": f"缺少必要欄位: {field}"}), 400
+    check_in_day, check_out_day, error = _parse_stay(data)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    ttl = data.get('ttl', HOLD_TTL_SECONDS)
+    if isinstance(ttl, bool) or not isinstance(ttl, int) or not 0 < ttl <= HOLD_MAX_TTL_SECONDS:
+        return jsonify({"status": "error", "message": f"ttl 必須是 1 到 {HOLD_MAX_TTL_SECONDS} 秒"}), 400
+    client = None if is_admin_request() else client_identity()
+    
+    try:
+        payload, status_code = run_write(_create_hold_tx, data['room_id'], check_in_day, check_out_day, ttl, client)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"保留房間失敗: {str(e)}"}), 500
+
+def _create_hold_tx(conn, room_id, check_in_day, check_out_day, ttl, client=None):
+    if client and HOLD_MAX_PER_CLIENT > 0 and holds.active_for_client(conn, client) >= HOLD_MAX_PER_CLIENT:
+        return {"status": "error",
+                "message": f"同時保留的房間已達上限（{HOLD_MAX_PER_CLIENT} 間），請先完成訂單或釋放保留"}, 429
+    room = conn.execute('SELECT id, room_type FROM rooms WHERE id = ? AND available = 1', (room_id,)).fetchone()
+    if room is None:
+        return {"status": "error", "message": "房間不存在或不可預訂"}, 400
+    
+    conflicting = conn.execute('''
+        SELECT COUNT(*) FROM bookings
+        WHERE room_id = ? AND status NOT IN ('cancelled')
+        AND check_in_day < ? AND check_out_day > ?
+    ''', (room_id, check_out_day, check_in_day)).fetchone()[0]
+    if conflicting > 0:
+        return {"status": "error", "message": "該日期區間已被預訂"}, 400
+    if holds.conflicts(conn, room_id, check_in_day, check_out_day) > 0:
+        return {"status": "error", "message": "該日期區間已被其他客人暫時保留"}, 400
+    if (room['room_type'] is not None
+            and _unheld_type_free(conn, room['room_type'], check_in_day, check_out_day) <= 0):
+        return {"status": "error", "message": "該房型在此日期區間已售完"}, 400
+    
+    hold = holds.create(conn, room_id, check_in_day, check_out_day, ttl, client)
+    return {
+        "status": "success",
+        "message": "房間已暫時保留",
+        "data": _hold_data(hold)
+    }, 201
+
+# READ - 查詢保留
+@app.route('/api/holds/<string:token>')
+def get_hold(token):
+    """查詢保留狀態（active / released / expired）"""
+    conn = get_db_connection()
+    row = holds.get(conn, token)
+    conn.close()
+    
+    if row is None:
+        return jsonify({"status": "error", "message": "保留不存在或已過期"}), 404
+    status = 'released' if row['released'] else 'active' if row['expires_at'] > time.time() else 'expired'
+    
+    return jsonify({
+        "status": "success",
+        "data": _hold_data(row, status)
+    })
+
+# DELETE - 釋放保留
+@app.route('/api/holds/<string:token>', methods=['DELETE'])
+def release_hold(token):
+    """客人放棄結帳時提早釋放保留"""
+    try:
+        payload, status_code = run_write(_release_hold_tx, token)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"釋放保留失敗: {str(e)}"}), 500
+
+def _release_hold_tx(conn, token):
+    if not holds.release(conn, token):
+        return {"status": "error", "message": "保留不存在或已釋放"}, 404
+    return {
+        "status": "success",
+        "message": "保留已釋放",
+        "released_token": token
+    }, 200
+
+# ==================== 房型庫存 API ====================
+
+INVENTORY_MAX_NIGHTS = 366
+
+def _type_free(conn, room_type, check_in_day, check_out_day):
+    """住宿期間該房型每晚剩餘房數的最小值（帳列不足時先補上，需在寫入交易中呼叫）"""
+    free = inventory.min_free(conn, room_type, check_in_day, check_out_day)
+    if free is None:
+        inventory.ensure_inventory(conn, check_in_day, check_out_day)
+        free = inventory.min_free(conn, room_type, check_in_day, check_out_day)
+    return 0 if free is None else free
+
+def _ensure_inventory_tx(conn, start_day, end_day):
+    inventory.ensure_inventory(conn, start_day, end_day)
+
+def _parse_stay(data):
+    """解析 check_in / check_out，回傳 (check_in_day, check_out_day, 錯誤訊息)"""
+    try:
+        check_in_day = dates.parse_day(data['check_in'])
+        check_out_day = dates.parse_day(data['check_out'])
+    except ValueError:
+        return None, None, "日期格式錯誤，請使用 YYYY-MM-DD"
+    if check_out_day <= check_in_day:
+        return None, None, "退房日期必須晚於入住日期"
+    return check_in_day, check_out_day, None
+
+# READ - 各房型每晚剩餘房數
+@app.route('/api/inventory')
+def get_inventory():
+    """各房型每晚的可售 / 已售 / 剩餘房數（?check_in=&check_out=&room_type=）"""
+    today = dates.today_day()
+    check_in_day, check_out_day, error = _parse_stay({
+        'check_in': request.args.get('check_in', dates.format_day(today)),
+        'check_out': request.args.get('check_out', dates.format_day(today + 14))
+    })
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    if check_out_day - check_in_day > INVENTORY_MAX_NIGHTS:
+        return jsonify({"status": "error", "message": f"查詢區間最多 {INVENTORY_MAX_NIGHTS} 晚"}), 400
+    room_type = request.args.get('room_type')
+    
+    conn = get_db_connection()
+    if not inventory.is_complete(conn, check_in_day, check_out_day):
         conn.close()
+        run_write(_ensure_inventory_tx, check_in_day, check_out_day)
+        # 剛補上的帳列可能還不在讀取複本中
+        conn = current_shard().pool.acquire()
+    rows = inventory.nightly(conn, check_in_day, check_out_day, room_type)
+    conn.close()
+    
+    by_type = {}
+    for row in rows:
+        free = max(row['available'] - row['sold'], 0)
+        entry = by_type.setdefault(row['room_type'], {"room_type": row['room_type'], "min_free": free, "nights": []})
+        entry['min_free'] = min(entry['min_free'], free)
+        entry['nights'].append({
+            "date": dates.format_day(row['night']),
+            "available": row['available'],
+            "sold": row['sold'],
+            "free": free
+        })
+    
+    return jsonify({
+        "status": "success",
+        "check_in": dates.format_day(check_in_day),
+        "check_out": dates.format_day(check_out_day),
+        "data": list(by_type.values())
+    })
+
+# CREATE - 依房型訂房（入住時才分配房間）
+@app.route('/api/type-bookings', methods=['POST'])
+@idempotent
+def create_type_booking():
+    """依房型訂房，房間於入住時分配"""
+    data = request.get_json()
+    
+    required_fields = ['room_type', 'guest_name', 'guest_email', 'check_in', 'check_out']
+    for field in required_fields:
+        if field not in data:
+            return jsonify({"status": "error", "message": f"缺少必要欄位: {field}"}), 400
+    
+    check_in_day, check_out_day, error = _parse_stay(data)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    
+    try:
+        payload, status_code = run_write(_create_type_booking_tx, data, check_in_day, check_out_day)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"創建訂單失敗: {str(e)}"}), 500
+
+def _create_type_booking_tx(conn, data, check_in_day, check_out_day):
+    # 以該房型可預訂房間中最低的住宿總價計價
+    rooms = conn.execute('''
+        SELECT id, price, room_type FROM rooms WHERE room_type = ? AND available = 1
+    ''', (data['room_type'],)).fetchall()
+    if not rooms:
+        return {"status": "error", "message": "房型不存在或不可預訂"}, 400
+    total_price = min(rates.stay_totals(conn, rooms, check_in_day, check_out_day).values())
+    
+    # 庫存檢查與新增在同一個寫入交易內（暫時保留中的房間不可售）
+    if _unheld_type_free(conn, data['room_type'], check_in_day, check_out_day) <= 0:
+        return {"status": "error", "message": "該房型在此日期區間已售完"}, 400
+    
+    nights = check_out_day - check_in_day
+    cursor = conn.execute('''
+        INSERT INTO type_bookings (room_type, guest_name, guest_email, guest_phone,
+                                   check_in, check_out, check_in_day, check_out_day,
+                                   nights, guests, total_price, special_requests)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        data['room_type'],
+        data['guest_name'],
+        data['guest_email'],
+        data.get('guest_phone', ''),
+        data['check_in'],
+        data['check_out'],
+        check_in_day,
+        check_out_day,
+        nights,
+        data.get('guests', 1),
+        total_price,
+        data.get('special_requests', '')
+    ))
+    
+    new_booking = conn.execute('SELECT * FROM type_bookings WHERE id = ?', (cursor.lastrowid,)).fetchone()
+    
+    return {
+        "status": "success",
+        "message": "訂單創建成功",
+        "data": dates.without_day_columns(new_booking)
+    }, 201
+
+# READ - 取得單一房型訂單
+@app.route('/api/type-bookings/<int:type_booking_id>')
+def get_type_booking(type_booking_id):
+    """取得房型訂單"""
+    conn = get_db_connection()
+    booking = conn.execute('SELECT * FROM type_bookings WHERE id = ?', (type_booking_id,)).fetchone()
+    conn.close()
+    
+    if booking is None:
         return jsonify({"status": "error", "message": "訂單不存在"}), 404
     
+    return jsonify({
+        "status": "success",
+        "data": dates.without_day_columns(booking)
+    })
+
+# ASSIGN - 入住時分配房間
+@app.route('/api/type-bookings/<int:type_booking_id>/assign', methods=['POST'])
+@admin_required
+@idempotent
+def assign_type_booking(type_booking_id):
+    """入住時分配房間並辦理入住（可指定 room_id，否則挑選最便宜的空房）(需管理員權限)"""
+    data = request.get_json(silent=True) or {}
+    
     try:
-        # 軟刪除：將狀態改為 cancelled
-        conn.execute('''
-            UPDATE bookings 
-            SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP 
-            WHERE id = ?
-        ''', (booking_id,))
+        payload, status_code = run_write(_assign_type_booking_tx, type_booking_id, data.get('room_id'))
+        return jsonify(payload), status_code
         
-        conn.commit()
-        conn.close()
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"分配房間失敗: {str(e)}"}), 500
+
+def _assign_type_booking_tx(conn, type_booking_id, room_id):
+    type_booking = conn.execute('SELECT * FROM type_bookings WHERE id = ?', (type_booking_id,)).fetchone()
+    if type_booking is None:
+        return {"status": "error", "message": "訂單不存在"}, 404
+    if type_booking['status'] != 'confirmed':
+        return {"status": "error", "message": f"訂單狀態為 {type_booking['status']}，無法分配房間"}, 400
+    
+    # 同房型、可預訂、且住宿期間沒有其他訂單與暫時保留的房間
+    query = '''
+        SELECT r.id FROM rooms r
+        WHERE r.room_type = ? AND r.available = 1
+        AND NOT EXISTS (
+            SELECT 1 FROM bookings b
+            WHERE b.room_id = r.id AND b.status NOT IN ('cancelled')
+            AND b.check_in_day < ? AND b.check_out_day > ?
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM room_holds h
+            WHERE h.room_id = r.id AND h.released = 0 AND h.expires_at > ?
+            AND h.check_in_day < ? AND h.check_out_day > ?
+        )
+    '''
+    params = [type_booking['room_type'], type_booking['check_out_day'], type_booking['check_in_day'],
+              time.time(), type_booking['check_out_day'], type_booking['check_in_day']]
+    if room_id is not None:
+        query += ' AND r.id = ?'
+        params.append(room_id)
+    room = conn.execute(query + ' ORDER BY r.price, r.id LIMIT 1', params).fetchone()
+    if room is None:
+        return {"status": "error", "message": "沒有可分配的房間"}, 409
+    
+    # 先釋放房型保留再建立實體房訂單，庫存帳的已售數不變
+    conn.execute('''
+        UPDATE type_bookings SET status = 'assigned', updated_at = CURRENT_TIMESTAMP WHERE id = ?
+    ''', (type_booking_id,))
+    cursor = conn.execute('''
+        INSERT INTO bookings (room_id, guest_name, guest_email, guest_phone,
+                             check_in, check_out, check_in_day, check_out_day,
+                             nights, guests, total_price, status, special_requests)
+        SELECT ?, guest_name, guest_email, guest_phone,
+               check_in, check_out, check_in_day, check_out_day,
+               nights, guests, total_price, 'checked_in', special_requests
+        FROM type_bookings WHERE id = ?
+    ''', (room['id'], type_booking_id))
+    booking_id = cursor.lastrowid
+    conn.execute('UPDATE type_bookings SET booking_id = ? WHERE id = ?', (booking_id, type_booking_id))
+    
+    booking = conn.execute('''
+        SELECT b.*, r.name as room_name, r.price as room_price
+        FROM bookings b
+        JOIN rooms r ON b.room_id = r.id
+        WHERE b.id = ?
+    ''', (booking_id,)).fetchone()
+    
+    return {
+        "status": "success",
+        "message": "房間分配成功，已辦理入住",
+        "type_booking_id": type_booking_id,
+        "data": dates.without_day_columns(booking)
+    }, 200
+
+# DELETE - 取消房型訂單
+@app.route('/api/type-bookings/<int:type_booking_id>', methods=['DELETE'])
+@admin_required
+@idempotent
+def cancel_type_booking(type_booking_id):
+    """取消房型訂單 (需管理員權限)"""
+    try:
+        payload, status_code = run_write(_cancel_type_booking_tx, type_booking_id)
+        return jsonify(payload), status_code
         
-        return jsonify({
-            "status": "success",
-            "message": "訂單已取消",
-            "cancelled_booking_id": booking_id
-        })
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"刪除失敗: {str(e)}"}), 500
+
+def _cancel_type_booking_tx(conn, type_booking_id):
+    type_booking = conn.execute('SELECT status FROM type_bookings WHERE id = ?', (type_booking_id,)).fetchone()
+    if type_booking is None:
+        return {"status": "error", "message": "訂單不存在"}, 404
+    if type_booking['status'] != 'confirmed':
+        return {"status": "error", "message": f"訂單狀態為 {type_booking['status']}，無法取消"}, 400
+    
+    conn.execute('''
+        UPDATE type_bookings SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP WHERE id = ?
+    ''', (type_booking_id,))
+    
+    return {
+        "status": "success",
+        "message": "訂單已取消",
+        "cancelled_type_booking_id": type_booking_id
+    }, 200
+
+# ==================== 房價規則 API ====================
+
+RATE_RULE_COLUMNS = ', '.join(rates.RULE_COLUMNS[1:])
+
+def _load_rate_rule(conn, rule_id):
+    row = conn.execute('SELECT * FROM rate_rules WHERE id = ?', (rule_id,)).fetchone()
+    return None if row is None else dict(row)
+
+# READ - 取得所有房價規則
+@app.route('/api/rates/rules')
+def get_rate_rules():
+    """取得所有房價規則（依套用順序）"""
+    conn = get_db_connection()
+    rules = conn.execute('SELECT * FROM rate_rules ORDER BY priority, id').fetchall()
+    conn.close()
+    
+    return jsonify({
+        "status": "success",
+        "count": len(rules),
+        "data": [dict(rule) for rule in rules]
+    })
+
+# CREATE - 新增房價規則
+@app.route('/api/rates/rules', methods=['POST'])
+@admin_required
+@idempotent
+def create_rate_rule():
+    """新增房價規則，並重新編譯受影響的房間與日期 (需管理員權限)"""
+    try:
+        values = rates.rule_values(request.get_json() or {})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    try:
+        payload, status_code = run_write(_create_rate_rule_tx, values)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"新增失敗: {str(e)}"}), 500
+
+def _create_rate_rule_tx(conn, values):
+    cursor = conn.execute(f'''
+        INSERT INTO rate_rules ({RATE_RULE_COLUMNS})
+        VALUES ({', '.join('?' * len(rates.RULE_COLUMNS[1:]))})
+    ''', [values[column] for column in rates.RULE_COLUMNS[1:]])
+    rule = _load_rate_rule(conn, cursor.lastrowid)
+    rates.recompile_rule(conn, rule)
+    
+    return {
+        "status": "success",
+        "message": "房價規則新增成功",
+        "data": rule
+    }, 201
+
+# UPDATE - 更新房價規則
+@app.route('/api/rates/rules/<int:rule_id>', methods=['PUT'])
+@admin_required
+@idempotent
+def update_rate_rule(rule_id):
+    """以新內容取代房價規則，並重新編譯新舊規則涵蓋的範圍 (需管理員權限)"""
+    try:
+        values = rates.rule_values(request.get_json() or {})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    try:
+        payload, status_code = run_write(_update_rate_rule_tx, rule_id, values)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"更新失敗: {str(e)}"}), 500
+
+def _update_rate_rule_tx(conn, rule_id, values):
+    old_rule = _load_rate_rule(conn, rule_id)
+    if old_rule is None:
+        return {"status": "error", "message": "房價規則不存在"}, 404
+    
+    assignments = ', '.join(f'{column} = ?' for column in rates.RULE_COLUMNS[1:])
+    conn.execute(f'''
+        UPDATE rate_rules SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+    ''', [values[column] for column in rates.RULE_COLUMNS[1:]] + [rule_id])
+    rule = _load_rate_rule(conn, rule_id)
+    rates.recompile_rule(conn, old_rule)
+    rates.recompile_rule(conn, rule)
+    
+    return {
+        "status": "success",
+        "message": "房價規則更新成功",
+        "data": rule
+    }, 200
+
+# DELETE - 刪除房價規則
+@app.route('/api/rates/rules/<int:rule_id>', methods=['DELETE'])
+@admin_required
+@idempotent
+def delete_rate_rule(rule_id):
+    """刪除房價規則，並重新編譯受影響的房間與日期 (需管理員權限)"""
+    try:
+        payload, status_code = run_write(_delete_rate_rule_tx, rule_id)
+        return jsonify(payload), status_code
         
     except Exception as e:
-        conn.close()
         return jsonify({"status": "error", "message": f"刪除失敗: {str(e)}"}), 500
 
+def _delete_rate_rule_tx(conn, rule_id):
+    rule = _load_rate_rule(conn, rule_id)
+    if rule is None:
+        return {"status": "error", "message": "房價規則不存在"}, 404
+    
+    conn.execute('DELETE FROM rate_rules WHERE id = ?', (rule_id,))
+    rates.recompile_rule(conn, rule)
+    
+    return {
+        "status": "success",
+        "message": "房價規則刪除成功",
+        "deleted_rule_id": rule_id
+    }, 200
+
+# READ - 房價日曆
+@app.route('/api/rooms/<int:room_id>/calendar')
+def get_room_calendar(room_id):
+    """房間每晚房價與該區間住宿總價（?check_in=&check_out=，預設今天起 30 晚）"""
+    today = dates.today_day()
+    check_in_day, check_out_day, error = _parse_stay({
+        'check_in': request.args.get('check_in', dates.format_day(today)),
+        'check_out': request.args.get('check_out', dates.format_day(today + 30))
+    })
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    if check_out_day - check_in_day > INVENTORY_MAX_NIGHTS:
+        return jsonify({"status": "error", "message": f"查詢區間最多 {INVENTORY_MAX_NIGHTS} 晚"}), 400
+    
+    conn = get_db_connection()
+    room = conn.execute('SELECT id, price, room_type FROM rooms WHERE id = ?', (room_id,)).fetchone()
+    if room is None:
+        conn.close()
+        return jsonify({"status": "error", "message": "房間不存在"}), 404
+    
+    nightly = rates.calendar(conn, room, check_in_day, check_out_day)
+    total_price = rates.stay_total(conn, room, check_in_day, check_out_day)
+    conn.close()
+    
+    return jsonify({
+        "status": "success",
+        "room_id": room_id,
+        "base_price": room['price'],
+        "check_in": dates.format_day(check_in_day),
+        "check_out": dates.format_day(check_out_day),
+        "nights": [{"date": dates.format_day(night), "rate": rate} for night, rate in nightly],
+        "total_price": total_price
+    })
+
+# ==================== 批次報價 API ====================
+
+QUOTE_MAX_STAYS = 100
+QUOTE_MAX_CELLS = 20000
+
+@app.route('/api/quotes', methods=['POST'])
+def batch_quotes():
+    """多間房 × 多段住宿的可訂狀態與總價
+
+    {"room_ids": [1, 2], "stays": [{"check_in": "2027-01-01", "check_out": "2027-01-03"}, ...], "guests": 2}
+    room_ids 省略時報價所有房間（可用 room_type 篩選）。
+    """
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        stays = quotes.parse_stays(data.get('stays'), INVENTORY_MAX_NIGHTS)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if len(stays) > QUOTE_MAX_STAYS:
+        return jsonify({"status": "error", "message": f"一次最多 {QUOTE_MAX_STAYS} 段住宿"}), 400
+    
+    room_ids = data.get('room_ids')
+    if room_ids is not None:
+        if not isinstance(room_ids, list) or not all(isinstance(room_id, int) for room_id in room_ids):
+            return jsonify({"status": "error", "message": "room_ids 必須是整數陣列"}), 400
+        room_ids = list(dict.fromkeys(room_ids))
+        if len(room_ids) > BATCH_MAX_IDS:
+            return jsonify({"status": "error", "message": f"一次最多 {BATCH_MAX_IDS} 間房"}), 400
+    guests = data.get('guests', 1)
+    if not isinstance(guests, int) or guests < 1:
+        return jsonify({"status": "error", "message": "guests 必須是正整數"}), 400
+    
+    conn = get_db_connection()
+    columns = 'id, name, price, room_type, capacity, available'
+    if room_ids is None:
+        query = f'SELECT {columns} FROM rooms'
+        params = []
+        if data.get('room_type'):
+            query += ' WHERE room_type = ?'
+            params.append(data['room_type'])
+        rooms = conn.execute(query + ' ORDER BY id', params).fetchall()
+    else:
+        found = fetch_by_ids(conn, f'SELECT {columns} FROM rooms WHERE id IN ({{placeholders}})', room_ids)
+        rooms = [found[room_id] for room_id in room_ids if room_id in found]
+    
+    if len(rooms) * len(stays) > QUOTE_MAX_CELLS:
+        conn.close()
+        return jsonify({"status": "error", "message": f"一次最多 {QUOTE_MAX_CELLS} 格報價"}), 400
+    
+    # 暫時保留以記憶體中的保留表判斷（帶入自己的 hold_token 時不算佔用）
+    book = current_shard().holds
+    book.sync(conn)
+    held = book.intervals([room['id'] for room in rooms], min(day for day, _ in stays),
+                          max(day for _, day in stays), exclude=data.get('hold_token'))
+    matrix = quotes.quote_matrix(conn, rooms, stays, held=held) if rooms else {}
+    # 房型訂單保留的房數：房型售完時該房型的房間也不可訂
+    type_free = inventory.min_free_by_stay(conn, {room['room_type'] for room in rooms}, stays)
+    conn.close()
+    
+    room_data = []
+    for room in rooms:
+        fits = room['capacity'] >= guests
+        cells = []
+        for (check_in_day, check_out_day), (available, total_price) in zip(stays, matrix[room['id']]):
+            if type_free.get((room['room_type'], check_in_day, check_out_day), 1) <= 0:
+                available = False
+            cells.append({"available": available and fits, "total_price": total_price})
+        room_data.append({
+            "room_id": room['id'],
+            "room_name": room['name'],
+            "room_type": room['room_type'],
+            "quotes": cells
+        })
+    
+    response = {
+        "status": "success",
+        "stays": [{
+            "check_in": dates.format_day(check_in_day),
+            "check_out": dates.format_day(check_out_day),
+            "nights": check_out_day - check_in_day
+        } for check_in_day, check_out_day in stays],
+        "count": len(room_data),
+        "data": room_data
+    }
+    if room_ids is not None:
+        response['missing'] = [room_id for room_id in room_ids if room_id not in matrix]
+    return jsonify(response)
+
+# ==================== 替代日期建議 ====================
+
+SUGGEST_SEARCH_DAYS = 30
+SUGGEST_LIMIT = 3
+SUGGEST_MAX_ROOMS = 20
+
+def suggest_alternatives(conn, room_id, check_in_day, check_out_day, guests=1, hold_token=None):
+    """原房間與同房型相近房間在原日期前後 SUGGEST_SEARCH_DAYS 天內、晚數相同的最近空檔
+
+    回傳 (原日期是否可訂, 建議)，房間不存在時回傳 (False, None)。
+    相關訂單與保留一次查出，每間房只在依入住日排序的區間上找一次空檔，
+    不必對每個候選日期重複查詢重疊的訂單。
+    """
+    room = conn.execute('SELECT id, name, price, room_type, capacity, available FROM rooms WHERE id = ?',
+                        (room_id,)).fetchone()
+    if room is None:
+        return False, None
+    nights = check_out_day - check_in_day
+    start_day = max(check_in_day - SUGGEST_SEARCH_DAYS, dates.today_day())
+    end_day = check_out_day + SUGGEST_SEARCH_DAYS
+    
+    similar = conn.execute('''
+        SELECT id, name, price, room_type, capacity FROM rooms
+        WHERE room_type = ? AND capacity >= ? AND available = 1 AND id != ?
+        ORDER BY ABS(price - ?), id LIMIT ?
+    ''', (room['room_type'], guests, room['id'], room['price'], SUGGEST_MAX_ROOMS)).fetchall()
+    rooms = [room] + similar
+    room_ids = [r['id'] for r in rooms]
+    
+    book = current_shard().holds
+    book.sync(conn)
+    held = book.intervals(room_ids, start_day, end_day, exclude=hold_token)
+    occupancy = quotes.Occupancy(conn, room_ids, start_day, end_day, extra=held)
+    candidates = {r['id']: occupancy.nearest_free(r['id'], check_in_day, nights, start_day, end_day)
+                  for r in rooms}
+    if not room['available'] or room['capacity'] < guests:
+        candidates[room['id']] = []
+    
+    # 房型已售完（房型訂單保留了剩下的房間）的日期不建議
+    stays = [stay for windows in candidates.values() for stay in windows]
+    type_free = inventory.min_free_by_stay(conn, {room['room_type']}, stays)
+    prices = rates.PriceTable(conn, rooms, stays) if stays else None
+    
+    def bookable(stay):
+        return type_free.get((room['room_type'],) + stay, 1) > 0
+    
+    def entries(r, limit):
+        result = []
+        for stay in candidates[r['id']]:
+            if not bookable(stay) or (r['id'] == room['id'] and stay == (check_in_day, check_out_day)):
+                continue
+            result.append({
+                "room_id": r['id'],
+                "room_name": r['name'],
+                "check_in": dates.format_day(stay[0]),
+                "check_out": dates.format_day(stay[1]),
+                "offset_days": stay[0] - check_in_day,
+                "total_price": prices.total(r, stay[0], stay[1])
+            })
+            if len(result) == limit:
+                break
+        return result
+    
+    similar_rooms = [entry for r in similar for entry in entries(r, 1)]
+    similar_rooms.sort(key=lambda entry: abs(entry['offset_days']))
+    available = (check_in_day, check_out_day) in candidates[room['id']] and bookable((check_in_day, check_out_day))
+    return available, {
+        "same_room": entries(room, SUGGEST_LIMIT),
+        "similar_rooms": similar_rooms[:SUGGEST_LIMIT]
+    }
+
+@app.route('/api/rooms/<int:room_id>/suggestions')
+def get_room_suggestions(room_id):
+    """指定日期是否可訂，以及該房間與相近房間晚數相同的最近空檔（?check_in=&check_out=&guests=&hold_token=）"""
+    check_in_day, check_out_day, error = _parse_stay({
+        'check_in': request.args.get('check_in', ''),
+        'check_out': request.args.get('check_out', '')
+    })
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    if check_out_day - check_in_day > INVENTORY_MAX_NIGHTS:
+        return jsonify({"status": "error", "message": f"住宿最多 {INVENTORY_MAX_NIGHTS} 晚"}), 400
+    guests = request.args.get('guests', 1, type=int)
+    
+    conn = get_db_connection()
+    available, suggestions = suggest_alternatives(conn, room_id, check_in_day, check_out_day, guests,
+                                                  request.args.get('hold_token'))
+    conn.close()
+    if suggestions is None:
+        return jsonify({"status": "error", "message": "房間不存在"}), 404
+    
+    return jsonify({
+        "status": "success",
+        "room_id": room_id,
+        "check_in": dates.format_day(check_in_day),
+        "check_out": dates.format_day(check_out_day),
+        "available": available,
+        "suggestions": suggestions
+    })
+
 # ==================== 其他功能 API ====================
 
 @app.route('/api/rooms/<int:room_id>/bookings')
 def get_room_bookings(room_id):
-    """取得特定房間的所有訂單"""
-    conn = get_db_connection()
+    """取得特定房間的所有訂單（?fields= 指定訂單的回傳欄位，預設只有訂單本身的欄位）"""
+    try:
+        shape = parse_fields(BOOKING_FIELDS, 'plain')
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    store = current_store()
     
     # 檢查房間是否存在
-    room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
+    room = store.get_room(room_id)
     if room is None:
-        conn.close()
         return jsonify({"status": "error", "message": "房間不存在"}), 404
     
-    bookings = conn.execute('''
-        SELECT * FROM bookings 
-        WHERE room_id = ? 
-        ORDER BY check_in DESC
-    ''', (room_id,)).fetchall()
+    bookings = store.list_bookings({'room_id': room_id}, shape, sort_by='check_in')
     
-    conn.close()
-    
-    bookings_list = [dict(booking) for booking in bookings]
+    bookings_list = [BOOKING_FIELDS.serialize(booking, shape) for booking in bookings]
     
     return jsonify({
         "status": "success",
-        "room": dict(room),
+        "room": room,
         "bookings": bookings_list,
         "count": len(bookings_list)
     })
 
 @app.route('/api/bookings/guest/<string:email>')
 def get_guest_bookings(email):
-    """取得特定客人的所有訂單"""
-    conn = get_db_connection()
-    
-    bookings = conn.execute('''
-        SELECT b.*, r.name as room_name, r.price as room_price 
-        FROM bookings b
-        JOIN rooms r ON b.room_id = r.id
-        WHERE b.guest_email = ?
-        ORDER BY b.created_at DESC
-    ''', (email,)).fetchall()
+    """取得特定客人的所有訂單（?fields= 指定回傳欄位）"""
+    try:
+        shape = parse_fields(BOOKING_FIELDS, 'list')
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     
-    conn.close()
+    bookings = current_store().list_bookings({'guest_email': email}, shape)
     
-    bookings_list = [dict(booking) for booking in bookings]
+    bookings_list = [BOOKING_FIELDS.serialize(booking, shape) for booking in bookings]
     
     return jsonify({
         "status": "success",
@@ -722,6 +2100,8 @@ def get_guest_bookings(email):
     })
 
 @app.route('/api/rooms/types')
+@cached(ttl=30, stale=300)
+@coalesced
 def get_room_types():
     """取得所有房間類型"""
     conn = get_db_connection()
@@ -753,6 +2133,7 @@ def home():
             "GET /api/rooms": "取得所有房型",
             "POST /api/rooms": "新增房型 (需密碼)",
             "GET /api/rooms/<id>": "取得特定房型",
+            "GET /api/rooms/batch?ids=1,2": "批次取得多個房型",
             "PUT /api/rooms/<id>": "更新房型 (需密碼)",
             "PATCH /api/rooms/<id>": "部分更新房型 (需密碼)",
             "DELETE /api/rooms/<id>": "刪除房型 (需密碼)",
@@ -761,38 +2142,120 @@ def home():
             "GET /api/bookings": "取得所有訂單",
             "POST /api/bookings": "創建新訂單",
             "GET /api/bookings/<id>": "取得特定訂單",
+            "GET /api/bookings/batch?ids=1,2": "批次取得多筆訂單",
             "PUT /api/bookings/<id>": "更新訂單",
             "DELETE /api/bookings/<id>": "取消訂單 (需密碼)",
+            "POST /api/bookings/status": "批次變更訂單狀態 (需密碼)",
+            
+            # 暫時保留
+            "POST /api/holds": "結帳前暫時保留房間（建立訂單時帶入 hold_token）",
+            "GET /api/holds/<token>": "查詢保留狀態",
+            "DELETE /api/holds/<token>": "釋放保留",
+            
+            # 房型庫存
+            "GET /api/inventory?check_in=&check_out=": "各房型每晚剩餘房數",
+            "POST /api/type-bookings": "依房型訂房（入住時分配房間）",
+            "GET /api/type-bookings/<id>": "取得房型訂單",
+            "POST /api/type-bookings/<id>/assign": "分配房間並辦理入住 (需密碼)",
+            "DELETE /api/type-bookings/<id>": "取消房型訂單 (需密碼)",
+            
+            # 房價
+            "GET /api/rates/rules": "取得房價規則",
+            "POST /api/rates/rules": "新增房價規則 (需密碼)",
+            "PUT /api/rates/rules/<id>": "更新房價規則 (需密碼)",
+            "DELETE /api/rates/rules/<id>": "刪除房價規則 (需密碼)",
+            "GET /api/rooms/<id>/calendar?check_in=&check_out=": "房間每晚房價與住宿總價",
+            "GET /api/rooms/<id>/suggestions?check_in=&check_out=": "是否可訂與最近的替代日期 / 相近房間",
+            "POST /api/quotes": "批次報價（多間房 × 多段住宿）",
             
             # 其他功能
             "GET /api/rooms/<id>/bookings": "取得房間的所有訂單",
             "GET /api/bookings/guest/<email>": "取得客人的所有訂單",
             "GET /api/rooms/types": "取得房間類型統計",
             "GET /api/health": "系統健康檢查",
-            "GET /api/stats": "取得統計資料"
+            "GET /livez": "存活探針",
+            "GET /readyz": "就緒探針",
+            "GET /api/stats": "取得統計資料",
+            "GET /api/analytics/occupancy?start=&end=&group_by=": "入住率、ADR、RevPAR（依住宿日期）",
+            
+            # 變更紀錄
+            "GET /api/changes?since=0": "增量同步：取得序號大於 since 的變更",
+            "GET /api/changes/stream": "以 Server-Sent Events 推送變更",
+            
+            # 多館別（其他端點加上 ?property_id= 指定館別）
+            "GET /api/properties": "取得所有館別",
+            "POST /api/properties": "新增館別 (需密碼)",
+            "GET /api/properties/stats": "跨館別統計 (需密碼)",
+            "GET /api/properties/bookings?guest_email=": "跨館別搜尋訂單 (需密碼)",
+            
+            # 備份（還原請用 flask restore）
+            "GET /api/backups": "列出備份快照 (需密碼)",
+            "POST /api/backups": "在背景執行線上備份 (需密碼)"
         }
     })
 
+# 探針專用連線池：就緒檢查重複使用已開啟的連線
+probe_pool = ConnectionPool(DATABASE, size=2, timeout=1)
+
+@app.route('/livez')
+def livez():
+    """存活探針：不碰資料庫，只要行程能回應就算存活"""
+    return jsonify({"status": "alive"})
+
+@app.route('/readyz')
+def readyz():
+    """就緒探針：檢查連線池連線、磁碟空間與 WAL 大小（皆為常數時間）"""
+    checks = {}
+    
+    try:
+        with probe_pool.connection() as conn:
+            conn.execute('SELECT 1').fetchone()
+        checks['database'] = 'ok'
+    except Exception as e:
+        checks['database'] = f'error: {e}'
+    
+    free_mb = shutil.disk_usage(os.path.dirname(os.path.abspath(DATABASE))).free // (1024 * 1024)
+    checks['disk_free_mb'] = free_mb
+    
+    wal_path = DATABASE + '-wal'
+    wal_mb = os.path.getsize(wal_path) / (1024 * 1024) if os.path.exists(wal_path) else 0
+    checks['wal_mb'] = round(wal_mb, 2)
+    
+    ready = (checks['database'] == 'ok'
+             and free_mb >= READY_MIN_FREE_MB
+             and wal_mb <= READY_MAX_WAL_MB)
+    
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        # 計數只回傳 /api/health 快取中的值，不在探針中查詢
+        "counts": result_cache.peek(('health_counts', current_shard().property_id))
+    }), 200 if ready else 503
+
 @app.route('/api/health')
 def health():
-    conn = get_db_connection()
-    
     try:
-        room_count = conn.execute('SELECT COUNT(*) FROM rooms').fetchone()[0]
-        booking_count = conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0]
-        available_rooms = conn.execute('SELECT COUNT(*) FROM rooms WHERE available = 1').fetchone()[0]
+        conn = get_db_connection()
         
         # 檢查資料庫連接
         conn.execute('SELECT 1')
         
         conn.close()
         
+        # 計數不需即時，使用快取值
+        force = request.args.get('fresh') == '1' and is_admin_request()
+        shard = current_shard()
+        counts, _ = result_cache.get_or_compute(('health_counts', shard.property_id),
+                                                lambda: _health_counts(shard), ttl=10, stale=60, force=force)
+        
         return jsonify({
             "status": "healthy",
             "database": "connected",
-            "room_count": room_count,
-            "available_rooms": available_rooms,
-            "booking_count": booking_count,
+            "room_count": counts['room_count'],
+            "available_rooms": counts['available_rooms'],
+            "booking_count": counts['booking_count'],
+            "coalescing": single_flight.stats(),
+            "cache": result_cache.stats(),
             "timestamp": datetime.now().isoformat()
         })
         
@@ -803,59 +2266,537 @@ def health():
             "error": str(e)
         }), 500
 
+def _health_counts(shard):
+    """館別的房間與訂單計數（背景更新時沒有請求上下文，所以直接指定分片）"""
+    conn = shard.read_pool.acquire() if READ_ONLY_ROUTING else shard.pool.acquire()
+    try:
+        return {
+            "room_count": conn.execute('SELECT COUNT(*) FROM rooms').fetchone()[0],
+            "booking_count": conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0],
+            "available_rooms": conn.execute('SELECT COUNT(*) FROM rooms WHERE available = 1').fetchone()[0]
+        }
+    finally:
+        conn.close()
+
 @app.route('/api/stats')
+@cached(ttl=10, stale=60)
+@coalesced
 def get_stats():
-    conn = get_db_connection()
+    room_stats, booking_stats, monthly_stats = current_store().stats()
     
-    # 房間統計
-    room_stats = conn.execute('''
-        SELECT 
-            COUNT(*) as total_rooms,
-            SUM(CASE WHEN available = 1 THEN 1 ELSE 0 END) as available_rooms,
-            AVG(price) as avg_price,
-            MAX(price) as max_price,
-            MIN(price) as min_price,
-            SUM(price * capacity) as total_capacity_value
-        FROM rooms
-    ''').fetchone()
-    
-    # 訂單統計
-    booking_stats = conn.execute('''
-        SELECT 
-            COUNT(*) as total_bookings,
-            SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) as confirmed_bookings,
-            SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) as cancelled_bookings,
-            SUM(CASE WHEN status IN ('confirmed', 'checked_in', 'checked_out') THEN total_price ELSE 0 END) as total_revenue,
-            AVG(total_price) as avg_booking_price,
-            SUM(CASE WHEN status IN ('confirmed', 'checked_in', 'checked_out') THEN nights ELSE 0 END) as total_nights
-        FROM bookings
-    ''').fetchone()
-    
-    # 每月收入統計
-    monthly_stats = conn.execute('''
-        SELECT 
-            strftime('%Y-%m', created_at) as month,
-            COUNT(*) as booking_count,
-            SUM(total_price) as monthly_revenue
-        FROM bookings
-        WHERE status IN ('confirmed', 'checked_in', 'checked_out')
-        GROUP BY strftime('%Y-%m', created_at)
-        ORDER BY month DESC
-        LIMIT 6
-    ''').fetchall()
+    return jsonify({
+        "status": "success",
+        "rooms": room_stats,
+        "bookings": booking_stats,
+        "monthly_stats": monthly_stats
+    })
+
+ANALYTICS_MAX_DAYS = 3 * 366
+
+@app.route('/api/analytics/occupancy')
+@cached(ttl=60, stale=300)
+@coalesced
+def get_occupancy_analytics():
+    """依住宿日期計算各房型的入住率、ADR、RevPAR
+
+    ?start=2027-01-01&end=2028-01-01&group_by=day|week|month&room_type=deluxe（end 不含）
+    """
+    today = dates.today_day()
+    try:
+        start_day = dates.parse_day(request.args.get('start', dates.format_day(today - 30)))
+        end_day = dates.parse_day(request.args.get('end', dates.format_day(today)))
+    except ValueError:
+        return jsonify({"status": "error", "message": "日期格式錯誤，請使用 YYYY-MM-DD"}), 400
+    if end_day <= start_day:
+        return jsonify({"status": "error", "message": "end 必須晚於 start"}), 400
+    if end_day - start_day > ANALYTICS_MAX_DAYS:
+        return jsonify({"status": "error", "message": f"查詢區間最多 {ANALYTICS_MAX_DAYS} 天"}), 400
+    group_by = request.args.get('group_by', 'day')
+    if group_by not in analytics.GROUP_BY:
+        return jsonify({"status": "error", "message": f"group_by 必須是 {', '.join(analytics.GROUP_BY)} 之一"}), 400
     
+    conn = get_db_connection()
+    if archive.covers(conn, start_day):
+        with archive.attached(conn, current_shard().database):
+            by_type, totals = analytics.occupancy_report(conn, start_day, end_day, group_by,
+                                                         request.args.get('room_type'), include_archive=True)
+    else:
+        by_type, totals = analytics.occupancy_report(conn, start_day, end_day, group_by,
+                                                     request.args.get('room_type'))
     conn.close()
     
+    for row in by_type + totals:
+        row['period_start'] = dates.format_day(row['period_start'])
+    
+    return jsonify({
+        "status": "success",
+        "start": dates.format_day(start_day),
+        "end": dates.format_day(end_day),
+        "group_by": group_by,
+        "data": by_type,
+        "totals": totals
+    })
+
+# ==================== 變更紀錄 API ====================
+
+CHANGES_PAGE_MAX = 1000
+
+# 每個 worker 同時開啟的 SSE 串流數（串流不計入 MAX_INFLIGHT）
+_stream_slots = threading.BoundedSemaphore(CHANGES_MAX_STREAMS)
+_change_watchers = {}
+_change_watchers_lock = threading.Lock()
+
+def _change_watcher(shard):
+    """館別的變更等待器（同一個 worker 的串流共用）"""
+    watcher = _change_watchers.get(shard.property_id)
+    if watcher is None:
+        with _change_watchers_lock:
+            watcher = _change_watchers.get(shard.property_id)
+            if watcher is None:
+                pool = shard.read_pool if READ_ONLY_ROUTING else shard.pool
+                watcher = _change_watchers[shard.property_id] = changes.ChangeWatcher(
+                    pool.acquire, interval=CHANGES_POLL_INTERVAL)
+    return watcher
+
+def _cursor_error(conn, since):
+    """since 無法接續時的錯誤訊息（回 410，消費端必須重新同步全部資料），可以接續時回傳 None"""
+    if changes.is_expired(conn, since):
+        return "變更紀錄已清理，請重新下載全部資料後再同步"
+    if changes.is_ahead(conn, since):
+        # 讀取複本可能落後主資料庫，以主資料庫確認
+        primary = current_shard().pool.acquire()
+        try:
+            if changes.is_ahead(primary, since):
+                return "since 比最新的變更序號還新（資料庫可能已還原或館別不同），請重新下載全部資料後再同步"
+        finally:
+            primary.close()
+    return None
+
+def _parse_change_params(since_value):
+    """since 與 entity 參數，回傳 (since, entities, 錯誤訊息)"""
+    try:
+        since = int(since_value or 0)
+    except ValueError:
+        return None, None, "since 必須是整數"
+    if since < 0:
+        return None, None, "since 不可為負數"
+    entities = [entity for entity in request.args.get('entity', '').split(',') if entity]
+    unknown = [entity for entity in entities if entity not in changes.ENTITIES]
+    if unknown:
+        return None, None, f"entity 必須是 {', '.join(changes.ENTITIES)} 之一"
+    return since, entities, None
+
+@app.route('/api/changes')
+def get_changes():
+    """增量同步：seq 大於 since 的變更（?since=0&limit=100&entity=booking,room），依序號遞增
+
+    回應的 next_since 作為下一次的 since；has_more 為 true 時應立即再取下一頁。
+    """
+    since, entities, error = _parse_change_params(request.args.get('since'))
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    limit = request.args.get('limit', 100, type=int)
+    if limit < 1 or limit > CHANGES_PAGE_MAX:
+        return jsonify({"status": "error", "message": f"limit 必須介於 1 到 {CHANGES_PAGE_MAX}"}), 400
+    
+    conn = get_db_connection()
+    try:
+        cursor_error = _cursor_error(conn, since)
+        if cursor_error:
+            return jsonify({"status": "error", "message": cursor_error}), 410
+        records, next_since = changes.fetch(conn, since, limit, entities)
+    finally:
+        conn.close()
+    
     return jsonify({
         "status": "success",
-        "rooms": dict(room_stats),
-        "bookings": dict(booking_stats),
-        "monthly_stats": [dict(stat) for stat in monthly_stats]
+        "count": len(records),
+        "data": records,
+        "next_since": next_since,
+        "has_more": len(records) == limit
     })
 
+@app.route('/api/changes/stream')
+def stream_changes():
+    """以 Server-Sent Events 推送變更（?since=&entity=，重新連線時以 Last-Event-ID 接續）
+
+    每個事件的 id 為 seq、event 為「entity.op」（例如 booking.cancel）、data 與 /api/changes 的單筆紀錄相同。
+    連線最長 CHANGES_STREAM_SECONDS 秒，之後由客戶端自動重新連線。
+    """
+    since, entities, error = _parse_change_params(
+        request.headers.get('Last-Event-ID') or request.args.get('since'))
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    
+    conn = get_db_connection()
+    try:
+        cursor_error = _cursor_error(conn, since)
+        if since == 0 and 'since' not in request.args and 'Last-Event-ID' not in request.headers:
+            # 沒有指定起點時只推送之後的變更
+            since = changes.latest_seq(conn)
+    finally:
+        conn.close()
+    if cursor_error:
+        return jsonify({"status": "error", "message": cursor_error}), 410
+    
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({"status": "error", "message": "串流連線數已達上限，請改用 /api/changes 輪詢"}), 503
+    watcher = _change_watcher(current_shard())
+    
+    def generate():
+        cursor = since
+        deadline = time.monotonic() + CHANGES_STREAM_SECONDS
+        yield f'retry: {CHANGES_RETRY_MS}\n\n'
+        while time.monotonic() < deadline:
+            conn = get_db_connection()
+            try:
+                records, cursor = changes.fetch(conn, cursor, CHANGES_PAGE_MAX, entities)
+            finally:
+                conn.close()
+            for record in records:
+                yield (f"id: {record['seq']}\nevent: {record['entity']}.{record['op']}\n"
+                       f"data: {json.dumps(record, ensure_ascii=False)}\n\n")
+            if len(records) == CHANGES_PAGE_MAX:
+                continue
+            if not watcher.wait(cursor, CHANGES_HEARTBEAT_SECONDS):
+                yield ': keep-alive\n\n'
+    
+    response = app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(_stream_slots.release)
+    return response
+
+# ==================== 多館別 API ====================
+
+@app.route('/api/properties')
+def get_properties():
+    """所有館別代碼（其他端點以 ?property_id= 指定館別，未指定時為預設館別）"""
+    return jsonify({
+        "status": "success",
+        "default": DEFAULT_PROPERTY,
+        "data": shard_router.properties()
+    })
+
+@app.route('/api/properties', methods=['POST'])
+@admin_required
+def create_property():
+    """新增館別：建立該館別的資料庫檔（不含範例資料）"""
+    data = request.get_json(silent=True) or {}
+    property_id = data.get('property_id')
+    if not isinstance(property_id, str):
+        return jsonify({"status": "error", "message": "缺少 property_id"}), 400
+    if shard_router.exists(property_id):
+        return jsonify({"status": "error", "message": f"館別已存在: {property_id}"}), 409
+    
+    try:
+        shard_router.create(property_id)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"新增館別失敗: {str(e)}"}), 500
+    
+    return jsonify({"status": "success", "message": "館別新增成功", "property_id": property_id}), 201
+
+def _shard_reader(primary):
+    """在分片執行緒中取得連線的函數（請求上下文只在路由執行緒中，先決定好讀取路徑）"""
+    def connect(shard):
+        return shard.pool.acquire() if primary else shard.read_pool.acquire()
+    return connect
+
+def _sum(rows, key):
+    return sum(row[key] or 0 for row in rows)
+
+def _weighted_avg(rows, key, weight):
+    total = _sum(rows, weight)
+    if not total:
+        return None
+    return sum((row[key] or 0) * (row[weight] or 0) for row in rows) / total
+
+def _extreme(fn, rows, key):
+    values = [row[key] for row in rows if row[key] is not None]
+    return fn(values) if values else None
+
+def _merge_stats(results):
+    """合併各館別的 HotelStorage.stats() 結果（平均值依房間數 / 訂單數加權）"""
+    rooms = [room_stats for room_stats, _, _ in results]
+    bookings = [booking_stats for _, booking_stats, _ in results]
+    months = {}
+    for _, _, monthly_stats in results:
+        for stat in monthly_stats:
+            merged = months.setdefault(stat['month'], {"month": stat['month'], "booking_count": 0, "monthly_revenue": 0})
+            merged['booking_count'] += stat['booking_count']
+            merged['monthly_revenue'] += stat['monthly_revenue'] or 0
+    
+    return {
+        "rooms": {
+            "total_rooms": _sum(rooms, 'total_rooms'),
+            "available_rooms": _sum(rooms, 'available_rooms'),
+            "avg_price": _weighted_avg(rooms, 'avg_price', 'total_rooms'),
+            "max_price": _extreme(max, rooms, 'max_price'),
+            "min_price": _extreme(min, rooms, 'min_price'),
+            "total_capacity_value": _sum(rooms, 'total_capacity_value')
+        },
+        "bookings": {
+            "total_bookings": _sum(bookings, 'total_bookings'),
+            "confirmed_bookings": _sum(bookings, 'confirmed_bookings'),
+            "cancelled_bookings": _sum(bookings, 'cancelled_bookings'),
+            "total_revenue": _sum(bookings, 'total_revenue'),
+            "avg_booking_price": _weighted_avg(bookings, 'avg_booking_price', 'total_bookings'),
+            "total_nights": _sum(bookings, 'total_nights')
+        },
+        # 各館別各自取最近 6 個月，合併後的最近 6 個月仍完整
+        "monthly_stats": sorted(months.values(), key=lambda stat: stat['month'], reverse=True)[:6]
+    }
+
+@app.route('/api/properties/stats')
+@admin_required
+@cached(ttl=10, stale=60)
+def get_property_stats():
+    """跨館別統計：各館別平行查詢後合併，並附上各館別的統計"""
+    connect = _shard_reader(_reads_primary())
+    
+    def collect(shard):
+        return storage.HotelSQLiteStorage(lambda: connect(shard), shard.database).stats()
+    
+    try:
+        results = shard_router.fan_out(collect)
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"跨館別統計失敗: {str(e)}"}), 500
+    
+    merged = _merge_stats(list(results.values()))
+    return jsonify({
+        "status": "success",
+        **merged,
+        "properties": {
+            property_id: {"rooms": room_stats, "bookings": booking_stats, "monthly_stats": monthly_stats}
+            for property_id, (room_stats, booking_stats, monthly_stats) in results.items()
+        }
+    })
+
+@app.route('/api/properties/bookings')
+@admin_required
+def search_property_bookings():
+    """跨館別搜尋訂單（?guest_email=&status=&room_id=&start=&end=），每筆附上 property_id，依建立時間新到舊"""
+    try:
+        filters = parse_booking_filters()
+    except ValueError:
+        return jsonify({"status": "error", "message": "日期格式錯誤，請使用 YYYY-MM-DD"}), 400
+    try:
+        shape = parse_fields(BOOKING_FIELDS, 'list')
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    connect = _shard_reader(_reads_primary())
+    
+    def search(shard):
+        store = storage.HotelSQLiteStorage(lambda: connect(shard), shard.database)
+        return [dict(row, property_id=shard.property_id) for row in store.list_bookings(filters, shape)]
+    
+    try:
+        results = shard_router.fan_out(search)
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"跨館別搜尋失敗: {str(e)}"}), 500
+    
+    # 各館別的結果已依建立時間排序，合併時保持順序
+    rows = heapq.merge(*results.values(), key=lambda row: row['created_at'] or '', reverse=True)
+    bookings_list = [dict(BOOKING_FIELDS.serialize(row, shape), property_id=row['property_id']) for row in rows]
+    
+    return jsonify({
+        "status": "success",
+        "count": len(bookings_list),
+        "counts": {property_id: len(rows) for property_id, rows in results.items()},
+        "data": bookings_list
+    })
+
+# ==================== 備份 API ====================
+
+_backup_thread = None
+_backup_thread_lock = threading.Lock()
+
+def _backup_job(incremental, property_ids):
+    try:
+        if run_backup(incremental, property_ids) is None:
+            app.logger.warning("其他行程正在備份，略過這次備份")
+    except Exception as e:
+        app.logger.error(f"備份失敗: {e}")
+
+@app.route('/api/backups')
+@admin_required
+def list_backups():
+    """備份快照（新到舊，可用 ?label= 篩選資料庫，例如 default 或 default.archive）"""
+    snapshots = backup.list_snapshots(BACKUP_DIR, request.args.get('label'))
+    return jsonify({
+        "status": "success",
+        "running": _backup_thread is not None and _backup_thread.is_alive(),
+        "count": len(snapshots),
+        "data": snapshots[::-1]
+    })
+
+@app.route('/api/backups', methods=['POST'])
+@admin_required
+def create_backup():
+    """在背景執行線上備份（{"incremental": true} 只存變更的頁面，可指定 property_id），回 202"""
+    global _backup_thread
+    data = request.get_json(silent=True) or {}
+    property_id = data.get('property_id')
+    if property_id is not None and not shard_router.exists(property_id):
+        return jsonify({"status": "error", "message": f"找不到館別: {property_id}"}), 404
+    incremental = bool(data.get('incremental'))
+    
+    with _backup_thread_lock:
+        if _backup_thread is not None and _backup_thread.is_alive():
+            return jsonify({"status": "error", "message": "備份進行中"}), 409
+        _backup_thread = threading.Thread(
+            target=_backup_job, args=(incremental, [property_id] if property_id else None),
+            name='backup-request', daemon=True
+        )
+        _backup_thread.start()
+    
+    return jsonify({
+        "status": "success",
+        "message": "備份已開始",
+        "incremental": incremental
+    }), 202
+
+# ==================== 管理指令 ====================
+
+property_option = click.option('--property', 'property_id', default=DEFAULT_PROPERTY,
+                               show_default=True, help='館別代碼')
+
+def _cli_connection(property_id):
+    try:
+        return shard_router.get(property_id).pool.acquire()
+    except KeyError:
+        raise click.ClickException(f"找不到館別: {property_id}")
+
+@app.cli.command('check-counters')
+@click.option('--fix', is_flag=True, help='重新計算不一致的計數')
+@property_option
+def check_counters(fix, property_id):
+    """檢查房間上的訂單計數是否與訂單表一致（flask --app app check-counters）"""
+    conn = _cli_connection(property_id)
+    mismatches = conn.execute('''
+        SELECT r.id, r.active_booking_count, r.total_booking_count,
+               COALESCE(b.active, 0) as actual_active, COALESCE(b.total, 0) as actual_total
+        FROM rooms r
+        LEFT JOIN (
+            SELECT room_id, COUNT(*) as total,
+                   SUM(status IN ('confirmed', 'checked_in')) as active
+            FROM bookings
+            GROUP BY room_id
+        ) b ON b.room_id = r.id
+        WHERE r.active_booking_count != COALESCE(b.active, 0)
+           OR r.total_booking_count != COALESCE(b.total, 0)
+    ''').fetchall()
+    
+    for row in mismatches:
+        click.echo(f"房間 {row['id']}: active {row['active_booking_count']} -> {row['actual_active']}, "
+                   f"total {row['total_booking_count']} -> {row['actual_total']}")
+    
+    if not mismatches:
+        click.echo("訂單計數一致")
+    elif fix:
+        conn.execute(RECOUNT_BOOKINGS_SQL)
+        conn.commit()
+        click.echo(f"已修正 {len(mismatches)} 間房間的計數")
+    
+    conn.close()
+    if mismatches and not fix:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-inventory')
+@click.option('--days', default=INVENTORY_HORIZON_DAYS, show_default=True, help='自今天起重建的天數')
+@property_option
+def rebuild_inventory_command(days, property_id):
+    """依房間與訂單重新計算房型庫存帳（flask --app app rebuild-inventory）"""
+    today = dates.today_day()
+    conn = _cli_connection(property_id)
+    inventory.rebuild_inventory(conn, today, today + days)
+    conn.commit()
+    conn.close()
+    click.echo(f"已重建 {days} 天的房型庫存帳")
+
+@app.cli.command('compile-rates')
+@click.option('--days', default=RATE_HORIZON_DAYS, show_default=True, help='自今天起編譯的天數')
+@property_option
+def compile_rates_command(days, property_id):
+    """依房價規則重新編譯所有房間的每晚房價（flask --app app compile-rates）"""
+    conn = _cli_connection(property_id)
+    conn.execute('DELETE FROM nightly_rates')
+    rates.extend(conn, dates.today_day() + days)
+    conn.commit()
+    conn.close()
+    click.echo(f"已編譯 {days} 天的每晚房價")
+
+@app.cli.command('create-property')
+@click.argument('property_id')
+def create_property_command(property_id):
+    """新增館別並建立其資料庫檔（flask --app app create-property taipei）"""
+    try:
+        shard = shard_router.create(property_id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"館別 {property_id} 的資料庫: {shard.database}")
+
+@app.cli.command('archive-bookings')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS or 365, show_default=True, help='封存退房超過幾天的訂單')
+@click.option('--property', 'property_id', default=None, help='館別代碼（預設為所有館別）')
+def archive_bookings_command(days, property_id):
+    """把已完成 / 已取消的舊訂單分批移到封存檔（flask --app app archive-bookings）"""
+    if property_id is not None and not shard_router.exists(property_id):
+        raise click.ClickException(f"找不到館別: {property_id}")
+    click.echo(f"已封存 {run_archive(days, [property_id] if property_id else None)} 筆訂單")
+
+@app.cli.command('night-audit')
+def night_audit_command():
+    """夜間稽核：所有館別的 checked_out 訂單標記為 completed（flask --app app night-audit）"""
+    click.echo(f"已完成 {run_night_audit()} 筆訂單")
+
+@app.cli.command('backup')
+@click.option('--incremental', is_flag=True, help='只存上一份快照之後變更的頁面')
+@click.option('--property', 'property_id', default=None, help='館別代碼（預設為所有館別）')
+def backup_command(incremental, property_id):
+    """以線上備份 API 備份資料庫與封存檔，服務不必停止（flask --app app backup）"""
+    if property_id is not None and not shard_router.exists(property_id):
+        raise click.ClickException(f"找不到館別: {property_id}")
+    results = run_backup(incremental, [property_id] if property_id else None)
+    if results is None:
+        raise click.ClickException("其他行程正在備份")
+    for manifest in results:
+        if manifest.get('unchanged'):
+            click.echo(f"{manifest['label']}: 沒有變更（最新快照 {manifest['name']}）")
+        else:
+            click.echo(f"{manifest['name']}: {manifest['kind']}，{manifest['changed_pages']} / "
+                       f"{manifest['page_count']} 頁，{manifest['file']}（{manifest['file_size']} bytes）")
+
+@app.cli.command('list-backups')
+@click.option('--label', default=None, help='只列出這個資料庫的快照（例如 default、default.archive）')
+def list_backups_command(label):
+    """列出備份快照（flask --app app list-backups）"""
+    for manifest in backup.list_snapshots(BACKUP_DIR, label):
+        click.echo(f"{manifest['name']}  {manifest['kind']:<11}  {manifest['created_at']}  "
+                   f"{manifest['changed_pages']} / {manifest['page_count']} 頁  {manifest['file_size']} bytes")
+
+@app.cli.command('restore')
+@click.argument('name')
+@click.option('--target', default=None, help='還原到的檔案（預設為快照的來源檔）')
+@click.option('--force', is_flag=True, help='覆寫已存在的目標檔案')
+@click.option('--check', is_flag=True, help='只驗證快照能否還原（SHA-256 與 integrity_check），不寫入')
+def restore_command(name, target, force, check):
+    """還原快照：從完整快照依序套用增量，驗證通過後才取代目標檔（覆寫前請先停止服務）"""
+    try:
+        target = target or backup.load(BACKUP_DIR, name)['source']
+        manifest = backup.restore(BACKUP_DIR, name, target, force=force, check_only=check)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if check:
+        click.echo(f"{name} 驗證通過（{manifest['page_count']} 頁）")
+    else:
+        click.echo(f"已將 {name} 還原到 {target}")
+
 if __name__ == '__main__':
     # 確保資料庫檔案存在
-    if not os.path.exists('hotel.db'):
+    if not os.path.exists(DATABASE):
         init_db()
     
     print("飯店管理 API 啟動中...")
@@ -0,0 +1,205 @@
+"""冷資料封存：把早已結束的訂單移到另一個 SQLite 檔（{資料庫}.archive.db）
+
+completed / cancelled 且退房日早於封存界線的訂單分批搬到封存檔的 bookings 表，
+熱資料表只留近期與進行中的訂單，掃描型查詢不會隨歷史資料增加而變慢。
+
+每一批分兩個交易：先把訂單複製到封存檔，再從主資料庫刪除。主資料庫為 WAL
+模式時，同一個交易寫入兩個檔案在斷電時不保證原子（可能只提交了刪除），
+分開提交後最壞情況只是同一筆訂單兩邊都有；讀取時以熱資料為準，下次封存再刪除。
+
+主資料庫的 archive_state 記錄封存界線，查詢範圍早於界線時才需要附加封存檔；
+archive_summary 依狀態累計已封存的訂單數與金額，統計不必掃描封存檔。
+"""
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+ARCHIVE_STATUSES = ('completed', 'cancelled')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        archived_before_day INTEGER NOT NULL DEFAULT 0,  -- 退房日早於此日的訂單可能已封存（0 表示尚未封存）
+        archived_count INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT OR IGNORE INTO archive_state (id) VALUES (1);
+
+    CREATE TABLE IF NOT EXISTS archive_summary (
+        status TEXT PRIMARY KEY,
+        booking_count INTEGER NOT NULL DEFAULT 0,
+        total_price INTEGER NOT NULL DEFAULT 0,
+        nights INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+'''
+
+ARCHIVE_INDEXES = '''
+    CREATE INDEX IF NOT EXISTS idx_archive_bookings_room_days ON bookings (room_id, check_in_day, check_out_day);
+    CREATE INDEX IF NOT EXISTS idx_archive_bookings_guest_email ON bookings (guest_email);
+    CREATE INDEX IF NOT EXISTS idx_archive_bookings_created_at ON bookings (created_at);
+'''
+
+
+def path_for(database):
+    """主資料庫對應的封存檔路徑（hotel.db -> hotel.archive.db）"""
+    root, ext = os.path.splitext(database)
+    return f'{root}.archive{ext or ".db"}'
+
+
+def install(c, database):
+    """建立主資料庫中的封存狀態表，並建立（或升級）封存檔的 bookings 表"""
+    c.executescript(SCHEMA)
+    columns = c.execute('PRAGMA table_info(bookings)').fetchall()
+
+    conn = sqlite3.connect(path_for(database))
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(bookings)').fetchall()}
+        if not existing:
+            definitions = [
+                f'{row[1]} INTEGER PRIMARY KEY' if row[5] else f'{row[1]} {row[2]}'
+                for row in columns
+            ]
+            conn.execute(f'CREATE TABLE bookings ({", ".join(definitions)}, archived_at TIMESTAMP)')
+        else:
+            # 主資料庫新增的欄位也補到封存檔
+            for row in columns:
+                if row[1] not in existing:
+                    conn.execute(f'ALTER TABLE bookings ADD COLUMN {row[1]} {row[2]}')
+        conn.executescript(ARCHIVE_INDEXES)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def archived_before(conn):
+    row = conn.execute('SELECT archived_before_day FROM archive_state WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def covers(conn, start_day):
+    """從 start_day 開始的查詢（None 表示不限起日）是否可能包含已封存的訂單"""
+    before = archived_before(conn)
+    return before > 0 and (start_day is None or start_day < before)
+
+
+def summary(conn):
+    """已封存訂單依狀態的 {status: (筆數, 總金額, 晚數)}"""
+    rows = conn.execute('SELECT status, booking_count, total_price, nights FROM archive_summary').fetchall()
+    return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+
+@contextmanager
+def attached(conn, database):
+    """暫時把封存檔附加為 archive（唯讀連線池的連線以唯讀方式附加），用完即卸離"""
+    path = os.path.abspath(path_for(database))
+    pool = getattr(conn, 'pool', None)
+    if pool is not None and pool.read_only:
+        path = f'file:{path}?mode=ro'
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    try:
+        yield conn
+    finally:
+        conn.execute('DETACH DATABASE archive')
+
+
+def union_sql(columns):
+    """熱資料與封存資料合併的子查詢（需先 attached()；兩邊都有的訂單以熱資料為準）"""
+    column_list = ', '.join(columns)
+    return f'''(
+        SELECT {column_list} FROM main.bookings
+        UNION ALL
+        SELECT {column_list} FROM archive.bookings a
+        WHERE NOT EXISTS (SELECT 1 FROM main.bookings h WHERE h.id = a.id)
+    )'''
+
+
+def archive_bookings(database, before_day, batch_size=500, pause=0.05, timeout=30):
+    """把退房日早於 before_day 的 completed / cancelled 訂單分批移到封存檔，回傳移動筆數
+
+    每批之間暫停 pause 秒，讓線上的寫入請求有機會取得寫入鎖。
+    """
+    conn = sqlite3.connect(database, timeout=timeout, isolation_level=None)
+    conn.execute('ATTACH DATABASE ? AS archive', (path_for(database),))
+    columns = ', '.join(row[1] for row in conn.execute('PRAGMA main.table_info(bookings)').fetchall())
+    statuses = ','.join('?' * len(ARCHIVE_STATUSES))
+
+    moved = 0
+    last_id = 0
+    try:
+        while True:
+            ids = [row[0] for row in conn.execute(f'''
+                SELECT id FROM main.bookings
+                WHERE id > ? AND status IN ({statuses}) AND check_out_day < ?
+                ORDER BY id LIMIT ?
+            ''', (last_id,) + ARCHIVE_STATUSES + (before_day, batch_size)).fetchall()]
+            if not ids:
+                break
+            last_id = ids[-1]
+            id_list = ','.join('?' * len(ids))
+
+            # 第一個交易：複製到封存檔
+            with _transaction(conn):
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO archive.bookings ({columns}, archived_at)
+                    SELECT {columns}, CURRENT_TIMESTAMP FROM main.bookings WHERE id IN ({id_list})
+                ''', ids)
+
+            # 第二個交易：從熱資料刪除；複製之後又被修改的訂單留到下次
+            with _transaction(conn):
+                rows = conn.execute(f'''
+                    SELECT b.id, b.room_id, b.status, b.total_price, b.nights
+                    FROM main.bookings b JOIN archive.bookings a ON a.id = b.id
+                    WHERE b.id IN ({id_list}) AND b.status IN ({statuses})
+                    AND b.check_out_day < ? AND a.updated_at IS b.updated_at
+                ''', ids + list(ARCHIVE_STATUSES) + [before_day]).fetchall()
+                if rows:
+                    _remove_hot(conn, rows, before_day)
+                moved += len(rows)
+
+            time.sleep(pause)
+    finally:
+        conn.close()
+    return moved
+
+
+def _remove_hot(conn, rows, before_day):
+    conn.execute(f'DELETE FROM main.bookings WHERE id IN ({",".join("?" * len(rows))})',
+                 [row[0] for row in rows])
+
+    by_room = {}
+    by_status = {}
+    for _, room_id, status, total_price, nights in rows:
+        by_room[room_id] = by_room.get(room_id, 0) + 1
+        count, price, night_count = by_status.get(status, (0, 0, 0))
+        by_status[status] = (count + 1, price + (total_price or 0), night_count + (nights or 0))
+
+    # 房間的訂單計數（觸發器已扣掉 total_booking_count）改記在 archived_booking_count
+    conn.executemany('UPDATE main.rooms SET archived_booking_count = archived_booking_count + ? WHERE id = ?',
+                     [(count, room_id) for room_id, count in by_room.items()])
+    conn.executemany('''
+        INSERT INTO main.archive_summary (status, booking_count, total_price, nights) VALUES (?, ?, ?, ?)
+        ON CONFLICT (status) DO UPDATE SET
+            booking_count = booking_count + excluded.booking_count,
+            total_price = total_price + excluded.total_price,
+            nights = nights + excluded.nights
+    ''', [(status,) + values for status, values in by_status.items()])
+    conn.execute('''
+        UPDATE main.archive_state SET
+            archived_before_day = MAX(archived_before_day, ?),
+            archived_count = archived_count + ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1
+    ''', (before_day, len(rows)))
+
+
+@contextmanager
+def _transaction(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
@@ -0,0 +1,295 @@
+"""線上備份與時間點快照：備份期間寫入照常進行
+
+每次快照先以 SQLite 線上備份 API 複製一份一致的資料庫（replica.backup_to：每步只
+複製少量頁面，步與步之間暫停讓寫入端取得鎖），之後的雜湊、壓縮都在這份複本上做，
+不再碰線上的資料庫。
+
+- 完整快照（full）：整個資料庫檔，預設以 gzip 壓縮（{name}.db.gz，可直接 gunzip 使用）
+- 增量快照（incremental）：只存與上一份快照不同的頁面（{name}.delta.gz），
+  每份快照另存每頁的雜湊（{name}.pages），下一份增量不必讀取舊的備份檔
+
+WAL 檔的內容在檢查點之後就會被覆寫，無法從外部可靠地串成一條增量鏈，所以增量
+快照以頁面差異記錄；一份增量只相當於上次快照之後的 WAL 中實際改動過的頁面。
+
+每份快照的 {name}.json（manifest）最後才寫入，有 manifest 才是完整的快照。還原時
+從完整快照依序套用增量，比對整個檔案的 SHA-256 並執行 PRAGMA integrity_check，
+通過後才以 os.replace() 取代目標檔。
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from replica import backup_to
+
+MANIFEST_SUFFIX = '.json'
+PAGES_SUFFIX = '.pages'
+PAGE_DIGEST_SIZE = 16
+DELTA_HEADER = struct.Struct('>I')  # 頁面編號（0 起算），後接整頁內容
+
+# 增量鏈超過這個長度時改做完整快照（還原時需要依序套用的增量數上限）
+MAX_CHAIN = 24
+
+COPY_CHUNK = 1024 * 1024
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _path(directory, name, suffix):
+    return os.path.join(directory, name + suffix)
+
+
+def _write_json(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def exclusive(directory):
+    """備份目錄的檔案鎖（多個 worker 同時觸發時只有一個執行），產生是否取得鎖"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load(directory, name):
+    """讀取快照的 manifest，不存在時拋出 ValueError"""
+    try:
+        with open(_path(directory, name, MANIFEST_SUFFIX), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"找不到備份: {name}")
+
+
+def list_snapshots(directory, label=None):
+    """備份目錄中的快照（依建立時間排序），label 為 None 表示所有資料庫"""
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for filename in os.listdir(directory):
+        if filename.endswith(MANIFEST_SUFFIX):
+            manifest = load(directory, filename[:-len(MANIFEST_SUFFIX)])
+            if label is None or manifest['label'] == label:
+                manifests.append(manifest)
+    return sorted(manifests, key=lambda manifest: (manifest['created_at'], manifest['name']))
+
+
+def latest(directory, label, kind=None):
+    """label 最新的快照，kind 為 'full' 時只看完整快照"""
+    snapshots = [manifest for manifest in list_snapshots(directory, label)
+                 if kind is None or manifest['kind'] == kind]
+    return snapshots[-1] if snapshots else None
+
+
+def _scan(path, page_size):
+    """逐頁讀取資料庫檔，回傳 (每頁雜湊串接的 bytes, 整個檔案的 SHA-256)"""
+    digests = bytearray()
+    whole = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            whole.update(page)
+            digests += hashlib.blake2b(page, digest_size=PAGE_DIGEST_SIZE).digest()
+    return bytes(digests), whole.hexdigest()
+
+
+def _open_output(path, compress):
+    return gzip.open(path, 'wb', compresslevel=6) if compress else open(path, 'wb')
+
+
+def _open_input(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def snapshot(database, directory, label=None, incremental=False, pages=256, sleep=0.005, compress=True):
+    """為 database 建立一份快照，回傳 manifest
+
+    incremental=True 時只存與上一份快照不同的頁面（沒有上一份、頁面大小改變或增量鏈
+    太長時改做完整快照）；沒有任何變更時不寫入檔案，回傳上一份 manifest 並標記 unchanged。
+    """
+    label = label or os.path.splitext(os.path.basename(database))[0]
+    os.makedirs(directory, exist_ok=True)
+    created_at = _now()
+    name = f'{label}-{created_at.strftime("%Y%m%dT%H%M%S%fZ")}'
+    copy = _path(directory, f'.{name}', '.db')
+    filename = None
+
+    try:
+        # 線上備份：每步 pages 頁，步與步之間暫停 sleep 秒
+        backup_to(database, copy, pages, sleep)
+        conn = sqlite3.connect(copy)
+        try:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            check = conn.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            conn.close()
+        if check != 'ok':
+            raise ValueError(f"資料庫檢查失敗（{label}）: {check}")
+        digests, sha256 = _scan(copy, page_size)
+
+        parent = latest(directory, label) if incremental else None
+        if parent is not None and (parent['page_size'] != page_size or parent['depth'] >= MAX_CHAIN):
+            parent = None
+
+        if parent is None:
+            kind = 'full'
+            filename = name + ('.db.gz' if compress else '.db')
+            with open(copy, 'rb') as src, _open_output(_path(directory, filename, '.tmp'), compress) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+            changed = page_count
+        else:
+            with open(_path(directory, parent['name'], PAGES_SUFFIX), 'rb') as f:
+                previous = f.read()
+            changed_pages = [
+                index for index in range(page_count)
+                if digests[index * PAGE_DIGEST_SIZE:(index + 1) * PAGE_DIGEST_SIZE]
+                != previous[index * PAGE_DIGEST_SIZE:(index + 1) * PAGE_DIGEST_SIZE]
+            ]
+            if not changed_pages and page_count == parent['page_count']:
+                return dict(parent, unchanged=True)
+            kind = 'incremental'
+            filename = name + ('.delta.gz' if compress else '.delta')
+            with open(copy, 'rb') as src, _open_output(_path(directory, filename, '.tmp'), compress) as dst:
+                for index in changed_pages:
+                    src.seek(index * page_size)
+                    dst.write(DELTA_HEADER.pack(index))
+                    dst.write(src.read(page_size))
+            changed = len(changed_pages)
+
+        os.replace(_path(directory, filename, '.tmp'), _path(directory, filename, ''))
+        with open(_path(directory, name, PAGES_SUFFIX), 'wb') as f:
+            f.write(digests)
+
+        manifest = {
+            "name": name,
+            "label": label,
+            "source": os.path.abspath(database),
+            "kind": kind,
+            "parent": parent['name'] if parent else None,
+            "depth": parent['depth'] + 1 if parent else 0,
+            "created_at": created_at.isoformat(timespec='seconds'),
+            "file": filename,
+            "file_size": os.path.getsize(_path(directory, filename, '')),
+            "page_size": page_size,
+            "page_count": page_count,
+            "changed_pages": changed,
+            "size": page_size * page_count,
+            "sha256": sha256
+        }
+        _write_json(_path(directory, name, MANIFEST_SUFFIX), manifest)
+        return manifest
+    finally:
+        for path in (copy, f'{copy}.tmp', filename and _path(directory, filename, '.tmp')):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+def chain(directory, name):
+    """還原 name 需要的快照（完整快照在前，依序到 name）"""
+    manifests = [load(directory, name)]
+    while manifests[-1]['kind'] != 'full':
+        manifests.append(load(directory, manifests[-1]['parent']))
+    return manifests[::-1]
+
+
+def _apply_delta(path, target, page_size):
+    with _open_input(path) as src, open(target, 'r+b') as dst:
+        while True:
+            header = src.read(DELTA_HEADER.size)
+            if not header:
+                break
+            page = src.read(page_size)
+            if len(header) != DELTA_HEADER.size or len(page) != page_size:
+                raise ValueError(f"增量檔不完整: {os.path.basename(path)}")
+            dst.seek(DELTA_HEADER.unpack(header)[0] * page_size)
+            dst.write(page)
+
+
+def verify(path, manifest):
+    """檢查還原出來的檔案：SHA-256 與 manifest 相同且 PRAGMA integrity_check 通過，否則拋出 ValueError"""
+    _, sha256 = _scan(path, manifest['page_size'])
+    if sha256 != manifest['sha256']:
+        raise ValueError(f"備份檔校驗失敗（SHA-256 不符）: {manifest['name']}")
+    conn = sqlite3.connect(f'file:{os.path.abspath(path)}?mode=ro', uri=True)
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA integrity_check').fetchall()]
+    finally:
+        conn.close()
+    if result != ['ok']:
+        raise ValueError(f"資料庫完整性檢查失敗: {'; '.join(result[:5])}")
+
+
+def restore(directory, name, target, force=False, check_only=False):
+    """把快照還原到 target（先還原到暫存檔並驗證，通過後才取代），回傳 manifest
+
+    target 已存在時需要 force=True；還原前應先停止使用該資料庫的行程。
+    check_only=True 時只驗證能否還原，不寫入 target。
+    """
+    manifests = chain(directory, name)
+    manifest = manifests[-1]
+    if not check_only and os.path.exists(target) and not force:
+        raise ValueError(f"目標檔案已存在: {target}（確認要覆寫請加上 --force）")
+
+    tmp = f'{target}.restore.tmp'
+    try:
+        with _open_input(_path(directory, manifests[0]['file'], '')) as src, open(tmp, 'wb') as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK)
+        for delta in manifests[1:]:
+            _apply_delta(_path(directory, delta['file'], ''), tmp, delta['page_size'])
+            # 資料庫變小（例如 VACUUM 之後）時截掉多出的頁面
+            with open(tmp, 'r+b') as f:
+                f.truncate(delta['size'])
+        verify(tmp, manifest)
+
+        if check_only:
+            return manifest
+        # 舊的 -wal / -shm 留著會在開啟時被套用到還原的檔案上
+        for suffix in ('-wal', '-shm', '-journal'):
+            if os.path.exists(target + suffix):
+                os.remove(target + suffix)
+        os.replace(tmp, target)
+        return manifest
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def prune(directory, label, keep):
+    """每個資料庫只保留最新的 keep 份完整快照（以及之後的增量），回傳刪除的快照名稱"""
+    snapshots = list_snapshots(directory, label)
+    fulls = [manifest for manifest in snapshots if manifest['kind'] == 'full']
+    if keep <= 0 or len(fulls) <= keep:
+        return []
+    oldest_kept = fulls[-keep]
+    removed = []
+    for manifest in snapshots:
+        if (manifest['created_at'], manifest['name']) >= (oldest_kept['created_at'], oldest_kept['name']):
+            break
+        # 先刪 manifest：中途失敗時不會留下指向不存在檔案的快照
+        for filename in (manifest['name'] + MANIFEST_SUFFIX, manifest['file'], manifest['name'] + PAGES_SUFFIX):
+            path = _path(directory, filename, '')
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(manifest['name'])
+    return removed
@@ -0,0 +1,207 @@
+"""變更紀錄：房間、訂單與房型訂單的新增 / 修改 / 取消依序寫入 changes 表
+
+紀錄由觸發器在寫入的同一個交易中產生，任何寫入路徑（API、批次狀態變更、
+夜間稽核）都會留下紀錄，序號 seq 依提交順序遞增。消費端記住最後處理的 seq，
+之後只取比它新的紀錄即可增量同步，不必重新下載全部房間與訂單。
+
+紀錄本身只記「哪一筆、做了什麼」，回應時附上該筆資料目前的內容（已刪除為 null）。
+封存移走的舊訂單不會產生紀錄。
+"""
+import logging
+import threading
+import time
+
+import dates
+
+logger = logging.getLogger(__name__)
+
+ENTITIES = ('room', 'booking', 'type_booking')
+
+# 只有使用者看得到的欄位變更才記錄（訂單計數等內部欄位由觸發器頻繁更新）
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,  -- room, booking, type_booking
+        entity_id INTEGER NOT NULL,
+        op TEXT NOT NULL,  -- insert, update, cancel, delete
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_changes_created_at ON changes (created_at);
+
+    CREATE TRIGGER IF NOT EXISTS trg_changes_room_insert AFTER INSERT ON rooms
+    BEGIN
+        INSERT INTO changes (entity, entity_id, op) VALUES ('room', NEW.id, 'insert');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_changes_room_update
+    AFTER UPDATE OF name, price, description, room_type, capacity, amenities, available, image_url ON rooms
+    BEGIN
+        INSERT INTO changes (entity, entity_id, op) VALUES ('room', NEW.id, 'update');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_changes_room_delete AFTER DELETE ON rooms
+    BEGIN
+        INSERT INTO changes (entity, entity_id, op) VALUES ('room', OLD.id, 'delete');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_changes_booking_insert AFTER INSERT ON bookings
+    BEGIN
+        INSERT INTO changes (entity, entity_id, op) VALUES ('booking', NEW.id, 'insert');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_changes_booking_update
+    AFTER UPDATE OF room_id, guest_name, guest_email, guest_phone, check_in, check_out, guests,
+                    total_price, status, special_requests, payment_status ON bookings
+    BEGIN
+        INSERT INTO changes (entity, entity_id, op) VALUES ('booking', NEW.id,
+            CASE WHEN NEW.status = 'cancelled' AND OLD.status IS NOT 'cancelled' THEN 'cancel' ELSE 'update' END);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_changes_type_booking_insert AFTER INSERT ON type_bookings
+    BEGIN
+        INSERT INTO changes (entity, entity_id, op) VALUES ('type_booking', NEW.id, 'insert');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_changes_type_booking_update AFTER UPDATE OF status ON type_bookings
+    BEGIN
+        INSERT INTO changes (entity, entity_id, op) VALUES ('type_booking', NEW.id,
+            CASE WHEN NEW.status = 'cancelled' AND OLD.status IS NOT 'cancelled' THEN 'cancel' ELSE 'update' END);
+    END;
+'''
+
+# 各類資料目前內容的查詢（格式與單筆查詢端點相同，整數天數欄位不回傳）
+CURRENT_SQL = {
+    'room': 'SELECT * FROM rooms WHERE id IN ({placeholders})',
+    'booking': '''
+        SELECT b.*, r.name as room_name, r.price as room_price
+        FROM bookings b JOIN rooms r ON b.room_id = r.id
+        WHERE b.id IN ({placeholders})
+    ''',
+    'type_booking': 'SELECT * FROM type_bookings WHERE id IN ({placeholders})'
+}
+
+CURRENT_CHUNK = 500
+
+
+def install(c):
+    """建立變更紀錄表與觸發器（需在 rooms、bookings、type_bookings 建立之後）"""
+    c.executescript(SCHEMA)
+
+
+def latest_seq(conn):
+    """最新一筆紀錄的序號（沒有任何紀錄時為 0；清理舊紀錄不影響）"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+    return row[0] if row else 0
+
+
+def is_expired(conn, since):
+    """since 之後的紀錄是否已被清理（消費端必須重新同步全部資料）"""
+    oldest = conn.execute('SELECT MIN(seq) FROM changes').fetchone()[0]
+    if oldest is None:
+        return since < latest_seq(conn)
+    return since < oldest - 1
+
+
+def is_ahead(conn, since):
+    """since 是否比最新的序號還新（資料庫還原到較早的備份，或用了其他館別的游標）"""
+    return since > latest_seq(conn)
+
+
+def fetch(conn, since, limit, entities=None):
+    """seq 大於 since 的紀錄（最多 limit 筆），回傳 (紀錄列表, 下一次的 since)
+
+    下一次的 since 會跳過被 entities 篩掉的紀錄，消費端不必重複掃描。
+    """
+    # 先讀最新序號再查詢：序號不大於它的紀錄都已提交，之後的查詢一定看得到
+    latest = latest_seq(conn)
+    query = 'SELECT seq, entity, entity_id, op, created_at FROM changes WHERE seq > ? AND seq <= ?'
+    params = [since, latest]
+    if entities:
+        query += f' AND entity IN ({",".join("?" * len(entities))})'
+        params.extend(entities)
+    rows = conn.execute(query + ' ORDER BY seq LIMIT ?', params + [limit]).fetchall()
+
+    ids = {}
+    for row in rows:
+        ids.setdefault(row[1], set()).add(row[2])
+    current = {}
+    for entity, entity_ids in ids.items():
+        entity_ids = sorted(entity_ids)
+        for start in range(0, len(entity_ids), CURRENT_CHUNK):
+            chunk = entity_ids[start:start + CURRENT_CHUNK]
+            sql = CURRENT_SQL[entity].format(placeholders=','.join('?' * len(chunk)))
+            for data in conn.execute(sql, chunk).fetchall():
+                current[(entity, data['id'])] = dates.without_day_columns(data)
+
+    records = [{
+        "seq": row[0],
+        "entity": row[1],
+        "id": row[2],
+        "op": row[3],
+        "created_at": row[4],
+        "data": current.get((row[1], row[2]))
+    } for row in rows]
+    next_since = rows[-1][0] if len(rows) == limit else max(since, latest)
+    return records, next_since
+
+
+def prune(conn, days):
+    """刪除超過 days 天的紀錄（需在寫入交易中呼叫），回傳刪除筆數"""
+    cursor = conn.execute('''
+        DELETE FROM changes WHERE seq <= (
+            SELECT MAX(seq) FROM changes WHERE created_at < datetime('now', ?)
+        )
+    ''', (f'-{int(days)} days',))
+    return cursor.rowcount
+
+
+class ChangeWatcher:
+    """等待新紀錄：有串流連線時由單一背景執行緒輪詢最新序號，再通知所有等待中的連線
+
+    同一個 worker 的所有串流共用一次輪詢，資料庫負擔不隨連線數增加。
+    """
+
+    def __init__(self, connect, interval=0.5):
+        self.connect = connect
+        self.interval = interval
+        self.latest = None
+        self._waiters = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def wait(self, since, timeout):
+        """等到最新序號大於 since 或逾時，回傳是否有新紀錄"""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='change-watcher', daemon=True)
+                self._thread.start()
+            self._waiters += 1
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(
+                    lambda: self.latest is not None and self.latest > since, timeout)
+            finally:
+                self._waiters -= 1
+
+    def _poll(self):
+        conn = self.connect()
+        try:
+            return latest_seq(conn)
+        finally:
+            conn.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # 沒有串流連線時不輪詢
+                self._condition.wait_for(lambda: self._waiters > 0)
+            try:
+                latest = self._poll()
+            except Exception as e:
+                logger.error(f"讀取變更紀錄序號失敗: {e}")
+            else:
+                with self._condition:
+                    if latest != self.latest:
+                        self.latest = latest
+                        self._condition.notify_all()
+            time.sleep(self.interval)
@@ -0,0 +1,57 @@
+"""Single-flight 請求合併：相同的進行中讀取只計算一次，其他請求等待並共用結果"""
+import threading
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """以 key 合併同時進行的相同計算（單一行程內）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counts = {}
+
+    def do(self, key, fn, group='default'):
+        """執行 fn()；若相同 key 已在計算中則等待它的結果
+
+        回傳 (結果, 是否為共用結果)。fn 拋出的例外會傳給所有等待者。
+        """
+        with self._lock:
+            counts = self._counts.setdefault(group, {"executed": 0, "coalesced": 0})
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                counts['executed'] += 1
+                call = self._calls[key] = _Call()
+            else:
+                counts['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def stats(self):
+        """各群組的實際執行次數與被合併的請求數"""
+        with self._lock:
+            return {group: dict(counts) for group, counts in self._counts.items()}
@@ -0,0 +1,73 @@
+"""日期工具：把 'YYYY-MM-DD' 轉成整數天數（1970-01-01 起算），並快取最近解析過的字串"""
+from datetime import date
+from functools import lru_cache
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# SQLite 端的同一個換算：julianday('1970-01-01') = 2440587.5
+SQL_DAY_NUMBER = "CAST(julianday({column}) - 2440587.5 AS INTEGER)"
+
+# 訂單表上的整數天數欄位只供查詢使用，不出現在 API 回應中
+DAY_COLUMNS = ('check_in_day', 'check_out_day')
+
+
+@lru_cache(maxsize=4096)
+def parse_day(value):
+    """'YYYY-MM-DD' -> 天數，格式錯誤時拋出 ValueError"""
+    if not isinstance(value, str) or len(value) != 10 or value[4] != '-' or value[7] != '-':
+        raise ValueError(f"日期格式錯誤: {value!r}")
+    return date.fromisoformat(value).toordinal() - EPOCH_ORDINAL
+
+
+def format_day(day):
+    """天數 -> 'YYYY-MM-DD'"""
+    return date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+
+
+def today_day():
+    return date.today().toordinal() - EPOCH_ORDINAL
+
+
+def without_day_columns(row):
+    """資料列 -> dict，去掉 DAY_COLUMNS（回應中只保留 check_in / check_out 日期字串）"""
+    return {key: row[key] for key in row.keys() if key not in DAY_COLUMNS}
+
+
+def migrate_booking_days(c):
+    """bookings 表加上 check_in_day / check_out_day 整數欄位、同步觸發器與索引
+
+    寫入路徑會直接填入兩個欄位；其他只寫日期字串的寫入（或修改日期）由觸發器補上。
+    """
+    columns = [row[1] for row in c.execute('PRAGMA table_info(bookings)').fetchall()]
+    for column in ('check_in_day', 'check_out_day'):
+        if column not in columns:
+            c.execute(f'ALTER TABLE bookings ADD COLUMN {column} INTEGER')
+
+    check_in_day = SQL_DAY_NUMBER.format(column='check_in')
+    check_out_day = SQL_DAY_NUMBER.format(column='check_out')
+    c.execute(f'''
+        UPDATE bookings SET check_in_day = {check_in_day}, check_out_day = {check_out_day}
+        WHERE check_in_day IS NULL OR check_out_day IS NULL
+    ''')
+
+    c.executescript(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_days_insert AFTER INSERT ON bookings
+        WHEN NEW.check_in_day IS NULL OR NEW.check_out_day IS NULL
+        BEGIN
+            UPDATE bookings SET
+                check_in_day = {SQL_DAY_NUMBER.format(column='NEW.check_in')},
+                check_out_day = {SQL_DAY_NUMBER.format(column='NEW.check_out')}
+            WHERE id = NEW.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_days_update AFTER UPDATE OF check_in, check_out ON bookings
+        BEGIN
+            UPDATE bookings SET
+                check_in_day = {SQL_DAY_NUMBER.format(column='NEW.check_in')},
+                check_out_day = {SQL_DAY_NUMBER.format(column='NEW.check_out')}
+            WHERE id = NEW.id;
+        END;
+
+        CREATE INDEX IF NOT EXISTS idx_bookings_room_days
+            ON bookings (room_id, check_in_day, check_out_day);
+    ''')
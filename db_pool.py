@@ -0,0 +1,96 @@
+"""簡單的 SQLite 連線池：重複使用已開啟的連線，省去每次請求的開檔成本，
+也讓 sqlite3 的預備語句快取（cached_statements）能跨請求生效"""
+import queue
+import sqlite3
+from contextlib import contextmanager
+
+
+class PooledConnection(sqlite3.Connection):
+    """close() 不會真的關閉連線，而是歸還給連線池"""
+
+    pool = None
+    idle = False
+    generation = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def discard(self):
+        """真正關閉連線（不歸還）"""
+        super().close()
+
+
+class ConnectionPool:
+    """保留閒置連線的連線池，連線可跨執行緒使用（同一時間只借給一個執行緒）
+
+    size 只限制閒置連線數：沒有閒置連線時 acquire() 直接開新連線，不會等待，
+    同時借出的連線數不受限制；歸還時閒置連線已滿就關閉該連線。
+
+    read_only=True 時每條連線都設定 PRAGMA query_only（搭配 file:...?mode=ro 的 URI）。
+    generation 為可呼叫物件時，借出前會比對連線建立時的值，不同就關閉重開
+    （例如複本檔被新檔取代後，舊連線仍開著舊檔）。
+    """
+
+    def __init__(self, database, size=4, timeout=30, uri=False, cached_statements=128,
+                 read_only=False, generation=None):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.uri = uri
+        self.cached_statements = cached_statements
+        self.read_only = read_only
+        self.generation = generation
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout, uri=self.uri,
+                               check_same_thread=False, factory=PooledConnection,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        if self.read_only:
+            conn.execute('PRAGMA query_only = ON')
+        conn.pool = self
+        if self.generation is not None:
+            conn.generation = self.generation()
+        return conn
+
+    def acquire(self):
+        """借出一條連線，用完呼叫 conn.close() 歸還"""
+        current = None if self.generation is None else self.generation()
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                break
+            if conn.generation == current:
+                break
+            conn.discard()
+        conn.idle = False
+        return conn
+
+    def release(self, conn):
+        # 重複 close() 不可讓同一條連線兩次進入連線池
+        if conn.idle:
+            return
+        conn.idle = True
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.discard()
+
+    @contextmanager
+    def connection(self):
+        """借出一條連線，用完歸還；發生例外時關閉該連線而不歸還"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            conn.discard()
+            raise
+        self.release(conn)
@@ -0,0 +1,259 @@
+"""結帳期間的暫時保留：客人選定房間到完成付款之間，先把房間與日期保留幾分鐘
+
+保留（hold）寫入 room_holds 表，與訂單在同一個寫入交易中檢查衝突，行程重啟後
+仍然有效；各 worker 另外在記憶體中保存一份（HoldBook），報價等讀取路徑直接查
+記憶體，不必每次查表。到期以時間輪（TimingWheel）處理：每個 tick 只看一個槽位，
+不必在每個請求掃描所有保留。
+
+其他 worker 新增或釋放的保留以 holds_state 的版本號同步：版本沒變時只需一次
+主鍵查詢。過期的保留由各 worker 的時間輪自行移除，資料表中的列在建立新保留
+與夜間稽核時清理。
+"""
+import math
+import secrets
+import threading
+import time
+from collections import namedtuple
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS room_holds (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        token TEXT UNIQUE NOT NULL,
+        room_id INTEGER NOT NULL,
+        check_in_day INTEGER NOT NULL,
+        check_out_day INTEGER NOT NULL,
+        expires_at REAL NOT NULL,  -- UNIX 時間（秒）
+        released INTEGER NOT NULL DEFAULT 0,  -- 1 表示已釋放或已轉成訂單
+        version INTEGER NOT NULL,  -- 最後一次新增 / 釋放時的 holds_state.version
+        client TEXT,  -- 建立保留的呼叫端（速率限制的 key），限制每個呼叫端同時保留的房數
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_room_holds_room_days ON room_holds (room_id, check_in_day, check_out_day);
+    CREATE INDEX IF NOT EXISTS idx_room_holds_expires_at ON room_holds (expires_at);
+    CREATE INDEX IF NOT EXISTS idx_room_holds_version ON room_holds (version);
+
+    CREATE TABLE IF NOT EXISTS holds_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO holds_state (id) VALUES (1);
+'''
+
+HOLD_COLUMNS = 'token, room_id, check_in_day, check_out_day, expires_at'
+
+Hold = namedtuple('Hold', HOLD_COLUMNS.replace(',', ''))
+
+
+def install(c):
+    c.executescript(SCHEMA)
+    # 舊資料庫升級：補上 client 欄位
+    columns = [row[1] for row in c.execute('PRAGMA table_info(room_holds)').fetchall()]
+    if 'client' not in columns:
+        c.execute('ALTER TABLE room_holds ADD COLUMN client TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_room_holds_client ON room_holds (client, expires_at)')
+
+
+def new_token():
+    return secrets.token_urlsafe(16)
+
+
+def _bump_version(conn):
+    conn.execute('UPDATE holds_state SET version = version + 1 WHERE id = 1')
+    return conn.execute('SELECT version FROM holds_state WHERE id = 1').fetchone()[0]
+
+
+def get(conn, token):
+    """讀取保留（不論是否有效），不存在時回傳 None"""
+    return conn.execute(f'SELECT {HOLD_COLUMNS}, released FROM room_holds WHERE token = ?',
+                        (token,)).fetchone()
+
+
+def active(conn, token, now=None):
+    """尚未釋放也未過期的保留，否則回傳 None"""
+    now = time.time() if now is None else now
+    row = conn.execute(f'''
+        SELECT {HOLD_COLUMNS} FROM room_holds WHERE token = ? AND released = 0 AND expires_at > ?
+    ''', (token, now)).fetchone()
+    return Hold(*row) if row else None
+
+
+def conflicts(conn, room_id, check_in_day, check_out_day, exclude=None, now=None):
+    """與住宿期間重疊的其他有效保留數（需在寫入交易中呼叫才可信）"""
+    now = time.time() if now is None else now
+    return conn.execute('''
+        SELECT COUNT(*) FROM room_holds
+        WHERE room_id = ? AND check_in_day < ? AND check_out_day > ?
+        AND released = 0 AND expires_at > ? AND token IS NOT ?
+    ''', (room_id, check_out_day, check_in_day, now, exclude)).fetchone()[0]
+
+
+def held_by_night(conn, room_type, check_in_day, check_out_day, exclude=None, now=None):
+    """該房型在住宿期間每晚被其他有效保留佔住的房間數 {night: 房間數}（只列出有保留的夜晚）
+
+    同一間房的保留不會重疊（建立時已檢查），所以每晚的保留數就是被佔住的房間數；
+    房型庫存需逐晚再扣掉這些房間。
+    """
+    now = time.time() if now is None else now
+    rows = conn.execute('''
+        SELECT h.check_in_day, h.check_out_day FROM room_holds h JOIN rooms r ON r.id = h.room_id
+        WHERE r.room_type = ? AND h.check_in_day < ? AND h.check_out_day > ?
+        AND h.released = 0 AND h.expires_at > ? AND h.token IS NOT ?
+    ''', (room_type, check_out_day, check_in_day, now, exclude)).fetchall()
+    held = {}
+    for hold_in, hold_out in rows:
+        for night in range(max(hold_in, check_in_day), min(hold_out, check_out_day)):
+            held[night] = held.get(night, 0) + 1
+    return held
+
+
+def active_for_client(conn, client, now=None):
+    """呼叫端目前的有效保留數"""
+    now = time.time() if now is None else now
+    return conn.execute('''
+        SELECT COUNT(*) FROM room_holds WHERE client = ? AND released = 0 AND expires_at > ?
+    ''', (client, now)).fetchone()[0]
+
+
+def create(conn, room_id, check_in_day, check_out_day, ttl, client=None, now=None):
+    """新增保留並順便清理已過期的列（需在寫入交易中呼叫），回傳 Hold"""
+    now = time.time() if now is None else now
+    prune(conn, now)
+    hold = Hold(new_token(), room_id, check_in_day, check_out_day, now + ttl)
+    conn.execute(f'''
+        INSERT INTO room_holds ({HOLD_COLUMNS}, version, client) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', hold + (_bump_version(conn), client))
+    return hold
+
+
+def release(conn, token):
+    """釋放保留（需在寫入交易中呼叫），回傳是否有釋放"""
+    if conn.execute('SELECT 1 FROM room_holds WHERE token = ? AND released = 0', (token,)).fetchone() is None:
+        return False
+    conn.execute('UPDATE room_holds SET released = 1, version = ? WHERE token = ?', (_bump_version(conn), token))
+    return True
+
+
+def prune(conn, now=None):
+    """刪除已過期的列（需在寫入交易中呼叫），回傳刪除筆數"""
+    now = time.time() if now is None else now
+    return conn.execute('DELETE FROM room_holds WHERE expires_at <= ?', (now,)).rowcount
+
+
+class TimingWheel:
+    """雜湊時間輪：slots 個槽位，每個 tick 秒前進一格
+
+    到期時間超過一圈的項目放在同一個槽位，前進到該槽位時比對到期 tick，
+    還沒到的留到下一圈。schedule / cancel 為 O(1)，advance 只看經過的槽位。
+    """
+
+    def __init__(self, tick=1.0, slots=512, now=None):
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]
+        self._where = {}
+        self._current = int((time.time() if now is None else now) // tick)
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key, expires_at):
+        """expires_at 之後（最多晚一個 tick）由 advance() 回傳 key"""
+        self.cancel(key)
+        due = max(math.ceil(expires_at / self.tick), self._current + 1)
+        slot = self._slots[due % len(self._slots)]
+        slot[key] = due
+        self._where[key] = slot
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def advance(self, now=None):
+        """前進到 now，回傳這段期間到期的 key"""
+        target = int((time.time() if now is None else now) // self.tick)
+        expired = []
+        for index in range(self._current + 1, min(target, self._current + len(self._slots)) + 1):
+            slot = self._slots[index % len(self._slots)]
+            for key, due in list(slot.items()):
+                if due <= target:
+                    del slot[key]
+                    del self._where[key]
+                    expired.append(key)
+        self._current = max(self._current, target)
+        return expired
+
+
+class HoldBook:
+    """單一館別在記憶體中的有效保留（依房間索引），以時間輪移除到期的保留"""
+
+    def __init__(self, tick=1.0):
+        self.version = 0
+        self._holds = {}
+        self._by_room = {}
+        self._wheel = TimingWheel(tick)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._holds)
+
+    def sync(self, conn):
+        """載入其他 worker 新增 / 釋放的保留（版本沒變時只查一次 holds_state）"""
+        version = conn.execute('SELECT version FROM holds_state WHERE id = 1').fetchone()
+        if version is None or version[0] <= self.version:
+            self.expire()
+            return
+        rows = conn.execute(f'''
+            SELECT {HOLD_COLUMNS}, released FROM room_holds WHERE version > ? AND expires_at > ?
+        ''', (self.version, time.time())).fetchall()
+        with self._lock:
+            for row in rows:
+                if row[-1]:
+                    self._remove(row[0])
+                else:
+                    self._add(Hold(*row[:-1]))
+            self.version = max(self.version, version[0])
+        self.expire()
+
+    def add(self, hold):
+        with self._lock:
+            self._add(hold)
+
+    def discard(self, token):
+        with self._lock:
+            self._remove(token)
+
+    def expire(self, now=None):
+        """移除到期的保留，回傳移除的筆數"""
+        with self._lock:
+            expired = self._wheel.advance(now)
+            for token in expired:
+                self._remove(token)
+            return len(expired)
+
+    def intervals(self, room_ids, start_day, end_day, exclude=None, now=None):
+        """{room_id: [(check_in_day, check_out_day), ...]}：與 [start_day, end_day) 重疊的有效保留"""
+        now = time.time() if now is None else now
+        result = {}
+        with self._lock:
+            for room_id in room_ids:
+                for hold in self._by_room.get(room_id, {}).values():
+                    if (hold.token != exclude and hold.expires_at > now
+                            and hold.check_in_day < end_day and hold.check_out_day > start_day):
+                        result.setdefault(room_id, []).append((hold.check_in_day, hold.check_out_day))
+        return result
+
+    def _add(self, hold):
+        self._remove(hold.token)
+        self._holds[hold.token] = hold
+        self._by_room.setdefault(hold.room_id, {})[hold.token] = hold
+        self._wheel.schedule(hold.token, hold.expires_at)
+
+    def _remove(self, token):
+        hold = self._holds.pop(token, None)
+        if hold is None:
+            return
+        self._wheel.cancel(token)
+        room = self._by_room[hold.room_id]
+        del room[token]
+        if not room:
+            del self._by_room[hold.room_id]
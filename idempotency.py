@@ -0,0 +1,90 @@
+"""Idempotency-Key 儲存：記錄寫入請求的第一次回應，重試時直接回放"""
+import hashlib
+import sqlite3
+import time
+
+# begin() 的結果
+NEW = 'new'
+DONE = 'done'
+IN_FLIGHT = 'in_flight'
+MISMATCH = 'mismatch'
+
+
+def fingerprint(method, path, body):
+    """請求指紋：同一個 key 搭配不同請求內容時拒絕回放"""
+    digest = hashlib.sha256()
+    digest.update(method.encode())
+    digest.update(path.encode())
+    digest.update(body or b'')
+    return digest.hexdigest()
+
+
+class IdempotencyStore:
+    """以 SQLite 小表 idempotency_keys 保存回應（跨 gunicorn worker 共用）
+
+    一筆紀錄在請求處理中時 status_code 為 NULL，作為短暫的處理中鎖；
+    locked_until 之後仍未完成的紀錄視為持有者已中斷，可被接手。
+    """
+
+    def __init__(self, database, ttl=86400, lock_timeout=30, cleanup_every=500):
+        self.database = database
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.cleanup_every = cleanup_every
+        self._calls = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, isolation_level=None, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def begin(self, key, request_hash):
+        """嘗試取得 key 的處理權，回傳 (狀態, 已儲存的 (status_code, body))"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            self._calls += 1
+            if self._calls % self.cleanup_every == 0:
+                conn.execute('DELETE FROM idempotency_keys WHERE expires_at < ?', (now,))
+
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT * FROM idempotency_keys WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                expired = row['expires_at'] < now
+                abandoned = row['status_code'] is None and row['locked_until'] < now
+                if not (expired or abandoned):
+                    conn.execute('COMMIT')
+                    if row['request_hash'] != request_hash:
+                        return MISMATCH, None
+                    if row['status_code'] is None:
+                        return IN_FLIGHT, None
+                    return DONE, (row['status_code'], row['body'])
+
+            conn.execute('''
+                INSERT OR REPLACE INTO idempotency_keys
+                    (key, request_hash, status_code, body, locked_until, expires_at)
+                VALUES (?, ?, NULL, NULL, ?, ?)
+            ''', (key, request_hash, now + self.lock_timeout, now + self.ttl))
+            conn.execute('COMMIT')
+            return NEW, None
+        finally:
+            conn.close()
+
+    def complete(self, key, status_code, body):
+        """保存第一次的回應"""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE idempotency_keys SET status_code = ?, body = ?, expires_at = ?
+                WHERE key = ?
+            ''', (status_code, body, time.time() + self.ttl, key))
+        finally:
+            conn.close()
+
+    def release(self, key):
+        """處理失敗時釋放鎖，讓重試可以重新執行"""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL', (key,))
+        finally:
+            conn.close()
@@ -0,0 +1,215 @@
+"""房型庫存帳：以 (room_type, night) 為鍵記錄每晚可售房數與已售房數
+
+available 為該房型可預訂（rooms.available = 1）的房間數，sold 為涵蓋該晚的
+有效訂單數（confirmed / checked_in 的實體房訂單 + confirmed 的房型訂單）。
+兩個數字都由觸發器在訂單與房間寫入的同一個交易中調整；觸發器只更新已存在的
+帳列，尚未建立的夜晚由 ensure_inventory() 依現有資料一次算好後補上。
+"""
+import dates
+
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS inventory (
+        room_type TEXT NOT NULL,
+        night INTEGER NOT NULL,  -- 整數天數（1970-01-01 起算）
+        available INTEGER NOT NULL,
+        sold INTEGER NOT NULL,
+        PRIMARY KEY (room_type, night)
+    ) WITHOUT ROWID;
+
+    -- 房型訂單：只指定房型，入住時才分配實體房間
+    CREATE TABLE IF NOT EXISTS type_bookings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_type TEXT NOT NULL,
+        guest_name TEXT NOT NULL,
+        guest_email TEXT NOT NULL,
+        guest_phone TEXT,
+        check_in DATE NOT NULL,
+        check_out DATE NOT NULL,
+        check_in_day INTEGER NOT NULL,
+        check_out_day INTEGER NOT NULL,
+        nights INTEGER NOT NULL,
+        guests INTEGER DEFAULT 1,
+        total_price INTEGER NOT NULL,
+        status TEXT DEFAULT 'confirmed',  -- confirmed, assigned, cancelled
+        booking_id INTEGER,  -- 分配房間後對應的 bookings.id
+        special_requests TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- 實體房訂單
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_booking_insert AFTER INSERT ON bookings
+    WHEN NEW.status IN ('confirmed', 'checked_in')
+    BEGIN
+        UPDATE inventory SET sold = sold + 1
+        WHERE room_type = (SELECT room_type FROM rooms WHERE id = NEW.room_id)
+        AND night >= {dates.SQL_DAY_NUMBER.format(column='NEW.check_in')}
+        AND night < {dates.SQL_DAY_NUMBER.format(column='NEW.check_out')};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_booking_update
+    AFTER UPDATE OF status, room_id, check_in, check_out ON bookings
+    BEGIN
+        UPDATE inventory SET sold = sold - 1
+        WHERE OLD.status IN ('confirmed', 'checked_in')
+        AND room_type = (SELECT room_type FROM rooms WHERE id = OLD.room_id)
+        AND night >= {dates.SQL_DAY_NUMBER.format(column='OLD.check_in')}
+        AND night < {dates.SQL_DAY_NUMBER.format(column='OLD.check_out')};
+        UPDATE inventory SET sold = sold + 1
+        WHERE NEW.status IN ('confirmed', 'checked_in')
+        AND room_type = (SELECT room_type FROM rooms WHERE id = NEW.room_id)
+        AND night >= {dates.SQL_DAY_NUMBER.format(column='NEW.check_in')}
+        AND night < {dates.SQL_DAY_NUMBER.format(column='NEW.check_out')};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_booking_delete AFTER DELETE ON bookings
+    WHEN OLD.status IN ('confirmed', 'checked_in')
+    BEGIN
+        UPDATE inventory SET sold = sold - 1
+        WHERE room_type = (SELECT room_type FROM rooms WHERE id = OLD.room_id)
+        AND night >= {dates.SQL_DAY_NUMBER.format(column='OLD.check_in')}
+        AND night < {dates.SQL_DAY_NUMBER.format(column='OLD.check_out')};
+    END;
+
+    -- 房型訂單
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_type_booking_insert AFTER INSERT ON type_bookings
+    WHEN NEW.status = 'confirmed'
+    BEGIN
+        UPDATE inventory SET sold = sold + 1
+        WHERE room_type = NEW.room_type
+        AND night >= NEW.check_in_day AND night < NEW.check_out_day;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_type_booking_update AFTER UPDATE OF status ON type_bookings
+    WHEN (OLD.status = 'confirmed') != (NEW.status = 'confirmed')
+    BEGIN
+        UPDATE inventory SET sold = sold + (CASE WHEN NEW.status = 'confirmed' THEN 1 ELSE -1 END)
+        WHERE room_type = NEW.room_type
+        AND night >= NEW.check_in_day AND night < NEW.check_out_day;
+    END;
+
+    -- 房間新增、刪除、可用狀態與房型變更
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_room_insert AFTER INSERT ON rooms
+    BEGIN
+        UPDATE inventory SET available = available + (NEW.available = 1)
+        WHERE room_type = NEW.room_type;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_room_delete AFTER DELETE ON rooms
+    BEGIN
+        UPDATE inventory SET available = available - (OLD.available = 1)
+        WHERE room_type = OLD.room_type;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_room_update AFTER UPDATE OF available, room_type ON rooms
+    BEGIN
+        UPDATE inventory SET available = available - (OLD.available = 1)
+        WHERE room_type = OLD.room_type;
+        UPDATE inventory SET available = available + (NEW.available = 1)
+        WHERE room_type = NEW.room_type;
+        -- 房型變更時，這間房的訂單也要從舊房型移到新房型
+        UPDATE inventory SET sold = sold + (CASE WHEN room_type = NEW.room_type THEN 1 ELSE -1 END) * (
+            SELECT COUNT(*) FROM bookings b
+            WHERE b.room_id = NEW.id AND b.status IN ('confirmed', 'checked_in')
+            AND b.check_in_day <= inventory.night AND b.check_out_day > inventory.night
+        )
+        WHERE OLD.room_type != NEW.room_type AND room_type IN (OLD.room_type, NEW.room_type);
+    END;
+'''
+
+# 依現有房間與訂單算出缺少的帳列
+ENSURE_SQL = '''
+    INSERT OR IGNORE INTO inventory (room_type, night, available, sold)
+    WITH RECURSIVE nights(night) AS (
+        SELECT ? UNION ALL SELECT night + 1 FROM nights WHERE night + 1 < ?
+    ),
+    types(room_type) AS (
+        SELECT DISTINCT room_type FROM rooms WHERE room_type IS NOT NULL
+    )
+    SELECT t.room_type, n.night,
+        (SELECT COUNT(*) FROM rooms r WHERE r.room_type = t.room_type AND r.available = 1),
+        (SELECT COUNT(*) FROM bookings b JOIN rooms r ON r.id = b.room_id
+         WHERE r.room_type = t.room_type AND b.status IN ('confirmed', 'checked_in')
+         AND b.check_in_day <= n.night AND b.check_out_day > n.night)
+        + (SELECT COUNT(*) FROM type_bookings tb
+           WHERE tb.room_type = t.room_type AND tb.status = 'confirmed'
+           AND tb.check_in_day <= n.night AND tb.check_out_day > n.night)
+    FROM types t, nights n
+'''
+
+
+def install(c):
+    """建立庫存帳、房型訂單表與觸發器"""
+    c.executescript(SCHEMA)
+
+
+def is_complete(conn, start_day, end_day):
+    """[start_day, end_day) 範圍內每個房型的每晚是否都已有帳列"""
+    expected = conn.execute('SELECT COUNT(DISTINCT room_type) FROM rooms').fetchone()[0] * (end_day - start_day)
+    actual = conn.execute('''
+        SELECT COUNT(*) FROM inventory i
+        WHERE night >= ? AND night < ?
+        AND room_type IN (SELECT DISTINCT room_type FROM rooms)
+    ''', (start_day, end_day)).fetchone()[0]
+    return actual >= expected
+
+
+def ensure_inventory(conn, start_day, end_day):
+    """補上 [start_day, end_day) 範圍內缺少的帳列（需在寫入交易中呼叫）"""
+    if end_day > start_day:
+        conn.execute(ENSURE_SQL, (start_day, end_day))
+
+
+def rebuild_inventory(conn, start_day, end_day):
+    """刪除並重新計算範圍內的帳列（一致性修復用）"""
+    conn.execute('DELETE FROM inventory WHERE night >= ? AND night < ?', (start_day, end_day))
+    ensure_inventory(conn, start_day, end_day)
+
+
+def nightly(conn, start_day, end_day, room_type=None):
+    """範圍內各房型每晚的帳列（短範圍掃描主鍵）"""
+    query = 'SELECT room_type, night, available, sold FROM inventory WHERE night >= ? AND night < ?'
+    params = [start_day, end_day]
+    if room_type:
+        query = '''
+            SELECT room_type, night, available, sold FROM inventory
+            WHERE room_type = ? AND night >= ? AND night < ?
+        '''
+        params = [room_type, start_day, end_day]
+    return conn.execute(query + ' ORDER BY room_type, night', params).fetchall()
+
+
+def min_free(conn, room_type, start_day, end_day):
+    """整段住宿期間該房型最少剩幾間（帳列不存在時回傳 None）"""
+    row = conn.execute('''
+        SELECT MIN(available - sold), COUNT(*) FROM inventory
+        WHERE room_type = ? AND night >= ? AND night < ?
+    ''', (room_type, start_day, end_day)).fetchone()
+    if row[1] < end_day - start_day:
+        return None
+    return row[0]
+
+
+def min_free_by_stay(conn, room_types, stays):
+    """各房型在每段住宿期間的最少剩餘房數 {(room_type, check_in_day, check_out_day): 最小值}
+
+    帳列一次查出；有夜晚尚未建立帳列的組合不列出。
+    """
+    if not room_types or not stays:
+        return {}
+    start_day = min(check_in_day for check_in_day, _ in stays)
+    end_day = max(check_out_day for _, check_out_day in stays)
+    rows = conn.execute(f'''
+        SELECT room_type, night, available - sold FROM inventory
+        WHERE room_type IN ({','.join('?' * len(room_types))})
+        AND night >= ? AND night < ?
+    ''', list(room_types) + [start_day, end_day]).fetchall()
+    free = {(row[0], row[1]): row[2] for row in rows}
+
+    result = {}
+    for room_type in room_types:
+        for check_in_day, check_out_day in set(stays):
+            values = [free.get((room_type, night)) for night in range(check_in_day, check_out_day)]
+            if None not in values:
+                result[(room_type, check_in_day, check_out_day)] = min(values)
+    return result
@@ -0,0 +1,194 @@
+"""SQL 產生工具：依欄位組合產生一次性的參數化語句並快取 SQL 文字"""
+import sqlite3
+from collections import namedtuple
+from functools import lru_cache
+
+# SQLite 3.35 起支援 UPDATE ... RETURNING，可省去更新後的 SELECT
+RETURNING_SUPPORTED = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# 各表允許更新的欄位（同時決定 SET 子句的欄位順序）
+UPDATABLE_FIELDS = {
+    'rooms': ('name', 'price', 'description', 'room_type', 'capacity',
+              'amenities', 'available', 'image_url'),
+    'bookings': ('guest_name', 'guest_email', 'guest_phone', 'guests', 'special_requests')
+}
+
+# 更新後回傳的欄位（與原本更新後 SELECT 的結果相同）
+RETURNING_COLUMNS = {
+    'rooms': '*',
+    'bookings': '''*,
+        (SELECT name FROM rooms WHERE rooms.id = bookings.room_id) as room_name,
+        (SELECT price FROM rooms WHERE rooms.id = bookings.room_id) as room_price'''
+}
+
+
+@lru_cache(maxsize=256)
+def update_sql(table, fields, returning=RETURNING_SUPPORTED):
+    """產生單一 UPDATE 語句（依表與欄位組合快取）"""
+    assignments = ', '.join(f'{field} = ?' for field in fields)
+    sql = f'UPDATE {table} SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?'
+    if returning:
+        sql += f' RETURNING {RETURNING_COLUMNS[table]}'
+    return sql
+
+
+@lru_cache(maxsize=16)
+def select_by_id_sql(table):
+    return f'SELECT {RETURNING_COLUMNS[table]} FROM {table} WHERE id = ?'
+
+
+def update_fields(table, data, allowed=None):
+    """依白名單挑出要更新的欄位，allowed 可再限縮白名單"""
+    whitelist = UPDATABLE_FIELDS[table]
+    if allowed is not None:
+        whitelist = tuple(field for field in whitelist if field in allowed)
+    return tuple(field for field in whitelist if field in data)
+
+
+def execute_update(conn, table, row_id, values):
+    """以一條 UPDATE 更新 values 中的欄位，回傳更新後的資料列；資料不存在時回傳 None
+
+    values 的 key 必須已經過 update_fields() 篩選。
+    """
+    fields = tuple(values)
+    params = [values[field] for field in fields] + [row_id]
+    cursor = conn.execute(update_sql(table, fields), params)
+    if RETURNING_SUPPORTED:
+        return cursor.fetchone()
+    if cursor.rowcount == 0:
+        return None
+    return conn.execute(select_by_id_sql(table), (row_id,)).fetchone()
+
+
+class FilterQuery:
+    """動態篩選查詢樣板
+
+    conditions 為 {參數名稱: SQL 條件片段}，片段中的 ? 數量即該參數需要的值個數
+    （沒有 ? 的片段只當開關使用）。每種「啟用哪些條件 + 排序 + 欄位」的組合只產生一次
+    SQL 文字與對應的 COUNT 查詢，之後直接取用快取，搭配 sqlite3 的預備語句快取，
+    同樣形狀的查詢不必重新組字串也不必重新編譯。select 中的 {columns} 會換成查詢欄位。
+    """
+
+    def __init__(self, select, count_select, conditions, paginate=False):
+        self.select = select
+        self.count_select = count_select
+        self.conditions = conditions
+        self.paginate = paginate
+        self._shapes = {}
+
+    def compile(self, active, order_by='', columns='*'):
+        """取得 (查詢 SQL, COUNT SQL)，active 為啟用的條件名稱（依 conditions 順序）"""
+        key = (active, order_by, columns)
+        shape = self._shapes.get(key)
+        if shape is None:
+            where = ''.join(f' AND {self.conditions[name]}' for name in active)
+            sql = self.select.replace('{columns}', columns) + where
+            if order_by:
+                sql += f' ORDER BY {order_by}'
+            if self.paginate:
+                sql += ' LIMIT ? OFFSET ?'
+            shape = self._shapes[key] = (sql, self.count_select + where)
+        return shape
+
+    def build(self, filters, order_by='', limit=None, offset=0, columns='*'):
+        """依篩選值產生 (查詢 SQL, 查詢參數, COUNT SQL, COUNT 參數)，值為 None 的條件不啟用"""
+        active = tuple(name for name in self.conditions if filters.get(name) is not None)
+        sql, count_sql = self.compile(active, order_by, columns)
+
+        params = []
+        for name in active:
+            placeholders = self.conditions[name].count('?')
+            value = filters[name]
+            if placeholders == 1:
+                params.append(value)
+            elif placeholders > 1:
+                params.extend(value)
+
+        query_params = params + [limit, offset] if self.paginate else params
+        return sql, query_params, count_sql, params
+
+    def shape_count(self):
+        return len(self._shapes)
+
+
+# 一組欄位的形狀：fields 為回應的欄位（依要求順序），columns 為需要查詢的欄位（依宣告順序）
+FieldShape = namedtuple('FieldShape', 'fields columns')
+
+
+class Fieldset:
+    """稀疏欄位（?fields=）：回應只包含要求的欄位，SQL 也只查詢這些欄位
+
+    columns 為 {欄位: SQL 運算式}（白名單，依宣告順序產生 SELECT 欄位），
+    presets 為具名的欄位組合（例如 summary、card、full）。
+    derived 為 {欄位: (計算函式, 需要的欄位, ...)}，由其他欄位算出的欄位。
+    required 的欄位一律查詢（排序、合併需要）但只在要求時回傳；
+    optional 的欄位值為 NULL 時不回傳（例如只有封存訂單才有的 archived_at）。
+    每種欄位組合（最多 MAX_SHAPES 種）只解析與組字串一次，搭配 FilterQuery 的
+    SQL 快取與 sqlite3 的預備語句快取，同一種形狀的查詢不必重新編譯。
+    """
+
+    MAX_SHAPES = 256
+
+    def __init__(self, columns, presets, derived=None, required=('id',), optional=()):
+        self.columns = columns
+        self.presets = presets
+        self.derived = derived or {}
+        self.required = tuple(required)
+        self.optional = set(optional)
+        self._shapes = {}
+        self._selects = {}
+
+    def names(self):
+        return list(self.columns) + [name for name in self.derived if name not in self.columns]
+
+    def parse(self, value, default='full'):
+        """?fields= 的值（預設組合名稱或以逗號分隔的欄位）-> FieldShape，未知欄位拋出 ValueError"""
+        key = value or default
+        shape = self._shapes.get(key)
+        if shape is not None:
+            return shape
+
+        if key in self.presets:
+            fields = tuple(self.presets[key])
+        else:
+            fields = tuple(dict.fromkeys(name.strip() for name in key.split(',') if name.strip()))
+            unknown = [name for name in fields if name not in self.columns and name not in self.derived]
+            if not fields or unknown:
+                raise ValueError(f"未知的欄位: {', '.join(unknown) or key}"
+                                 f"（可用: {', '.join(self.presets)} 或 {', '.join(self.names())}）")
+
+        needed = set(self.required)
+        for name in fields:
+            if name in self.derived:
+                needed.update(self.derived[name][1:])
+            else:
+                needed.add(name)
+        shape = FieldShape(fields, tuple(name for name in self.columns if name in needed))
+        if len(self._shapes) < self.MAX_SHAPES:
+            self._shapes[key] = shape
+        return shape
+
+    def select(self, shape, overrides=None):
+        """形狀對應的 SELECT 欄位清單；overrides 為 {欄位: SQL 運算式}，給不同來源的表使用"""
+        key = (shape.columns, tuple(sorted((overrides or {}).items())))
+        sql = self._selects.get(key)
+        if sql is None:
+            expressions = dict(self.columns, **(overrides or {}))
+            sql = ', '.join(
+                name if expressions[name] == name else f'{expressions[name]} AS {name}'
+                for name in shape.columns
+            )
+            if len(self._selects) < self.MAX_SHAPES:
+                self._selects[key] = sql
+        return sql
+
+    def serialize(self, row, shape):
+        """查詢結果 -> 只含要求欄位的 dict"""
+        data = dict(row)
+        for name in shape.fields:
+            if name in self.derived:
+                data[name] = self.derived[name][0](data)
+        return {
+            name: data[name] for name in shape.fields
+            if not (name in self.optional and data[name] is None)
+        }
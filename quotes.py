@@ -0,0 +1,124 @@
+"""批次報價：一次計算多間房 × 多段住宿的可訂狀態與總價
+
+相關訂單只查一次，依房間整理成依入住日排序的區間與「前綴最大退房日」；
+房價由 rates.PriceTable 一次查出。每一格只需一次二分搜尋與兩次查表，
+計算量與回應大小都和格數成正比。
+"""
+import bisect
+
+import dates
+import rates
+
+# app.py 與 test_db.py 對「佔用房間的訂單」定義不同，由呼叫端傳入
+DEFAULT_BLOCKING = "status NOT IN ('cancelled')"
+
+OCCUPANCY_CHUNK = 500
+
+
+def parse_stays(items, max_nights):
+    """[{"check_in": ..., "check_out": ...}, ...] -> [(check_in_day, check_out_day), ...]，格式錯誤時拋出 ValueError"""
+    if not isinstance(items, list) or not items:
+        raise ValueError("stays 必須是非空陣列")
+    stays = []
+    for item in items:
+        if not isinstance(item, dict) or 'check_in' not in item or 'check_out' not in item:
+            raise ValueError("每段住宿都需要 check_in 與 check_out")
+        check_in_day = dates.parse_day(item['check_in'])
+        check_out_day = dates.parse_day(item['check_out'])
+        if check_out_day <= check_in_day:
+            raise ValueError("退房日期必須晚於入住日期")
+        if check_out_day - check_in_day > max_nights:
+            raise ValueError(f"每段住宿最多 {max_nights} 晚")
+        stays.append((check_in_day, check_out_day))
+    return stays
+
+
+class Occupancy:
+    """多間房在一段期間內的佔用區間（一次查出）
+
+    extra 為訂單以外也佔住房間的區間 {room_id: [(check_in_day, check_out_day), ...]}（例如暫時保留）。
+    """
+
+    def __init__(self, conn, room_ids, start_day, end_day, blocking=DEFAULT_BLOCKING, extra=None):
+        self._starts = {}
+        self._max_ends = {}
+        intervals = {}
+        for start in range(0, len(room_ids), OCCUPANCY_CHUNK):
+            chunk = room_ids[start:start + OCCUPANCY_CHUNK]
+            rows = conn.execute(f'''
+                SELECT room_id, check_in_day, check_out_day FROM bookings
+                WHERE room_id IN ({','.join('?' * len(chunk))})
+                AND {blocking}
+                AND check_in_day < ? AND check_out_day > ?
+                ORDER BY room_id, check_in_day
+            ''', chunk + [end_day, start_day]).fetchall()
+            for row in rows:
+                intervals.setdefault(row[0], []).append((row[1], row[2]))
+        for room_id, spans in (extra or {}).items():
+            intervals.setdefault(room_id, []).extend(spans)
+
+        for room_id, spans in intervals.items():
+            if extra and room_id in extra:
+                spans.sort()
+            max_end = None
+            max_ends = []
+            for _, check_out_day in spans:
+                max_end = check_out_day if max_end is None else max(max_end, check_out_day)
+                max_ends.append(max_end)
+            self._starts[room_id] = [check_in_day for check_in_day, _ in spans]
+            self._max_ends[room_id] = max_ends
+
+    def is_free(self, room_id, check_in_day, check_out_day):
+        """入住日早於 check_out_day 的訂單中，最晚的退房日不晚於 check_in_day 即為空房"""
+        starts = self._starts.get(room_id)
+        if not starts:
+            return True
+        index = bisect.bisect_left(starts, check_out_day)
+        return index == 0 or self._max_ends[room_id][index - 1] <= check_in_day
+
+    def free_windows(self, room_id, nights, start_day, end_day):
+        """[start_day, end_day) 內住得下 nights 晚的空檔 [(最早入住日, 最晚入住日), ...]
+
+        依入住日排序的區間走一遍：前綴最大退房日到下一筆入住日之間就是空檔。
+        """
+        starts = self._starts.get(room_id, [])
+        max_ends = self._max_ends.get(room_id, [])
+        windows = []
+        cursor = start_day
+        for index in range(len(starts) + 1):
+            gap_end = min(starts[index], end_day) if index < len(starts) else end_day
+            if gap_end - cursor >= nights:
+                windows.append((cursor, gap_end - nights))
+            if index < len(starts):
+                cursor = max(cursor, max_ends[index])
+            if cursor >= end_day:
+                break
+        return windows
+
+    def nearest_free(self, room_id, check_in_day, nights, start_day, end_day):
+        """每個空檔中離 check_in_day 最近的入住日，依距離排序 [(check_in_day, check_out_day), ...]"""
+        days = [min(max(check_in_day, first), last)
+                for first, last in self.free_windows(room_id, nights, start_day, end_day)]
+        days.sort(key=lambda day: (abs(day - check_in_day), day))
+        return [(day, day + nights) for day in days]
+
+
+def quote_matrix(conn, rooms, stays, blocking=DEFAULT_BLOCKING, held=None):
+    """rooms × stays 的報價矩陣：{room_id: [(是否可訂, 總價), ...]}，順序與 stays 相同
+
+    rooms 需包含 id、price、available（room_type 可省略）；held 為暫時保留的區間（見 Occupancy）。
+    """
+    start_day = min(check_in_day for check_in_day, _ in stays)
+    end_day = max(check_out_day for _, check_out_day in stays)
+    occupancy = Occupancy(conn, [room['id'] for room in rooms], start_day, end_day, blocking, held)
+    prices = rates.PriceTable(conn, rooms, stays)
+
+    matrix = {}
+    for room in rooms:
+        bookable = bool(room['available'])
+        matrix[room['id']] = [
+            (bookable and occupancy.is_free(room['id'], check_in_day, check_out_day),
+             prices.total(room, check_in_day, check_out_day))
+            for check_in_day, check_out_day in stays
+        ]
+    return matrix
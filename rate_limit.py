@@ -0,0 +1,147 @@
+"""請求速率限制與負載卸除
+
+TokenBucketLimiter 把 token bucket 狀態放在 mmap 共享檔案中的固定大小雜湊表，
+同一台機器上的所有 gunicorn worker 共用同一份狀態；每次檢查只鎖住一個槽位
+（fcntl 位元組範圍鎖），不經過 SQLite，單次檢查只需數微秒。
+LoadShedder 依每個 worker 的處理中請求數，在 worker 飽和前先回 503；只有多執行緒
+的 worker（gunicorn --worker-class gthread）才會同時處理多個請求，同步 worker 的
+處理中請求數永遠是 1，上限不會生效。
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from flask import g, jsonify, request
+
+# 槽位格式：key 雜湊、剩餘 token、最後更新時間
+_SLOT = struct.Struct('<Qdd')
+
+
+def default_state_path():
+    """共享狀態檔：優先放在 /dev/shm（記憶體檔案系統）"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'hotel-api-ratelimit')
+
+
+class TokenBucketLimiter:
+    """跨行程的 token bucket，rate 為每秒補充的 token 數，burst 為桶容量
+
+    槽位衝突時直接覆寫（視為新的 bucket），只會讓少數 key 偶爾多拿到一桶 token。
+    """
+
+    def __init__(self, path, rate, burst, slots=8192):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.slots = slots
+        size = _SLOT.size * slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # fcntl 鎖以行程為單位，同一行程內的執行緒另外用 threading.Lock 互斥
+        self._lock = threading.Lock()
+
+    def allow(self, key, cost=1.0):
+        """扣除 token，回傳 (是否放行, 建議重試秒數)"""
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        key_hash = int.from_bytes(digest, 'little') or 1
+        offset = (key_hash % self.slots) * _SLOT.size
+        now = time.time()
+
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, _SLOT.size, offset)
+            try:
+                stored_hash, tokens, last = _SLOT.unpack_from(self._map, offset)
+                if stored_hash != key_hash:
+                    tokens = self.burst
+                else:
+                    tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+                if tokens >= cost:
+                    _SLOT.pack_into(self._map, offset, key_hash, tokens - cost, now)
+                    return True, 0.0
+
+                _SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+                return False, (cost - tokens) / self.rate
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, _SLOT.size, offset)
+
+
+class LoadShedder:
+    """每個 worker 的准入控制：處理中請求超過 max_inflight 時拒絕新請求"""
+
+    def __init__(self, max_inflight):
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            if self.inflight >= self.max_inflight:
+                self.shed += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.inflight -= 1
+
+
+def client_identity(credential=None):
+    """速率限制的 key：有驗證過的憑證時以憑證計算，否則以連線來源 IP 計算
+
+    credential 必須由呼叫端先驗證（例如正確的管理員密碼或已登記的 API 金鑰），
+    未驗證的標頭值不能當作 key，否則每換一個值就拿到一個新的 bucket。
+    IP 取自 request.remote_addr，不讀 X-Forwarded-For；在反向代理之後由 ProxyFix
+    依信任的代理層數改寫 remote_addr。
+    """
+    if credential:
+        return 'key:' + hashlib.sha256(credential.encode()).hexdigest()
+    return f'ip:{request.remote_addr}'
+
+
+def init_app(app, limiter=None, shedder=None, exempt=(), long_lived=(), identity=client_identity):
+    """在 Flask app 上掛載速率限制與負載卸除（exempt 內的路徑不受限制）
+
+    identity() 回傳目前請求的速率限制 key（預設只以 IP 計算）。
+
+    long_lived 內的路徑（例如 SSE 串流）仍受速率限制，但不計入處理中請求數，
+    否則少數長時間連線就會佔滿上限；這類路徑需自行限制同時連線數。
+    """
+    exempt = frozenset(exempt)
+    long_lived = frozenset(long_lived)
+
+    @app.before_request
+    def _admission_control():
+        if request.path in exempt:
+            return None
+
+        if limiter is not None:
+            allowed, retry_after = limiter.allow(identity())
+            if not allowed:
+                response = jsonify({"status": "error", "message": "請求過於頻繁，請稍後再試"})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response
+
+        if shedder is not None and request.path not in long_lived:
+            if not shedder.enter():
+                response = jsonify({"status": "error", "message": "伺服器忙碌中，請稍後再試"})
+                response.status_code = 503
+                response.headers['Retry-After'] = '1'
+                return response
+            g.admitted = True
+        return None
+
+    @app.teardown_request
+    def _release_admission(exc):
+        if g.pop('admitted', False):
+            shedder.leave()
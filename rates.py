@@ -0,0 +1,323 @@
+"""房價引擎：把房價規則預先編譯成每間房每晚的房價與累計和
+
+nightly_rates 的 cumulative 為該房間從第一筆帳列起到當晚（含）的房價累計，
+住宿總價 = cumulative(退房前一晚) - cumulative(入住當晚) + rate(入住當晚)，
+一次主鍵查詢即可，查詢路徑上不必逐晚套用規則。規則或房間底價變更時只重新
+編譯受影響的房間與日期區間，之後的累計和整段平移。
+
+規則種類：
+- weekday：指定星期幾的晚上（0=週一 ... 6=週日，週末通常是 4,5 即週五、週六晚）
+- season：指定日期區間的晚上
+- length_of_stay：住滿 min_nights 晚時整筆總價加減成（取符合的最長門檻）
+weekday / season 都可同時限定日期區間與星期，依 priority、id 順序逐條套用：
+房價 = 房價 * (100 + percent) / 100 + amount。
+"""
+import dates
+
+NIGHTLY_KINDS = ('weekday', 'season')
+LENGTH_OF_STAY = 'length_of_stay'
+KINDS = NIGHTLY_KINDS + (LENGTH_OF_STAY,)
+
+# 1970-01-01 是星期四
+_EPOCH_WEEKDAY = 3
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS rate_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        kind TEXT NOT NULL,  -- weekday, season, length_of_stay
+        room_id INTEGER,     -- 只套用在這間房（NULL 表示不限）
+        room_type TEXT,      -- 只套用在這個房型（NULL 表示不限）
+        weekdays TEXT,       -- 套用的星期，以逗號分隔（0=週一 ... 6=週日）
+        start_date DATE,     -- 生效的第一晚（NULL 表示不限）
+        end_date DATE,       -- 生效的最後一晚的隔天（NULL 表示不限）
+        start_day INTEGER,
+        end_day INTEGER,
+        min_nights INTEGER,  -- length_of_stay：住滿幾晚才套用
+        percent REAL NOT NULL DEFAULT 0,    -- 加減成（+20 表示加價 20%）
+        amount INTEGER NOT NULL DEFAULT 0,  -- 每晚加減金額（length_of_stay 不使用）
+        priority INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS nightly_rates (
+        room_id INTEGER NOT NULL,
+        night INTEGER NOT NULL,      -- 整數天數
+        rate INTEGER NOT NULL,       -- 當晚房價
+        cumulative INTEGER NOT NULL, -- 到當晚為止的房價累計
+        PRIMARY KEY (room_id, night)
+    ) WITHOUT ROWID;
+'''
+
+RULE_COLUMNS = ('id', 'name', 'kind', 'room_id', 'room_type', 'weekdays', 'start_date', 'end_date',
+                'start_day', 'end_day', 'min_nights', 'percent', 'amount', 'priority')
+
+STAY_TOTALS_CHUNK = 500
+
+
+def install(c):
+    """建立房價規則表與每晚房價表"""
+    c.executescript(SCHEMA)
+
+
+def rule_values(data):
+    """驗證並整理房價規則欄位，格式錯誤時拋出 ValueError"""
+    kind = data.get('kind')
+    if kind not in KINDS:
+        raise ValueError(f"kind 必須是 {', '.join(KINDS)} 之一")
+    if not str(data.get('name', '')).strip():
+        raise ValueError("規則名稱不能為空")
+
+    values = {
+        'name': str(data['name']).strip(),
+        'kind': kind,
+        'room_id': data.get('room_id'),
+        'room_type': data.get('room_type'),
+        'weekdays': None,
+        'start_date': data.get('start_date'),
+        'end_date': data.get('end_date'),
+        'start_day': None,
+        'end_day': None,
+        'min_nights': None,
+        'percent': data.get('percent', 0),
+        'amount': data.get('amount', 0),
+        'priority': data.get('priority', 0)
+    }
+    if not isinstance(values['percent'], (int, float)) or values['percent'] <= -100:
+        raise ValueError("percent 必須是大於 -100 的數字")
+    if not isinstance(values['amount'], int) or not isinstance(values['priority'], int):
+        raise ValueError("amount 與 priority 必須是整數")
+
+    if values['start_date'] is not None:
+        values['start_day'] = dates.parse_day(values['start_date'])
+    if values['end_date'] is not None:
+        values['end_day'] = dates.parse_day(values['end_date'])
+    if values['start_day'] is not None and values['end_day'] is not None \
+            and values['end_day'] <= values['start_day']:
+        raise ValueError("end_date 必須晚於 start_date")
+
+    weekdays = data.get('weekdays')
+    if weekdays is not None:
+        if isinstance(weekdays, str):
+            weekdays = [part for part in weekdays.split(',') if part.strip()]
+        try:
+            weekdays = sorted({int(day) for day in weekdays})
+        except (TypeError, ValueError):
+            raise ValueError("weekdays 必須是 0-6 的整數")
+        if not weekdays or weekdays[0] < 0 or weekdays[-1] > 6:
+            raise ValueError("weekdays 必須是 0-6 的整數")
+        values['weekdays'] = ','.join(str(day) for day in weekdays)
+
+    if kind == 'weekday' and values['weekdays'] is None:
+        raise ValueError("weekday 規則需要 weekdays")
+    if kind == 'season' and (values['start_day'] is None or values['end_day'] is None):
+        raise ValueError("season 規則需要 start_date 與 end_date")
+    if kind == LENGTH_OF_STAY:
+        min_nights = data.get('min_nights')
+        if not isinstance(min_nights, int) or min_nights < 1:
+            raise ValueError("length_of_stay 規則需要正整數 min_nights")
+        values['min_nights'] = min_nights
+        values['amount'] = 0
+    return values
+
+
+def load_rules(conn, kinds=NIGHTLY_KINDS):
+    """依套用順序載入規則（weekdays 轉為 frozenset）"""
+    rows = conn.execute(f'''
+        SELECT {', '.join(RULE_COLUMNS)} FROM rate_rules
+        WHERE kind IN ({','.join('?' * len(kinds))})
+        ORDER BY priority, id
+    ''', kinds).fetchall()
+    rules = []
+    for row in rows:
+        rule = dict(zip(RULE_COLUMNS, row))
+        rule['weekdays'] = frozenset(int(day) for day in rule['weekdays'].split(',')) \
+            if rule['weekdays'] else None
+        rules.append(rule)
+    return rules
+
+
+def _room_type(room):
+    return room['room_type'] if 'room_type' in room.keys() else None
+
+
+def _rules_for(rules, room):
+    room_type = _room_type(room)
+    return [rule for rule in rules
+            if (rule['room_id'] is None or rule['room_id'] == room['id'])
+            and (rule['room_type'] is None or rule['room_type'] == room_type)]
+
+
+def nightly_rate(base, rules, night):
+    """套用（已篩選到該房間的）規則計算單晚房價"""
+    weekday = (night + _EPOCH_WEEKDAY) % 7
+    rate = base
+    for rule in rules:
+        if rule['start_day'] is not None and night < rule['start_day']:
+            continue
+        if rule['end_day'] is not None and night >= rule['end_day']:
+            continue
+        if rule['weekdays'] is not None and weekday not in rule['weekdays']:
+            continue
+        rate = rate * (100 + rule['percent']) / 100 + rule['amount']
+    return max(int(round(rate)), 0)
+
+
+def _load_rooms(conn, room_ids=None, room_type=None):
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(rooms)').fetchall()}
+    type_column = 'room_type' if 'room_type' in columns else 'NULL'
+    query = f'SELECT id, price, {type_column} FROM rooms WHERE 1=1'
+    params = []
+    if room_ids is not None:
+        query += f' AND id IN ({",".join("?" * len(room_ids))})'
+        params.extend(room_ids)
+    if room_type is not None:
+        query += f' AND {type_column} = ?'
+        params.append(room_type)
+    return [{'id': row[0], 'price': row[1], 'room_type': row[2]}
+            for row in conn.execute(query, params).fetchall()]
+
+
+def extend(conn, until_day, room_ids=None):
+    """把每間房的每晚房價往後編譯到 until_day（不含），尚未編譯的房間從今天開始"""
+    rules = load_rules(conn)
+    today = dates.today_day()
+    for room in _load_rooms(conn, room_ids):
+        last = conn.execute('''
+            SELECT night, cumulative FROM nightly_rates
+            WHERE room_id = ? ORDER BY night DESC LIMIT 1
+        ''', (room['id'],)).fetchone()
+        start, cumulative = (today, 0) if last is None else (last[0] + 1, last[1])
+        room_rules = _rules_for(rules, room)
+        rows = []
+        for night in range(start, until_day):
+            rate = nightly_rate(room['price'], room_rules, night)
+            cumulative += rate
+            rows.append((room['id'], night, rate, cumulative))
+        conn.executemany('''
+            INSERT INTO nightly_rates (room_id, night, rate, cumulative) VALUES (?, ?, ?, ?)
+        ''', rows)
+
+
+def recompile(conn, room_ids=None, room_type=None, start_day=None, end_day=None):
+    """重新編譯已編譯範圍內 [start_day, end_day) 的房價，之後的累計和整段平移"""
+    rules = load_rules(conn)
+    for room in _load_rooms(conn, room_ids, room_type):
+        first, last = conn.execute('''
+            SELECT MIN(night), MAX(night) FROM nightly_rates WHERE room_id = ?
+        ''', (room['id'],)).fetchone()
+        if first is None:
+            continue
+        start = first if start_day is None else max(start_day, first)
+        end = last + 1 if end_day is None else min(end_day, last + 1)
+        if start >= end:
+            continue
+
+        old = conn.execute('''
+            SELECT rate, cumulative FROM nightly_rates
+            WHERE room_id = ? AND night IN (?, ?)
+            ORDER BY night
+        ''', (room['id'], start, end - 1)).fetchall()
+        cumulative = old[0][1] - old[0][0]
+        room_rules = _rules_for(rules, room)
+        rows = []
+        for night in range(start, end):
+            rate = nightly_rate(room['price'], room_rules, night)
+            cumulative += rate
+            rows.append((rate, cumulative, room['id'], night))
+        conn.executemany('''
+            UPDATE nightly_rates SET rate = ?, cumulative = ? WHERE room_id = ? AND night = ?
+        ''', rows)
+
+        delta = cumulative - old[-1][1]
+        if delta:
+            conn.execute('''
+                UPDATE nightly_rates SET cumulative = cumulative + ? WHERE room_id = ? AND night >= ?
+            ''', (delta, room['id'], end))
+
+
+def recompile_rule(conn, rule):
+    """規則新增、修改或刪除後，只重新編譯該規則涵蓋的房間與日期區間"""
+    if rule['kind'] == LENGTH_OF_STAY:
+        return
+    room_ids = None if rule['room_id'] is None else [rule['room_id']]
+    recompile(conn, room_ids, rule['room_type'], rule['start_day'], rule['end_day'])
+
+
+def remove(conn, room_id):
+    conn.execute('DELETE FROM nightly_rates WHERE room_id = ?', (room_id,))
+
+
+def _length_of_stay(total, rules, room, nights):
+    best = None
+    for rule in _rules_for(rules, room):
+        if rule['min_nights'] <= nights and (best is None or rule['min_nights'] > best['min_nights']):
+            best = rule
+    if best is None:
+        return total
+    return max(int(round(total * (100 + best['percent']) / 100)), 0)
+
+
+class PriceTable:
+    """多間房 × 多段住宿的總價查表
+
+    只查出每段住宿入住當晚與退房前一晚的累計和（每間房每段住宿兩列），
+    之後每一格總價都是常數時間的查表；超出已編譯範圍的格子才逐晚套用規則。
+    """
+
+    def __init__(self, conn, rooms, stays):
+        self.conn = conn
+        self._compiled = {}
+        self._nightly_rules = None
+        self._los_rules = load_rules(conn, (LENGTH_OF_STAY,))
+
+        nights = sorted({night for check_in_day, check_out_day in stays
+                         for night in (check_in_day, check_out_day - 1)})
+        ids = [room['id'] for room in rooms]
+        for start in range(0, len(ids), STAY_TOTALS_CHUNK):
+            chunk = ids[start:start + STAY_TOTALS_CHUNK]
+            rows = conn.execute(f'''
+                SELECT room_id, night, rate, cumulative FROM nightly_rates
+                WHERE room_id IN ({','.join('?' * len(chunk))})
+                AND night IN ({','.join('?' * len(nights))})
+            ''', chunk + nights).fetchall()
+            for row in rows:
+                self._compiled[(row[0], row[1])] = (row[2], row[3])
+
+    def total(self, room, check_in_day, check_out_day):
+        first = self._compiled.get((room['id'], check_in_day))
+        last = self._compiled.get((room['id'], check_out_day - 1))
+        if first is not None and last is not None:
+            total = last[1] - first[1] + first[0]
+        else:
+            if self._nightly_rules is None:
+                self._nightly_rules = load_rules(self.conn)
+            room_rules = _rules_for(self._nightly_rules, room)
+            total = sum(nightly_rate(room['price'], room_rules, night)
+                        for night in range(check_in_day, check_out_day))
+        return _length_of_stay(total, self._los_rules, room, check_out_day - check_in_day)
+
+
+def stay_totals(conn, rooms, check_in_day, check_out_day):
+    """多間房同一段住宿的總價 {room_id: 總價}"""
+    table = PriceTable(conn, rooms, [(check_in_day, check_out_day)])
+    return {room['id']: table.total(room, check_in_day, check_out_day) for room in rooms}
+
+
+def stay_total(conn, room, check_in_day, check_out_day):
+    """單間房的住宿總價"""
+    return stay_totals(conn, [room], check_in_day, check_out_day)[room['id']]
+
+
+def calendar(conn, room, start_day, end_day):
+    """單間房每晚房價 [(night, rate), ...]（未編譯的夜晚直接套用規則）"""
+    compiled = dict(conn.execute('''
+        SELECT night, rate FROM nightly_rates WHERE room_id = ? AND night >= ? AND night < ?
+    ''', (room['id'], start_day, end_day)).fetchall())
+    if len(compiled) < end_day - start_day:
+        room_rules = _rules_for(load_rules(conn), room)
+        for night in range(start_day, end_day):
+            if night not in compiled:
+                compiled[night] = nightly_rate(room['price'], room_rules, night)
+    return sorted(compiled.items())
@@ -0,0 +1,89 @@
+"""讀取複本：以 SQLite 線上備份 API 定期把主資料庫複製成唯讀複本檔
+
+每次更新先備份到暫存檔（每步複製少量頁面，步與步之間讓出鎖給寫入端），
+改成 rollback journal 模式後以 os.replace() 原子地取代複本檔。已開啟的唯讀
+連線繼續讀舊檔（等同一份快照），連線池發現檔案換新（inode 不同）後才重開。
+多個 worker 共用同一個複本檔，以檔案鎖確保同一時間只有一個行程在更新。
+"""
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def backup_to(source, target, pages=256, sleep=0.005):
+    """以線上備份 API 把 source 複製成 target（先寫暫存檔，完成後才取代）"""
+    tmp = f'{target}.tmp'
+    src = sqlite3.connect(source, timeout=30)
+    dst = sqlite3.connect(tmp)
+    try:
+        src.backup(dst, pages=pages, sleep=sleep)
+        # 複本只供唯讀，不需要 -wal / -shm 檔
+        dst.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp, target)
+
+
+class ReplicaRefresher:
+    """每 interval 秒更新一次複本檔"""
+
+    def __init__(self, source, replica, interval=5, pages=256):
+        self.source = source
+        self.replica = replica
+        self.interval = interval
+        self.pages = pages
+        self.refreshes = 0
+        self._thread = None
+
+    def generation(self):
+        """複本檔目前的版本（檔案被取代後 inode 會改變）"""
+        try:
+            return os.stat(self.replica).st_ino
+        except FileNotFoundError:
+            return None
+
+    def age(self):
+        """複本檔距離上次更新的秒數（不存在時為 None）"""
+        try:
+            return time.time() - os.stat(self.replica).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def refresh(self, force=False):
+        """更新複本；其他行程正在更新或複本還夠新時略過，回傳是否有更新"""
+        with open(f'{self.replica}.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                age = self.age()
+                if not force and age is not None and age < self.interval:
+                    return False
+                backup_to(self.source, self.replica, self.pages)
+                self.refreshes += 1
+                return True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def start(self):
+        """確保複本存在，並啟動背景更新執行緒"""
+        if self.age() is None:
+            self.refresh(force=True)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='replica-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"更新讀取複本失敗: {e}")
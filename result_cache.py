@@ -0,0 +1,97 @@
+"""短 TTL 結果快取：以時間區間對齊過期時間，過期後在 stale 期間內先回舊值並於背景更新"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HIT = 'HIT'
+STALE = 'STALE'
+MISS = 'MISS'
+BYPASS = 'BYPASS'
+
+
+class ResultCache:
+    """單一行程內的結果快取
+
+    過期時間對齊到 ttl 的整數倍（例如 ttl=10 時在每個 10 秒區間結束時過期），
+    所有 worker 會在相同的時間點更新。過期後的 stale 秒內仍回傳舊值，
+    同一個 key 同時只會有一個背景執行緒重新計算。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._refreshing = set()
+        self._counts = {HIT: 0, STALE: 0, MISS: 0, BYPASS: 0}
+
+    def get_or_compute(self, key, fn, ttl, stale=0, force=False, should_cache=None):
+        """取得 key 的快取值，必要時呼叫 fn() 計算，回傳 (值, 快取狀態)
+
+        force=True 時略過快取直接重新計算；should_cache(value) 為 False 的結果不會存入快取。
+        """
+        now = time.time()
+        entry = None if force else self._entries.get(key)
+        if entry is not None:
+            value, expires_at, stale_until = entry
+            if now < expires_at:
+                self._count(HIT)
+                return value, HIT
+            if now < stale_until:
+                self._refresh_async(key, fn, ttl, stale, should_cache)
+                self._count(STALE)
+                return value, STALE
+
+        value = fn()
+        self._store(key, value, ttl, stale, should_cache)
+        state = BYPASS if force else MISS
+        self._count(state)
+        return value, state
+
+    def peek(self, key):
+        """取得 key 目前的快取值（包含已過期的舊值），不會觸發計算"""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def invalidate(self, key=None):
+        """清除指定 key（或全部）的快取"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            counts = {state.lower(): n for state, n in self._counts.items()}
+            counts['entries'] = len(self._entries)
+            return counts
+
+    def _count(self, state):
+        with self._lock:
+            self._counts[state] += 1
+
+    def _store(self, key, value, ttl, stale, should_cache):
+        if should_cache is not None and not should_cache(value):
+            return
+        now = time.time()
+        expires_at = (int(now // ttl) + 1) * ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at, expires_at + stale)
+
+    def _refresh_async(self, key, fn, ttl, stale, should_cache):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, fn(), ttl, stale, should_cache)
+            except Exception as e:
+                logger.error(f"背景更新快取失敗 {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='cache-refresh', daemon=True).start()
@@ -0,0 +1,111 @@
+"""多館別分片：每個館別（property）使用自己的 SQLite 檔案
+
+預設館別沿用原本的資料庫檔，其他館別的檔案放在 directory 下（{property_id}.db）。
+每個分片各自有連線池與寫入佇列，不同館別的寫入不會互相排隊，寫入量隨館別數擴充。
+跨館別的管理查詢以 fan_out() 在執行緒池中對每個分片各跑一次，再由呼叫端合併。
+
+新館別的資料庫檔只為設定中列出的館別或 create() 建立；請求帶入未知館別不會自動建檔。
+"""
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PROPERTY_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class Shard:
+    """單一館別的資料庫檔與連線資源（由 ShardRouter 的 open_shard 填入）"""
+
+    def __init__(self, property_id, database):
+        self.property_id = property_id
+        self.database = database
+        self.pool = None
+        self.read_pool = None
+        self.write_queue = None
+        self.holds = None
+        self.lock = threading.Lock()
+
+
+class ShardRouter:
+    """館別 -> 分片
+
+    open_shard(shard) 負責初始化資料庫（CREATE ... IF NOT EXISTS，可重複執行）
+    並設定 shard.pool / shard.read_pool。
+    """
+
+    def __init__(self, default_property, default_database, directory, open_shard,
+                 properties=(), max_workers=8):
+        self.default_property = default_property
+        self.default_database = default_database
+        self.directory = directory
+        self.open_shard = open_shard
+        self.max_workers = max_workers
+        self._configured = set(properties)
+        self._shards = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @staticmethod
+    def is_valid(property_id):
+        return bool(PROPERTY_ID_PATTERN.match(property_id or ''))
+
+    def database_for(self, property_id):
+        if property_id == self.default_property:
+            return self.default_database
+        return os.path.join(self.directory, f'{property_id}.db')
+
+    def properties(self):
+        """所有已知館別：預設館別、設定中列出的館別與分片目錄下已有的檔案"""
+        found = {self.default_property} | self._configured
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                property_id, ext = os.path.splitext(name)
+                if ext == '.db' and self.is_valid(property_id):
+                    found.add(property_id)
+        return sorted(found)
+
+    def exists(self, property_id):
+        return (property_id == self.default_property or property_id in self._configured
+                or os.path.exists(self.database_for(property_id)))
+
+    def get(self, property_id=None):
+        """取得館別的分片（第一次使用時開啟），未知館別拋出 KeyError"""
+        property_id = property_id or self.default_property
+        shard = self._shards.get(property_id)
+        if shard is not None:
+            return shard
+        if not self.is_valid(property_id) or not self.exists(property_id):
+            raise KeyError(property_id)
+        return self._open(property_id)
+
+    def create(self, property_id):
+        """新建館別（資料庫檔已存在時只做初始化）"""
+        if not self.is_valid(property_id):
+            raise ValueError("館別代碼只能包含英數字、底線與連字號（最多 64 字）")
+        self._configured.add(property_id)
+        return self._open(property_id)
+
+    def _open(self, property_id):
+        with self._lock:
+            shard = self._shards.get(property_id)
+            if shard is None:
+                if property_id != self.default_property:
+                    os.makedirs(self.directory, exist_ok=True)
+                shard = Shard(property_id, self.database_for(property_id))
+                self.open_shard(shard)
+                self._shards[property_id] = shard
+            return shard
+
+    def fan_out(self, fn, property_ids=None):
+        """在執行緒池中對每個館別呼叫 fn(shard)，回傳 {property_id: 結果}（依館別排序）"""
+        property_ids = property_ids or self.properties()
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # 延遲建立（在 gunicorn fork 之後才啟動執行緒）
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='shard-fan-out')
+        shards = [self.get(property_id) for property_id in property_ids]
+        futures = {shard.property_id: self._executor.submit(fn, shard) for shard in shards}
+        return {property_id: futures[property_id].result() for property_id in sorted(futures)}
@@ -0,0 +1,998 @@
+"""資料存取層：房間、訂單與統計的存取介面，可選擇 SQLite 或記憶體引擎
+
+路由只呼叫 Storage 的方法，不直接寫 SQL；引擎由設定 STORAGE_ENGINE 選擇：
+- sqlite：原本的 SQLite 資料庫（連線池、預先編譯的每晚房價、整數天數欄位）
+- memory：資料只放在行程記憶體中，以 dict 與排序好的串列建立索引，完全不讀寫
+  磁碟，可用來和 SQLite 比較基準測試，或讓整合測試不必建立資料庫檔
+
+兩個引擎回傳的資料格式相同（dict，欄位與 test_db.py 的資料表相同），列表與
+單筆查詢可帶 query_builder.FieldShape，SQLite 只查詢需要的欄位。記憶體引擎沒有
+房價規則（總價 = 底價 × 晚數），資料不會保存，也不在多個 worker 之間共用。
+
+格式或狀態錯誤（房間不可預訂、日期衝突）以 ValueError 回報，訊息可直接回給用戶端。
+
+正式服務（app.py）的資料表不同，房間、訂單與統計的讀取走 HotelStorage（HotelSQLiteStorage
+依館別與讀取路徑建立，已封存的訂單也在這裡合併）。
+"""
+import bisect
+import heapq
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import archive
+import dates
+import query_builder
+import quotes
+import rates
+
+ENGINES = ('sqlite', 'memory')
+
+# 佔用房間的訂單狀態
+BLOCKING_STATUSES = ('confirmed', 'checked_in')
+
+ROOM_COLUMNS = ('id', 'name', 'price', 'description', 'capacity', 'amenities', 'images',
+                'available', 'featured', 'rating', 'created_at')
+
+BOOKING_COLUMNS = ('id', 'room_id', 'guest_name', 'guest_email', 'guest_phone', 'check_in', 'check_out',
+                   'check_in_day', 'check_out_day', 'guests', 'total_price', 'status', 'payment_method',
+                   'special_requests', 'created_at')
+
+ROOM_SORT_COLUMNS = ('price', 'rating', 'name', 'created_at')
+
+# 稀疏欄位：?fields=summary|card|full 或 ?fields=id,name,price，SQL 也只查詢這些欄位
+ROOM_FIELDS = query_builder.Fieldset(
+    {name: name for name in ROOM_COLUMNS},
+    {
+        'summary': ('id', 'name', 'price', 'capacity', 'available', 'rating'),
+        'card': ('id', 'name', 'price', 'capacity', 'available', 'featured', 'rating', 'amenities', 'images'),
+        'full': ROOM_COLUMNS
+    },
+    derived={
+        # 解析 JSON 欄位
+        'amenities': (lambda room: eval(room['amenities'] or '[]'), 'amenities'),
+        'images': (lambda room: eval(room['images'] or '[]'), 'images')
+    },
+    # 計算住宿總價需要 price
+    required=('id', 'price')
+)
+
+BOOKING_FIELDS = query_builder.Fieldset(
+    dict({name: f'b.{name}' for name in BOOKING_COLUMNS}, room_name='r.name', room_price='r.price'),
+    {
+        'summary': ('id', 'room_id', 'room_name', 'guest_name', 'check_in', 'check_out', 'total_price', 'status'),
+        'card': ('id', 'room_id', 'room_name', 'room_price', 'guest_name', 'guest_email', 'guest_phone',
+                 'check_in', 'check_out', 'guests', 'total_price', 'status', 'created_at'),
+        'full': BOOKING_COLUMNS + ('room_name', 'room_price')
+    }
+)
+
+
+def _timestamp():
+    """與 SQLite 的 CURRENT_TIMESTAMP 相同格式（UTC）"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+def _contains(value, query):
+    """LIKE '%query%'（不分大小寫）"""
+    return value is not None and query.lower() in str(value).lower()
+
+
+def _room_values(data):
+    """新增房間的欄位值（未提供的欄位使用預設值）"""
+    return {
+        'name': data['name'],
+        'price': data['price'],
+        'description': data.get('description', ''),
+        'capacity': data.get('capacity', 2),
+        'amenities': str(data.get('amenities', [])),
+        'images': str(data.get('images', [])),
+        'available': data.get('available', 1),
+        'featured': data.get('featured', 0),
+        'rating': data.get('rating', 4.5)
+    }
+
+
+def _booking_values(data, check_in_day, check_out_day, total_price):
+    return {
+        'room_id': data['room_id'],
+        'guest_name': data['guest_name'],
+        'guest_email': data['guest_email'],
+        'guest_phone': data.get('guest_phone', ''),
+        'check_in': data['check_in'],
+        'check_out': data['check_out'],
+        'check_in_day': check_in_day,
+        'check_out_day': check_out_day,
+        'guests': data.get('guests', 1),
+        'total_price': total_price,
+        'status': data.get('status', 'confirmed'),
+        'payment_method': data.get('payment_method', 'credit_card'),
+        'special_requests': data.get('special_requests', '')
+    }
+
+
+class Storage(ABC):
+    """資料存取介面
+
+    room_filters 的鍵為 min_price、max_price、capacity、featured、available，
+    booking_filters 的鍵為 status、guest_email（部分比對）、start_date、end_date，
+    值為 None 的條件不啟用。shape 為 None 時回傳所有欄位。
+    """
+
+    engine = None
+
+    @abstractmethod
+    def counts(self):
+        """(房間數, 訂單數)"""
+
+    @abstractmethod
+    def list_rooms(self, filters, sort_by='price', descending=False, limit=None, offset=0, shape=None):
+        """符合篩選的房間（分頁），回傳 (房間列表, 不分頁的總數)"""
+
+    @abstractmethod
+    def get_room(self, room_id, shape=None):
+        """單一房間，不存在時回傳 None"""
+
+    @abstractmethod
+    def available_rooms(self, check_in_day, check_out_day, guests=1, shape=None):
+        """開放預訂、容納得下 guests 人且住宿期間沒有佔用訂單的房間"""
+
+    @abstractmethod
+    def stay_totals(self, rooms, check_in_day, check_out_day):
+        """多間房同一段住宿的總價 {room_id: 總價}"""
+
+    @abstractmethod
+    def create_room(self, data):
+        """新增房間，回傳新房間"""
+
+    @abstractmethod
+    def room_available(self, room_id, check_in_day, check_out_day):
+        """房間在住宿期間是否可訂；房間不存在或不開放預訂時回傳 None"""
+
+    @abstractmethod
+    def create_booking(self, data, check_in_day, check_out_day):
+        """檢查衝突並新增訂單（同一個交易），回傳含 room_name / room_price 的新訂單
+
+        房間不可預訂或日期衝突時拋出 ValueError。
+        """
+
+    @abstractmethod
+    def list_bookings(self, filters, limit=None, offset=0, shape=None):
+        """符合篩選的訂單（依建立時間新到舊、分頁），回傳 (訂單列表, 不分頁的總數)"""
+
+    @abstractmethod
+    def quote_rooms(self, room_ids=None):
+        """報價用的房間（id、name、price、capacity、available），room_ids 為 None 表示全部"""
+
+    @abstractmethod
+    def quote_matrix(self, rooms, stays):
+        """rooms × stays 的報價矩陣（格式同 quotes.quote_matrix）"""
+
+    @abstractmethod
+    def stats(self):
+        """{"rooms": ..., "bookings": ..., "recent_bookings": [...], "popular_rooms": [...]}"""
+
+    @abstractmethod
+    def search(self, query, limit=10):
+        """名稱或說明符合的房間、住客姓名 / email 或編號符合的訂單，回傳 (房間列表, 訂單列表)"""
+
+
+# 列表端點的查詢樣板（每種篩選與欄位組合只產生一次 SQL 與對應的 COUNT 查詢）
+ROOMS_QUERY = query_builder.FilterQuery(
+    'SELECT {columns} FROM rooms WHERE 1=1',
+    'SELECT COUNT(*) FROM rooms WHERE 1=1',
+    {
+        'min_price': 'price >= ?',
+        'max_price': 'price <= ?',
+        'capacity': 'capacity >= ?',
+        'featured': 'featured = ?',
+        'available': 'available = ?'
+    },
+    paginate=True
+)
+
+BOOKINGS_QUERY = query_builder.FilterQuery(
+    '''
+        SELECT {columns}
+        FROM bookings b
+        JOIN rooms r ON b.room_id = r.id
+        WHERE 1=1
+    ''',
+    'SELECT COUNT(*) FROM bookings b JOIN rooms r ON b.room_id = r.id WHERE 1=1',
+    {
+        'status': 'b.status = ?',
+        'guest_email': 'b.guest_email LIKE ?',
+        'start_date': 'b.check_in >= ?',
+        'end_date': 'b.check_out <= ?'
+    },
+    paginate=True
+)
+
+BLOCKING_SQL = f"status IN ({', '.join(repr(status) for status in BLOCKING_STATUSES)})"
+
+
+class SQLiteStorage(Storage):
+    """SQLite 引擎（資料表由 test_db.init_db 建立），pool 為 db_pool.ConnectionPool"""
+
+    engine = 'sqlite'
+
+    def __init__(self, pool, rate_horizon_days=365):
+        self.pool = pool
+        self.rate_horizon_days = rate_horizon_days
+
+    def counts(self):
+        with self.pool.connection() as conn:
+            return (conn.execute('SELECT COUNT(*) FROM rooms').fetchone()[0],
+                    conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0])
+
+    def list_rooms(self, filters, sort_by='price', descending=False, limit=None, offset=0, shape=None):
+        sort_by = sort_by if sort_by in ROOM_SORT_COLUMNS else 'price'
+        columns = ROOM_FIELDS.select(shape) if shape else '*'
+        query, params, count_query, count_params = ROOMS_QUERY.build(
+            filters, f'{sort_by} {"DESC" if descending else "ASC"}', limit, offset, columns)
+        with self.pool.connection() as conn:
+            rooms = conn.execute(query, params).fetchall()
+            total = conn.execute(count_query, count_params).fetchone()[0]
+        return [dict(room) for room in rooms], total
+
+    def get_room(self, room_id, shape=None):
+        columns = ROOM_FIELDS.select(shape) if shape else '*'
+        with self.pool.connection() as conn:
+            room = conn.execute(f'SELECT {columns} FROM rooms WHERE id = ?', (room_id,)).fetchone()
+        return dict(room) if room else None
+
+    def available_rooms(self, check_in_day, check_out_day, guests=1, shape=None):
+        columns = ROOM_FIELDS.select(shape) if shape else '*'
+        with self.pool.connection() as conn:
+            rooms = conn.execute(f'''
+                SELECT {columns} FROM rooms
+                WHERE available = 1 AND capacity >= ?
+                AND id NOT IN (
+                    SELECT room_id FROM bookings
+                    WHERE {BLOCKING_SQL} AND check_in_day < ? AND check_out_day > ?
+                )
+            ''', (guests, check_out_day, check_in_day)).fetchall()
+        return [dict(room) for room in rooms]
+
+    def stay_totals(self, rooms, check_in_day, check_out_day):
+        with self.pool.connection() as conn:
+            return rates.stay_totals(conn, rooms, check_in_day, check_out_day)
+
+    def create_room(self, data):
+        values = _room_values(data)
+        with self.pool.connection() as conn:
+            cursor = conn.execute(f'''
+                INSERT INTO rooms ({", ".join(values)}) VALUES ({", ".join("?" * len(values))})
+            ''', list(values.values()))
+            room_id = cursor.lastrowid
+            rates.extend(conn, dates.today_day() + self.rate_horizon_days, [room_id])
+            conn.commit()
+            return dict(conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone())
+
+    def _room_conflicts(self, conn, room_id, check_in_day, check_out_day):
+        return conn.execute(f'''
+            SELECT COUNT(*) FROM bookings
+            WHERE room_id = ? AND {BLOCKING_SQL}
+            AND check_in_day < ? AND check_out_day > ?
+        ''', (room_id, check_out_day, check_in_day)).fetchone()[0]
+
+    def room_available(self, room_id, check_in_day, check_out_day):
+        with self.pool.connection() as conn:
+            if conn.execute('SELECT 1 FROM rooms WHERE id = ? AND available = 1', (room_id,)).fetchone() is None:
+                return None
+            return self._room_conflicts(conn, room_id, check_in_day, check_out_day) == 0
+
+    def create_booking(self, data, check_in_day, check_out_day):
+        with self.pool.connection() as conn:
+            # 先取得寫入鎖，衝突檢查與新增之間不會有其他寫入插隊
+            conn.execute('BEGIN IMMEDIATE')
+            room = conn.execute('SELECT * FROM rooms WHERE id = ? AND available = 1',
+                                (data['room_id'],)).fetchone()
+            if room is None:
+                error = "房間不存在或不可預訂"
+            elif self._room_conflicts(conn, data['room_id'], check_in_day, check_out_day) > 0:
+                error = "該日期房間已被預訂"
+            else:
+                error = None
+
+            if error:
+                # 在連線歸還前結束交易（在 with 區塊內拋出例外會讓連線池關閉這條連線）
+                conn.rollback()
+                booking = None
+            else:
+                total_price = rates.stay_total(conn, room, check_in_day, check_out_day)
+                values = _booking_values(data, check_in_day, check_out_day, total_price)
+                cursor = conn.execute(f'''
+                    INSERT INTO bookings ({", ".join(values)}) VALUES ({", ".join("?" * len(values))})
+                ''', list(values.values()))
+                conn.commit()
+
+                booking = conn.execute('''
+                    SELECT b.*, r.name as room_name, r.price as room_price
+                    FROM bookings b
+                    JOIN rooms r ON b.room_id = r.id
+                    WHERE b.id = ?
+                ''', (cursor.lastrowid,)).fetchone()
+        if error:
+            raise ValueError(error)
+        return dict(booking)
+
+    def list_bookings(self, filters, limit=None, offset=0, shape=None):
+        columns = BOOKING_FIELDS.select(shape) if shape else 'b.*, r.name as room_name, r.price as room_price'
+        filters = dict(filters)
+        if filters.get('guest_email'):
+            filters['guest_email'] = f"%{filters['guest_email']}%"
+        query, params, count_query, count_params = BOOKINGS_QUERY.build(
+            filters, 'b.created_at DESC, b.id DESC', limit, offset, columns)
+        with self.pool.connection() as conn:
+            bookings = conn.execute(query, params).fetchall()
+            total = conn.execute(count_query, count_params).fetchone()[0]
+        return [dict(booking) for booking in bookings], total
+
+    def quote_rooms(self, room_ids=None):
+        with self.pool.connection() as conn:
+            if room_ids is None:
+                rooms = conn.execute('SELECT id, name, price, capacity, available FROM rooms ORDER BY id').fetchall()
+            else:
+                rooms = conn.execute(f'''
+                    SELECT id, name, price, capacity, available FROM rooms
+                    WHERE id IN ({",".join("?" * len(room_ids))}) ORDER BY id
+                ''', room_ids).fetchall() if room_ids else []
+        return [dict(room) for room in rooms]
+
+    def quote_matrix(self, rooms, stays):
+        if not rooms:
+            return {}
+        with self.pool.connection() as conn:
+            return quotes.quote_matrix(conn, rooms, stays, blocking=BLOCKING_SQL)
+
+    def stats(self):
+        with self.pool.connection() as conn:
+            room_stats = conn.execute('''
+                SELECT
+                    COUNT(*) as total_rooms,
+                    SUM(CASE WHEN available = 1 THEN 1 ELSE 0 END) as available_rooms,
+                    SUM(CASE WHEN featured = 1 THEN 1 ELSE 0 END) as featured_rooms,
+                    AVG(price) as avg_price,
+                    MAX(price) as max_price,
+                    MIN(price) as min_price,
+                    AVG(rating) as avg_rating
+                FROM rooms
+            ''').fetchone()
+
+            booking_stats = conn.execute('''
+                SELECT
+                    COUNT(*) as total_bookings,
+                    SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) as confirmed_bookings,
+                    SUM(CASE WHEN status = 'checked_in' THEN 1 ELSE 0 END) as checked_in_bookings,
+                    SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) as cancelled_bookings,
+                    SUM(total_price) as total_revenue,
+                    AVG(total_price) as avg_booking_price,
+                    MIN(created_at) as first_booking,
+                    MAX(created_at) as last_booking
+                FROM bookings
+            ''').fetchone()
+
+            recent_bookings = conn.execute('''
+                SELECT b.*, r.name as room_name
+                FROM bookings b
+                JOIN rooms r ON b.room_id = r.id
+                ORDER BY b.created_at DESC, b.id DESC
+                LIMIT 5
+            ''').fetchall()
+
+            popular_rooms = conn.execute('''
+                SELECT r.id, r.name, r.price, COUNT(b.id) as booking_count,
+                       SUM(b.total_price) as revenue
+                FROM rooms r
+                LEFT JOIN bookings b ON r.id = b.room_id
+                GROUP BY r.id
+                ORDER BY booking_count DESC, r.id
+                LIMIT 5
+            ''').fetchall()
+
+        return {
+            "rooms": dict(room_stats),
+            "bookings": dict(booking_stats),
+            "recent_bookings": [dict(booking) for booking in recent_bookings],
+            "popular_rooms": [dict(room) for room in popular_rooms]
+        }
+
+    def search(self, query, limit=10):
+        pattern = f'%{query}%'
+        with self.pool.connection() as conn:
+            rooms = conn.execute('''
+                SELECT * FROM rooms
+                WHERE name LIKE ? OR description LIKE ?
+                ORDER BY featured DESC, price ASC
+                LIMIT ?
+            ''', (pattern, pattern, limit)).fetchall()
+
+            bookings = conn.execute('''
+                SELECT b.*, r.name as room_name
+                FROM bookings b
+                JOIN rooms r ON b.room_id = r.id
+                WHERE b.guest_name LIKE ? OR b.guest_email LIKE ?
+                OR b.id = ?
+                ORDER BY b.created_at DESC, b.id DESC
+                LIMIT ?
+            ''', (pattern, pattern, query if query.isdigit() else 0, limit)).fetchall()
+        return [dict(room) for room in rooms], [dict(booking) for booking in bookings]
+
+
+class _RoomIntervals:
+    """單一房間佔用中的訂單區間，依入住日排序（新增時已檢查衝突，區間互不重疊）"""
+
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def overlaps(self, check_in_day, check_out_day):
+        # 入住日早於退房日的最後一筆訂單；區間不重疊，它的退房日就是最晚的
+        index = bisect.bisect_left(self.starts, check_out_day)
+        return index > 0 and self.ends[index - 1] > check_in_day
+
+    def add(self, check_in_day, check_out_day):
+        index = bisect.bisect_right(self.starts, check_in_day)
+        self.starts.insert(index, check_in_day)
+        self.ends.insert(index, check_out_day)
+
+
+class MemoryStorage(Storage):
+    """記憶體引擎：房間與訂單存成 dict，另外維護索引與統計
+
+    - 每間房佔用中訂單的排序區間：衝突檢查與可訂房間查詢為每間房一次二分搜尋
+    - 依狀態的訂單編號串列：狀態篩選不必掃描所有訂單
+    - 訂單數、營收、各狀態筆數與每間房的訂單數 / 營收隨寫入累加，統計不必掃描
+
+    訂單編號遞增且建立時間不會倒退，依編號倒序即為「新到舊」。
+    所有讀寫都持有同一把鎖（寫入很短，不會長時間阻擋讀取）。
+    """
+
+    engine = 'memory'
+
+    def __init__(self):
+        self._rooms = {}
+        self._bookings = {}
+        self._intervals = {}
+        self._by_status = {}
+        self._room_totals = {}
+        self._revenue = 0
+        self._next_room_id = 1
+        self._next_booking_id = 1
+        self._lock = threading.RLock()
+
+    def seed(self, rooms, bookings):
+        """載入初始資料（dict 列表，欄位同新增時的欄位；訂單的總價直接採用）"""
+        with self._lock:
+            for data in rooms:
+                self._insert_room(dict(_room_values(data), **data))
+            for data in bookings:
+                check_in_day = dates.parse_day(data['check_in'])
+                check_out_day = dates.parse_day(data['check_out'])
+                self._insert_booking(_booking_values(
+                    dict({'guest_phone': None, 'special_requests': None}, **data),
+                    check_in_day, check_out_day, data['total_price']))
+
+    def _insert_room(self, values):
+        room_id = self._next_room_id
+        self._next_room_id += 1
+        room = {name: values.get(name) for name in ROOM_COLUMNS}
+        room.update(id=room_id, created_at=_timestamp())
+        self._rooms[room_id] = room
+        self._room_totals[room_id] = [0, None]
+        return room
+
+    def _insert_booking(self, values):
+        booking_id = self._next_booking_id
+        self._next_booking_id += 1
+        booking = {name: values.get(name) for name in BOOKING_COLUMNS}
+        booking.update(id=booking_id, created_at=_timestamp())
+        self._bookings[booking_id] = booking
+
+        self._by_status.setdefault(booking['status'], []).append(booking_id)
+        if booking['status'] in BLOCKING_STATUSES:
+            self._intervals.setdefault(booking['room_id'], _RoomIntervals()).add(
+                booking['check_in_day'], booking['check_out_day'])
+        totals = self._room_totals.get(booking['room_id'])
+        if totals is not None:
+            totals[0] += 1
+            totals[1] = (totals[1] or 0) + booking['total_price']
+        self._revenue += booking['total_price']
+        return booking
+
+    def _is_free(self, room_id, check_in_day, check_out_day):
+        intervals = self._intervals.get(room_id)
+        return intervals is None or not intervals.overlaps(check_in_day, check_out_day)
+
+    def _joined(self, booking, with_price=True):
+        room = self._rooms[booking['room_id']]
+        if with_price:
+            return dict(booking, room_name=room['name'], room_price=room['price'])
+        return dict(booking, room_name=room['name'])
+
+    @staticmethod
+    def _page(rows, limit, offset):
+        offset = max(offset or 0, 0)
+        return rows[offset:] if limit is None or limit < 0 else rows[offset:offset + limit]
+
+    def counts(self):
+        with self._lock:
+            return len(self._rooms), len(self._bookings)
+
+    def list_rooms(self, filters, sort_by='price', descending=False, limit=None, offset=0, shape=None):
+        sort_by = sort_by if sort_by in ROOM_SORT_COLUMNS else 'price'
+        conditions = [
+            (filters.get('min_price'), lambda room, value: room['price'] >= value),
+            (filters.get('max_price'), lambda room, value: room['price'] <= value),
+            (filters.get('capacity'), lambda room, value: room['capacity'] >= value),
+            (filters.get('featured'), lambda room, value: room['featured'] == value),
+            (filters.get('available'), lambda room, value: room['available'] == value)
+        ]
+        conditions = [(value, check) for value, check in conditions if value is not None]
+        with self._lock:
+            rooms = [room for room in self._rooms.values()
+                     if all(check(room, value) for value, check in conditions)]
+            # 依編號排列後的穩定排序：同值的房間維持編號順序
+            rooms.sort(key=lambda room: room[sort_by], reverse=descending)
+            return [dict(room) for room in self._page(rooms, limit, offset)], len(rooms)
+
+    def get_room(self, room_id, shape=None):
+        with self._lock:
+            room = self._rooms.get(room_id)
+            return dict(room) if room else None
+
+    def available_rooms(self, check_in_day, check_out_day, guests=1, shape=None):
+        with self._lock:
+            return [dict(room) for room in self._rooms.values()
+                    if room['available'] == 1 and room['capacity'] >= guests
+                    and self._is_free(room['id'], check_in_day, check_out_day)]
+
+    def stay_totals(self, rooms, check_in_day, check_out_day):
+        nights = check_out_day - check_in_day
+        return {room['id']: room['price'] * nights for room in rooms}
+
+    def create_room(self, data):
+        with self._lock:
+            return dict(self._insert_room(_room_values(data)))
+
+    def room_available(self, room_id, check_in_day, check_out_day):
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None or room['available'] != 1:
+                return None
+            return self._is_free(room_id, check_in_day, check_out_day)
+
+    def create_booking(self, data, check_in_day, check_out_day):
+        with self._lock:
+            room = self._rooms.get(data['room_id'])
+            if room is None or room['available'] != 1:
+                raise ValueError("房間不存在或不可預訂")
+            if not self._is_free(room['id'], check_in_day, check_out_day):
+                raise ValueError("該日期房間已被預訂")
+            total_price = self.stay_totals([room], check_in_day, check_out_day)[room['id']]
+            booking = self._insert_booking(_booking_values(data, check_in_day, check_out_day, total_price))
+            return self._joined(booking)
+
+    def list_bookings(self, filters, limit=None, offset=0, shape=None):
+        status = filters.get('status')
+        guest_email = filters.get('guest_email')
+        start_date = filters.get('start_date')
+        end_date = filters.get('end_date')
+        with self._lock:
+            ids = self._by_status.get(status, []) if status is not None else self._bookings
+            bookings = []
+            for booking_id in reversed(ids):
+                booking = self._bookings[booking_id]
+                if guest_email and not _contains(booking['guest_email'], guest_email):
+                    continue
+                if start_date is not None and not booking['check_in'] >= start_date:
+                    continue
+                if end_date is not None and not booking['check_out'] <= end_date:
+                    continue
+                bookings.append(booking)
+            return [self._joined(booking) for booking in self._page(bookings, limit, offset)], len(bookings)
+
+    def quote_rooms(self, room_ids=None):
+        with self._lock:
+            if room_ids is None:
+                room_ids = self._rooms
+            rooms = [self._rooms[room_id] for room_id in sorted(room_ids) if room_id in self._rooms]
+            return [{name: room[name] for name in ('id', 'name', 'price', 'capacity', 'available')}
+                    for room in rooms]
+
+    def quote_matrix(self, rooms, stays):
+        with self._lock:
+            return {
+                room['id']: [
+                    (bool(room['available']) and self._is_free(room['id'], check_in_day, check_out_day),
+                     room['price'] * (check_out_day - check_in_day))
+                    for check_in_day, check_out_day in stays
+                ]
+                for room in rooms
+            }
+
+    def stats(self):
+        with self._lock:
+            rooms = list(self._rooms.values())
+            bookings = self._bookings
+            status_count = lambda status: len(self._by_status.get(status, [])) if bookings else None
+            created = [booking['created_at'] for booking in bookings.values()]
+
+            room_stats = {
+                "total_rooms": len(rooms),
+                "available_rooms": sum(room['available'] == 1 for room in rooms) if rooms else None,
+                "featured_rooms": sum(room['featured'] == 1 for room in rooms) if rooms else None,
+                "avg_price": sum(room['price'] for room in rooms) / len(rooms) if rooms else None,
+                "max_price": max(room['price'] for room in rooms) if rooms else None,
+                "min_price": min(room['price'] for room in rooms) if rooms else None,
+                "avg_rating": sum(room['rating'] for room in rooms) / len(rooms) if rooms else None
+            }
+            booking_stats = {
+                "total_bookings": len(bookings),
+                "confirmed_bookings": status_count('confirmed'),
+                "checked_in_bookings": status_count('checked_in'),
+                "cancelled_bookings": status_count('cancelled'),
+                "total_revenue": self._revenue if bookings else None,
+                "avg_booking_price": self._revenue / len(bookings) if bookings else None,
+                "first_booking": min(created) if created else None,
+                "last_booking": max(created) if created else None
+            }
+
+            recent_ids = list(bookings)[-5:][::-1]
+            recent_bookings = [self._joined(bookings[booking_id], with_price=False) for booking_id in recent_ids]
+
+            popular = sorted(self._room_totals.items(), key=lambda item: item[1][0], reverse=True)[:5]
+            popular_rooms = [{
+                "id": room_id,
+                "name": self._rooms[room_id]['name'],
+                "price": self._rooms[room_id]['price'],
+                "booking_count": count,
+                "revenue": revenue
+            } for room_id, (count, revenue) in popular]
+
+        return {
+            "rooms": room_stats,
+            "bookings": booking_stats,
+            "recent_bookings": recent_bookings,
+            "popular_rooms": popular_rooms
+        }
+
+    def search(self, query, limit=10):
+        booking_id = int(query) if query.isdigit() else 0
+        with self._lock:
+            rooms = [room for room in self._rooms.values()
+                     if _contains(room['name'], query) or _contains(room['description'], query)]
+            rooms.sort(key=lambda room: (-room['featured'], room['price']))
+
+            bookings = []
+            for booking in reversed(self._bookings.values()):
+                if (_contains(booking['guest_name'], query) or _contains(booking['guest_email'], query)
+                        or booking['id'] == booking_id):
+                    bookings.append(self._joined(booking, with_price=False))
+                    if len(bookings) == limit:
+                        break
+            return [dict(room) for room in rooms[:limit]], bookings
+
+
+# 正式服務（app.py）的資料表與 test_db.py 不同（房型、房間上的訂單計數、封存檔、多館別），
+# 房間、訂單與統計的讀取另有一組介面；寫入仍在 app.py 的寫入交易中完成（庫存帳、暫時保留
+# 與變更紀錄必須和訂單在同一個交易）。
+
+HOTEL_ROOM_COLUMNS = ('id', 'name', 'price', 'description', 'room_type', 'capacity', 'amenities', 'available',
+                      'image_url', 'active_booking_count', 'total_booking_count', 'archived_booking_count',
+                      'created_at', 'updated_at')
+
+# 訂單回應的欄位（整數天數欄位 dates.DAY_COLUMNS 只供篩選，不回傳）
+HOTEL_BOOKING_COLUMNS = ('id', 'room_id', 'guest_name', 'guest_email', 'guest_phone', 'check_in', 'check_out',
+                         'nights', 'guests', 'total_price', 'status', 'special_requests', 'payment_status',
+                         'created_at', 'updated_at')
+
+HOTEL_ROOM_SORT_COLUMNS = ('price', 'capacity', 'created_at', 'name')
+
+HOTEL_BOOKING_SORT_COLUMNS = ('created_at', 'check_in')
+
+# 計入營收與晚數的訂單狀態（與 analytics.REVENUE_STATUSES 相同）
+HOTEL_REVENUE_STATUSES = ('confirmed', 'checked_in', 'checked_out', 'completed')
+
+# 稀疏欄位：讀取端點以 ?fields=summary|card|full 或 ?fields=id,name,price 指定回傳的欄位，
+# SQL 也只查詢這些欄位（例如列表頁不需要的 description、amenities、image_url）
+HOTEL_ROOM_FIELDS = query_builder.Fieldset(
+    {name: name for name in HOTEL_ROOM_COLUMNS},
+    {
+        'summary': ('id', 'name', 'price', 'room_type', 'capacity', 'available'),
+        'card': ('id', 'name', 'price', 'room_type', 'capacity', 'available', 'amenities', 'image_url'),
+        'full': (
+            'id', 'name', 'price', 'description', 'room_type', 'capacity', 'amenities', 'available', 'image_url',
+            'active_booking_count', 'total_booking_count', 'archived_booking_count', 'booking_count',
+            'created_at', 'updated_at'
+        )
+    },
+    derived={
+        # 訂單數直接取自房間上的計數欄位
+        'booking_count': (lambda room: room['total_booking_count'] + room['archived_booking_count'],
+                          'total_booking_count', 'archived_booking_count')
+    }
+)
+
+HOTEL_BOOKING_FIELDS = query_builder.Fieldset(
+    dict({name: f'b.{name}' for name in HOTEL_BOOKING_COLUMNS},
+         room_name='r.name', room_price='r.price', room_description='r.description', room_image='r.image_url',
+         archived_at='NULL'),
+    {
+        'summary': ('id', 'room_id', 'room_name', 'guest_name', 'check_in', 'check_out', 'nights',
+                    'total_price', 'status'),
+        'card': ('id', 'room_id', 'room_name', 'room_price', 'guest_name', 'guest_email', 'guest_phone',
+                 'check_in', 'check_out', 'nights', 'guests', 'total_price', 'status', 'payment_status',
+                 'created_at'),
+        # 列表端點未指定 fields 時的欄位（與單筆查詢相比少了房間描述與圖片）
+        'list': HOTEL_BOOKING_COLUMNS + ('room_name', 'room_price', 'archived_at'),
+        # 只有訂單本身的欄位（房間的訂單列表已附上房間，預設不重複房間名稱與價格）
+        'plain': HOTEL_BOOKING_COLUMNS + ('archived_at',),
+        'full': HOTEL_BOOKING_COLUMNS + ('room_name', 'room_price', 'room_description', 'room_image', 'archived_at')
+    },
+    required=('id', 'created_at'),
+    # 只有封存檔中的訂單才有 archived_at
+    optional=('archived_at',)
+)
+
+# 封存檔的訂單來源
+HOTEL_ARCHIVED_BOOKING_COLUMNS = {'archived_at': 'b.archived_at'}
+
+HOTEL_ROOMS_QUERY = query_builder.FilterQuery(
+    'SELECT {columns} FROM rooms WHERE 1=1',
+    'SELECT COUNT(*) FROM rooms WHERE 1=1',
+    {
+        'min_price': 'price >= ?',
+        'max_price': 'price <= ?',
+        'room_type': 'room_type = ?',
+        'available': 'available = 1'
+    }
+)
+
+HOTEL_BOOKINGS_FILTERS = {
+    'status': 'b.status = ?',
+    'room_id': 'b.room_id = ?',
+    'guest_email': 'b.guest_email = ?',
+    # 住宿期間與 [start, end) 重疊
+    'start': 'b.check_out_day > ?',
+    'end': 'b.check_in_day < ?'
+}
+
+HOTEL_BOOKINGS_QUERY = query_builder.FilterQuery(
+    '''
+        SELECT {columns}
+        FROM bookings b
+        JOIN rooms r ON b.room_id = r.id
+        WHERE 1=1
+    ''',
+    'SELECT COUNT(*) FROM bookings b JOIN rooms r ON b.room_id = r.id WHERE 1=1',
+    HOTEL_BOOKINGS_FILTERS
+)
+
+# 封存檔中的訂單（需先附加封存檔；熱資料中仍有的訂單不重複列出）
+HOTEL_ARCHIVED_BOOKINGS_QUERY = query_builder.FilterQuery(
+    '''
+        SELECT {columns}
+        FROM archive.bookings b
+        JOIN rooms r ON b.room_id = r.id
+        WHERE NOT EXISTS (SELECT 1 FROM main.bookings h WHERE h.id = b.id)
+    ''',
+    '''SELECT COUNT(*) FROM archive.bookings b JOIN rooms r ON b.room_id = r.id
+       WHERE NOT EXISTS (SELECT 1 FROM main.bookings h WHERE h.id = b.id)''',
+    HOTEL_BOOKINGS_FILTERS
+)
+
+_REVENUE_SQL = ', '.join(repr(status) for status in HOTEL_REVENUE_STATUSES)
+
+
+class HotelStorage(ABC):
+    """正式服務（app.py）的讀取介面：房間、訂單與統計
+
+    房間 filters 的鍵為 min_price、max_price、room_type、available，
+    訂單 filters 的鍵為 status、room_id、guest_email、start、end（整數天數，住宿期間與 [start, end) 重疊），
+    值為 None 的條件不啟用。shape 為 HOTEL_ROOM_FIELDS / HOTEL_BOOKING_FIELDS 解析出的欄位形狀
+    （None 表示 full），回傳未序列化的 dict，由呼叫端以同一個 Fieldset 序列化。
+    """
+
+    engine = None
+
+    @abstractmethod
+    def list_rooms(self, filters, sort_by='price', descending=False, shape=None):
+        """符合篩選的房間（sort_by 不在 HOTEL_ROOM_SORT_COLUMNS 時依價格由低到高）"""
+
+    @abstractmethod
+    def get_room(self, room_id, shape=None):
+        """單一房間，不存在時回傳 None"""
+
+    @abstractmethod
+    def rooms_by_ids(self, room_ids, shape=None):
+        """{room_id: 房間}，不存在的 id 不列出"""
+
+    @abstractmethod
+    def list_bookings(self, filters, shape=None, sort_by='created_at'):
+        """符合篩選的訂單（依 sort_by 新到舊）
+
+        只有指定了住宿區間、且區間涵蓋已封存的期間時，才一併查詢封存檔（封存的訂單帶有 archived_at）。
+        """
+
+    @abstractmethod
+    def get_booking(self, booking_id, shape=None):
+        """單筆訂單（熱資料中沒有時查封存檔），不存在時回傳 None"""
+
+    @abstractmethod
+    def bookings_by_ids(self, booking_ids, shape=None):
+        """{booking_id: 訂單}（只查熱資料），不存在的 id 不列出"""
+
+    @abstractmethod
+    def stats(self):
+        """(房間統計, 訂單統計（含已封存的訂單）, 最近 6 個月的收入)"""
+
+
+class HotelSQLiteStorage(HotelStorage):
+    """app.py 資料表的 SQLite 引擎
+
+    connect() 回傳一條連線（用完即關閉；走讀取複本或主資料庫由呼叫端決定），
+    database 為館別的資料庫檔路徑（附加封存檔用）。
+    """
+
+    engine = 'sqlite'
+
+    # 每個 IN (...) 查詢的參數上限（低於 SQLite 的 999）
+    CHUNK_SIZE = 500
+
+    def __init__(self, connect, database):
+        self.connect = connect
+        self.database = database
+
+    @contextmanager
+    def _connection(self):
+        conn = self.connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _by_ids(self, conn, query, ids):
+        """以 IN (...) 分批查詢，query 中的 {placeholders} 會替換成參數佔位符，回傳 {id: dict}"""
+        rows = {}
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            chunk = ids[start:start + self.CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(query.format(placeholders=placeholders), chunk):
+                rows[row['id']] = dict(row)
+        return rows
+
+    def list_rooms(self, filters, sort_by='price', descending=False, shape=None):
+        shape = shape or HOTEL_ROOM_FIELDS.parse(None)
+        if sort_by in HOTEL_ROOM_SORT_COLUMNS:
+            order_by = f'{sort_by} {"DESC" if descending else "ASC"}'
+        else:
+            order_by = 'price ASC'
+        # 依篩選條件的組合取得已編譯的查詢
+        query, params, _, _ = HOTEL_ROOMS_QUERY.build(filters, order_by, columns=HOTEL_ROOM_FIELDS.select(shape))
+        with self._connection() as conn:
+            return [dict(room) for room in conn.execute(query, params).fetchall()]
+
+    def get_room(self, room_id, shape=None):
+        shape = shape or HOTEL_ROOM_FIELDS.parse(None)
+        with self._connection() as conn:
+            room = conn.execute(f'SELECT {HOTEL_ROOM_FIELDS.select(shape)} FROM rooms WHERE id = ?',
+                                (room_id,)).fetchone()
+        return dict(room) if room else None
+
+    def rooms_by_ids(self, room_ids, shape=None):
+        shape = shape or HOTEL_ROOM_FIELDS.parse(None)
+        with self._connection() as conn:
+            return self._by_ids(
+                conn, f'SELECT {HOTEL_ROOM_FIELDS.select(shape)} FROM rooms WHERE id IN ({{placeholders}})', room_ids)
+
+    def list_bookings(self, filters, shape=None, sort_by='created_at'):
+        shape = shape or HOTEL_BOOKING_FIELDS.parse(None)
+        sort_by = sort_by if sort_by in HOTEL_BOOKING_SORT_COLUMNS else 'created_at'
+        columns = HOTEL_BOOKING_FIELDS.select(shape)
+        query, params, _, _ = HOTEL_BOOKINGS_QUERY.build(filters, f'b.{sort_by} DESC', columns=columns)
+        with self._connection() as conn:
+            bookings = [dict(row) for row in conn.execute(query, params).fetchall()]
+            if filters.get('start') is None and filters.get('end') is None:
+                return bookings
+            if not archive.covers(conn, filters.get('start')):
+                return bookings
+
+            columns = HOTEL_BOOKING_FIELDS.select(shape, HOTEL_ARCHIVED_BOOKING_COLUMNS)
+            query, params, _, _ = HOTEL_ARCHIVED_BOOKINGS_QUERY.build(filters, f'b.{sort_by} DESC', columns=columns)
+            with archive.attached(conn, self.database):
+                archived = [dict(row) for row in conn.execute(query, params).fetchall()]
+        return list(heapq.merge(bookings, archived, key=lambda row: row.get(sort_by) or '', reverse=True))
+
+    def get_booking(self, booking_id, shape=None):
+        shape = shape or HOTEL_BOOKING_FIELDS.parse(None)
+        with self._connection() as conn:
+            booking = conn.execute(f'''
+                SELECT {HOTEL_BOOKING_FIELDS.select(shape)}
+                FROM bookings b
+                JOIN rooms r ON b.room_id = r.id
+                WHERE b.id = ?
+            ''', (booking_id,)).fetchone()
+
+            # 熱資料中沒有時再查封存檔（已封存的訂單帶有 archived_at）
+            if booking is None and archive.covers(conn, None):
+                with archive.attached(conn, self.database):
+                    booking = conn.execute(f'''
+                        SELECT {HOTEL_BOOKING_FIELDS.select(shape, HOTEL_ARCHIVED_BOOKING_COLUMNS)}
+                        FROM archive.bookings b
+                        JOIN rooms r ON b.room_id = r.id
+                        WHERE b.id = ?
+                    ''', (booking_id,)).fetchone()
+        return dict(booking) if booking else None
+
+    def bookings_by_ids(self, booking_ids, shape=None):
+        shape = shape or HOTEL_BOOKING_FIELDS.parse(None)
+        with self._connection() as conn:
+            return self._by_ids(conn, f'''
+                SELECT {HOTEL_BOOKING_FIELDS.select(shape)}
+                FROM bookings b
+                JOIN rooms r ON b.room_id = r.id
+                WHERE b.id IN ({{placeholders}})
+            ''', booking_ids)
+
+    def stats(self):
+        with self._connection() as conn:
+            # 房間統計
+            room_stats = conn.execute('''
+                SELECT
+                    COUNT(*) as total_rooms,
+                    SUM(CASE WHEN available = 1 THEN 1 ELSE 0 END) as available_rooms,
+                    AVG(price) as avg_price,
+                    MAX(price) as max_price,
+                    MIN(price) as min_price,
+                    SUM(price * capacity) as total_capacity_value
+                FROM rooms
+            ''').fetchone()
+
+            # 訂單統計
+            booking_stats = conn.execute(f'''
+                SELECT
+                    COUNT(*) as total_bookings,
+                    SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) as confirmed_bookings,
+                    SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) as cancelled_bookings,
+                    SUM(CASE WHEN status IN ({_REVENUE_SQL}) THEN total_price ELSE 0 END) as total_revenue,
+                    AVG(total_price) as avg_booking_price,
+                    SUM(CASE WHEN status IN ({_REVENUE_SQL}) THEN nights ELSE 0 END) as total_nights
+                FROM bookings
+            ''').fetchone()
+            booking_stats = _with_archived(dict(booking_stats), archive.summary(conn))
+
+            # 每月收入統計
+            monthly_stats = conn.execute(f'''
+                SELECT
+                    strftime('%Y-%m', created_at) as month,
+                    COUNT(*) as booking_count,
+                    SUM(total_price) as monthly_revenue
+                FROM bookings
+                WHERE status IN ({_REVENUE_SQL})
+                GROUP BY strftime('%Y-%m', created_at)
+                ORDER BY month DESC
+                LIMIT 6
+            ''').fetchall()
+
+        return dict(room_stats), booking_stats, [dict(stat) for stat in monthly_stats]
+
+
+def _with_archived(booking_stats, archived):
+    """訂單統計加上已封存的訂單（封存的只有 completed / cancelled，completed 計入營收與晚數）"""
+    if not archived:
+        return booking_stats
+    archived_count = sum(count for count, _, _ in archived.values())
+    archived_price = sum(price for _, price, _ in archived.values())
+    hot_count = booking_stats['total_bookings']
+    booking_stats['total_bookings'] = hot_count + archived_count
+    booking_stats['cancelled_bookings'] = (booking_stats['cancelled_bookings'] or 0) + archived.get('cancelled', (0, 0, 0))[0]
+    _, completed_price, completed_nights = archived.get('completed', (0, 0, 0))
+    booking_stats['total_revenue'] = (booking_stats['total_revenue'] or 0) + (completed_price or 0)
+    booking_stats['total_nights'] = (booking_stats['total_nights'] or 0) + (completed_nights or 0)
+    booking_stats['avg_booking_price'] = ((booking_stats['avg_booking_price'] or 0) * hot_count + archived_price) / (hot_count + archived_count)
+    return booking_stats
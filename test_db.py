@@ -6,6 +6,12 @@ from datetime import datetime, timedelta
 import hashlib
 import logging
 from functools import wraps
+import rate_limit
+import dates
+import rates
+import quotes
+import storage
+from db_pool import ConnectionPool
 
 # 配置日誌
 logging.basicConfig(
@@ -30,6 +36,27 @@ class Config:
     DATABASE = 'hotel.db'
     PORT = int(os.environ.get('PORT', 5000))
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT', '1') == '1'
+    RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', 20))
+    RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 100))
+    RATE_LIMIT_FILE = os.environ.get('RATE_LIMIT_FILE', rate_limit.default_state_path())
+    MAX_INFLIGHT = int(os.environ.get('MAX_INFLIGHT', 64))
+    STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'sqlite')  # sqlite 或 memory
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+    STATEMENT_CACHE_SIZE = int(os.environ.get('STATEMENT_CACHE_SIZE', 256))
+    RATE_HORIZON_DAYS = int(os.environ.get('RATE_HORIZON_DAYS', 365))
+    QUOTE_MAX_STAYS = 100
+    QUOTE_MAX_ROOMS = 1000
+    QUOTE_MAX_CELLS = 20000
+
+# 速率限制與負載卸除（健康檢查不受限制）
+rate_limit.init_app(
+    app,
+    rate_limit.TokenBucketLimiter(Config.RATE_LIMIT_FILE, Config.RATE_LIMIT_RATE, Config.RATE_LIMIT_BURST)
+    if Config.RATE_LIMIT_ENABLED else None,
+    rate_limit.LoadShedder(Config.MAX_INFLIGHT),
+    exempt={'/api/health'}
+)
 
 # 權限裝飾器
 def require_admin(f):
@@ -47,6 +74,41 @@ def require_admin(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# 範例資料（SQLite 第一次建立資料表時寫入；記憶體引擎每次啟動時載入）
+SAMPLE_ROOM_COLUMNS = ('name', 'price', 'description', 'capacity', 'amenities', 'images',
+                       'available', 'featured', 'rating')
+SAMPLE_ROOMS = [
+    ('豪華海景雙人房', 4200, '180度海景陽台，免費早餐與下午茶', 2, 
+     '["wifi", "breakfast", "sea_view", "bathtub"]', 
+     '["room1.jpg", "room2.jpg"]', 1, 1, 4.8),
+    ('行政套房', 6800, '獨立客廳與辦公區，行政酒廊權益', 2,
+     '["wifi", "breakfast", "executive_lounge", "workspace"]',
+     '["suite1.jpg"]', 1, 1, 4.9),
+    ('家庭連通房', 8500, '兩間相連客房，適合家庭入住', 4,
+     '["wifi", "breakfast", "family", "connecting"]',
+     '["family1.jpg"]', 1, 0, 4.7),
+    ('標準雙床房', 2800, '兩張單人床，簡約舒適設計', 2,
+     '["wifi", "tv", "desk"]',
+     '["standard1.jpg"]', 1, 0, 4.3),
+    ('商務單人房', 2200, '高效工作空間，快速網路', 1,
+     '["wifi", "workspace", "coffee"]',
+     '["business1.jpg"]', 1, 0, 4.4),
+    ('總統套房', 18800, '私人管家服務，專屬露台與按摩浴缸', 2,
+     '["wifi", "butler", "jacuzzi", "terrace", "luxury"]',
+     '["president1.jpg", "president2.jpg"]', 1, 1, 5.0)
+]
+
+SAMPLE_BOOKING_COLUMNS = ('room_id', 'guest_name', 'guest_email', 'guest_phone',
+                          'check_in', 'check_out', 'guests', 'total_price', 'status')
+SAMPLE_BOOKINGS = [
+    (1, '陳大明', 'chen@example.com', '0912345678', 
+     '2024-01-15', '2024-01-18', 2, 12600, 'confirmed'),
+    (3, '林小美', 'lin@example.com', '0922333444',
+     '2024-01-20', '2024-01-25', 4, 42500, 'confirmed'),
+    (5, '王建國', 'wang@example.com', '0933555777',
+     '2024-02-01', '2024-02-03', 1, 4400, 'pending')
+]
+
 # 資料庫初始化
 def init_db():
     conn = sqlite3.connect(Config.DATABASE)
@@ -79,6 +141,8 @@ def init_db():
             guest_phone TEXT,
             check_in DATE NOT NULL,
             check_out DATE NOT NULL,
+            check_in_day INTEGER,   -- check_in 的整數天數（1970-01-01 起算）
+            check_out_day INTEGER,  -- check_out 的整數天數
             guests INTEGER DEFAULT 1,
             total_price INTEGER NOT NULL,
             status TEXT DEFAULT 'confirmed',
@@ -102,89 +166,85 @@ def init_db():
         )
     ''')
     
+    # 整數天數欄位與同步觸發器（範例訂單由觸發器補上天數）
+    dates.migrate_booking_days(c)
+    
+    # 房價規則與預先編譯的每晚房價
+    rates.install(c)
+    
     # 插入範例資料
     c.execute('SELECT COUNT(*) FROM rooms')
     if c.fetchone()[0] == 0:
-        sample_rooms = [
-            ('豪華海景雙人房', 4200, '180度海景陽台，免費早餐與下午茶', 2, 
-             '["wifi", "breakfast", "sea_view", "bathtub"]', 
-             '["room1.jpg", "room2.jpg"]', 1, 1, 4.8),
-            ('行政套房', 6800, '獨立客廳與辦公區，行政酒廊權益', 2,
-             '["wifi", "breakfast", "executive_lounge", "workspace"]',
-             '["suite1.jpg"]', 1, 1, 4.9),
-            ('家庭連通房', 8500, '兩間相連客房，適合家庭入住', 4,
-             '["wifi", "breakfast", "family", "connecting"]',
-             '["family1.jpg"]', 1, 0, 4.7),
-            ('標準雙床房', 2800, '兩張單人床，簡約舒適設計', 2,
-             '["wifi", "tv", "desk"]',
-             '["standard1.jpg"]', 1, 0, 4.3),
-            ('商務單人房', 2200, '高效工作空間，快速網路', 1,
-             '["wifi", "workspace", "coffee"]',
-             '["business1.jpg"]', 1, 0, 4.4),
-            ('總統套房', 18800, '私人管家服務，專屬露台與按摩浴缸', 2,
-             '["wifi", "butler", "jacuzzi", "terrace", "luxury"]',
-             '["president1.jpg", "president2.jpg"]', 1, 1, 5.0)
-        ]
-        c.executemany('''
-            INSERT INTO rooms (name, price, description, capacity, amenities, images, available, featured, rating)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sample_rooms)
+        c.executemany(f'''
+            INSERT INTO rooms ({", ".join(SAMPLE_ROOM_COLUMNS)})
+            VALUES ({", ".join("?" * len(SAMPLE_ROOM_COLUMNS))})
+        ''', SAMPLE_ROOMS)
         
         # 插入範例訂單
-        sample_bookings = [
-            (1, '陳大明', 'chen@example.com', '0912345678', 
-             '2024-01-15', '2024-01-18', 2, 12600, 'confirmed'),
-            (3, '林小美', 'lin@example.com', '0922333444',
-             '2024-01-20', '2024-01-25', 4, 42500, 'confirmed'),
-            (5, '王建國', 'wang@example.com', '0933555777',
-             '2024-02-01', '2024-02-03', 1, 4400, 'pending')
-        ]
-        c.executemany('''
-            INSERT INTO bookings (room_id, guest_name, guest_email, guest_phone, 
-                                 check_in, check_out, guests, total_price, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sample_bookings)
+        c.executemany(f'''
+            INSERT INTO bookings ({", ".join(SAMPLE_BOOKING_COLUMNS)})
+            VALUES ({", ".join("?" * len(SAMPLE_BOOKING_COLUMNS))})
+        ''', SAMPLE_BOOKINGS)
+    
+    rates.extend(c, dates.today_day() + Config.RATE_HORIZON_DAYS)
     
     conn.commit()
     conn.close()
     logger.info("資料庫初始化完成")
 
-# 初始化資料庫
-init_db()
+# 資料存取層：路由只透過 store 存取房間、訂單與統計（STORAGE_ENGINE 選擇引擎）
+def open_storage():
+    if Config.STORAGE_ENGINE == 'memory':
+        store = storage.MemoryStorage()
+        store.seed([dict(zip(SAMPLE_ROOM_COLUMNS, room)) for room in SAMPLE_ROOMS],
+                   [dict(zip(SAMPLE_BOOKING_COLUMNS, booking)) for booking in SAMPLE_BOOKINGS])
+        return store
+    if Config.STORAGE_ENGINE != 'sqlite':
+        raise ValueError(f"未知的 STORAGE_ENGINE: {Config.STORAGE_ENGINE}（可用: {', '.join(storage.ENGINES)}）")
+    init_db()
+    # 連線池：conn.close() 會歸還連線，讓預備語句快取跨請求生效
+    return storage.SQLiteStorage(
+        ConnectionPool(Config.DATABASE, size=Config.DB_POOL_SIZE,
+                       cached_statements=Config.STATEMENT_CACHE_SIZE),
+        Config.RATE_HORIZON_DAYS
+    )
 
-def get_db_connection():
-    conn = sqlite3.connect(Config.DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+store = open_storage()
 
-# 工具函數
-def calculate_total_price(room_price, check_in, check_out):
-    """計算住宿總價格"""
+# 稀疏欄位：?fields=summary|card|full 或 ?fields=id,name,price（SQLite 引擎只查詢這些欄位）
+ROOM_FIELDS = storage.ROOM_FIELDS
+BOOKING_FIELDS = storage.BOOKING_FIELDS
+
+# 工具函數（日期一律轉成整數天數計算，解析結果由 dates.parse_day 快取）
+def calculate_total_prices(rooms, check_in, check_out):
+    """計算多間房的住宿總價格 {room_id: 總價}（SQLite 引擎為預先編譯的每晚房價累計和相減）"""
     try:
-        start = datetime.strptime(check_in, '%Y-%m-%d')
-        end = datetime.strptime(check_out, '%Y-%m-%d')
-        nights = (end - start).days
-        return room_price * max(1, nights)  # 至少一晚
-    except:
-        return room_price
+        start = dates.parse_day(check_in)
+        end = max(dates.parse_day(check_out), start + 1)  # 至少一晚
+    except ValueError:
+        return {room['id']: room['price'] for room in rooms}
+    return store.stay_totals(rooms, start, end)
+
+def calculate_total_price(room, check_in, check_out):
+    """計算住宿總價格"""
+    return calculate_total_prices([room], check_in, check_out)[room['id']]
 
 def validate_date_range(check_in, check_out):
     """驗證日期範圍有效性"""
     try:
-        start = datetime.strptime(check_in, '%Y-%m-%d')
-        end = datetime.strptime(check_out, '%Y-%m-%d')
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        if start < today:
-            return False, "入住日期不能是過去日期"
-        if start >= end:
-            return False, "退房日期必須晚於入住日期"
-        if (end - start).days > 30:
-            return False, "住宿天數不能超過30天"
-        
-        return True, ""
+        start = dates.parse_day(check_in)
+        end = dates.parse_day(check_out)
     except ValueError:
         return False, "日期格式錯誤，請使用 YYYY-MM-DD"
+    
+    if start < dates.today_day():
+        return False, "入住日期不能是過去日期"
+    if start >= end:
+        return False, "退房日期必須晚於入住日期"
+    if end - start > 30:
+        return False, "住宿天數不能超過30天"
+    
+    return True, ""
 
 # API 路由
 @app.route('/')
@@ -207,7 +267,8 @@ def home():
                 "GET /api/bookings/<id>": "取得特定訂單",
                 "POST /api/bookings": "創建新訂單",
                 "PUT /api/bookings/<id>/status": "更新訂單狀態",
-                "GET /api/bookings/check-availability": "檢查房型可用性"
+                "GET /api/bookings/check-availability": "檢查房型可用性",
+                "POST /api/quotes": "批次報價（多間房 × 多段住宿）"
             },
             "system": {
                 "GET /api/stats": "取得統計資料",
@@ -221,15 +282,13 @@ def home():
 @app.route('/api/health')
 def health():
     try:
-        conn = get_db_connection()
-        room_count = conn.execute('SELECT COUNT(*) FROM rooms').fetchone()[0]
-        booking_count = conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0]
-        conn.close()
+        room_count, booking_count = store.counts()
         
         return jsonify({
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
             "database": {
+                "engine": store.engine,
                 "rooms": room_count,
                 "bookings": booking_count,
                 "file": os.path.exists(Config.DATABASE)
@@ -262,53 +321,22 @@ def get_rooms():
         per_page = request.args.get('per_page', 10, type=int)
         offset = (page - 1) * per_page
         
-        # 構建查詢
-        query = 'SELECT * FROM rooms WHERE 1=1'
-        params = []
-        
-        if min_price is not None:
-            query += ' AND price >= ?'
-            params.append(min_price)
-        if max_price is not None:
-            query += ' AND price <= ?'
-            params.append(max_price)
-        if capacity is not None:
-            query += ' AND capacity >= ?'
-            params.append(capacity)
-        if featured is not None:
-            query += ' AND featured = ?'
-            params.append(featured)
-        if available is not None:
-            query += ' AND available = ?'
-            params.append(available)
-        
-        # 排序
-        valid_sort_columns = ['price', 'rating', 'name', 'created_at']
-        sort_by = sort_by if sort_by in valid_sort_columns else 'price'
-        sort_order = 'DESC' if sort_order.lower() == 'desc' else 'ASC'
-        query += f' ORDER BY {sort_by} {sort_order}'
-        
-        # 分頁
-        query += ' LIMIT ? OFFSET ?'
-        params.extend([per_page, offset])
-        
-        conn = get_db_connection()
-        rooms = conn.execute(query, params).fetchall()
-        
-        # 總數查詢（不分頁）
-        count_query = 'SELECT COUNT(*) FROM rooms WHERE 1=1'
-        count_params = params[:-2] if len(params) > 2 else []
-        total = conn.execute(count_query, count_params).fetchone()[0]
-        
-        conn.close()
+        # 回傳欄位
+        try:
+            shape = ROOM_FIELDS.parse(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         
-        rooms_list = []
-        for room in rooms:
-            room_dict = dict(room)
-            # 解析 JSON 欄位
-            room_dict['amenities'] = eval(room_dict.get('amenities', '[]'))
-            room_dict['images'] = eval(room_dict.get('images', '[]'))
-            rooms_list.append(room_dict)
+        # 分頁後的房間與不分頁的總數（未知的排序欄位改用 price）
+        rooms, total = store.list_rooms({
+            'min_price': min_price,
+            'max_price': max_price,
+            'capacity': capacity,
+            'featured': featured,
+            'available': available
+        }, sort_by, sort_order.lower() == 'desc', per_page, offset, shape)
+        
+        rooms_list = [ROOM_FIELDS.serialize(room, shape) for room in rooms]
         
         return jsonify({
             "status": "success",
@@ -336,18 +364,17 @@ def get_rooms():
 def get_room(room_id):
     """取得特定房型詳情"""
     try:
-        conn = get_db_connection()
-        room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
-        conn.close()
+        try:
+            shape = ROOM_FIELDS.parse(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        room = store.get_room(room_id, shape)
         
         if room is None:
             return jsonify({"status": "error", "message": "房間不存在"}), 404
         
-        room_dict = dict(room)
-        room_dict['amenities'] = eval(room_dict.get('amenities', '[]'))
-        room_dict['images'] = eval(room_dict.get('images', '[]'))
-        
-        return jsonify({"status": "success", "data": room_dict})
+        return jsonify({"status": "success", "data": ROOM_FIELDS.serialize(room, shape)})
         
     except Exception as e:
         logger.error(f"取得房間詳情失敗: {e}")
@@ -368,49 +395,21 @@ def get_available_rooms():
         valid, message = validate_date_range(check_in, check_out)
         if not valid:
             return jsonify({"status": "error", "message": message}), 400
+        try:
+            shape = ROOM_FIELDS.parse(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         
-        conn = get_db_connection()
-        
-        # 查詢在指定日期已有訂單的房間
-        busy_rooms = conn.execute('''
-            SELECT DISTINCT room_id 
-            FROM bookings 
-            WHERE status IN ('confirmed', 'checked_in')
-            AND (
-                (check_in <= ? AND check_out > ?) OR
-                (check_in < ? AND check_out >= ?) OR
-                (check_in >= ? AND check_out <= ?)
-            )
-        ''', (check_out, check_in, check_out, check_in, check_in, check_out)).fetchall()
-        
-        busy_room_ids = [str(r['room_id']) for r in busy_rooms]
+        # 指定日期沒有佔用訂單的房間（整數天數重疊判斷）
+        rooms = store.available_rooms(dates.parse_day(check_in), dates.parse_day(check_out), guests, shape)
         
-        # 查詢可用房間
-        query = '''
-            SELECT * FROM rooms 
-            WHERE available = 1 
-            AND capacity >= ?
-        '''
-        params = [guests]
-        
-        if busy_room_ids:
-            query += f' AND id NOT IN ({",".join(["?"] * len(busy_room_ids))})'
-            params.extend(busy_room_ids)
-        
-        rooms = conn.execute(query, params).fetchall()
-        conn.close()
+        # 所有房間的總價一次查出
+        total_prices = calculate_total_prices(rooms, check_in, check_out)
         
         rooms_list = []
         for room in rooms:
-            room_dict = dict(room)
-            room_dict['amenities'] = eval(room_dict.get('amenities', '[]'))
-            room_dict['images'] = eval(room_dict.get('images', '[]'))
-            
-            # 計算總價
-            total_price = calculate_total_price(
-                room_dict['price'], check_in, check_out
-            )
-            room_dict['total_price'] = total_price
+            room_dict = ROOM_FIELDS.serialize(room, shape)
+            room_dict['total_price'] = total_prices[room['id']]
             room_dict['check_in'] = check_in
             room_dict['check_out'] = check_out
             
@@ -442,31 +441,8 @@ def add_room():
             if field not in data:
                 return jsonify({"status": "error", "message": f"缺少必要欄位: {field}"}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO rooms (
-                name, price, description, capacity, 
-                amenities, images, available, featured, rating
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['name'],
-            data['price'],
-            data.get('description', ''),
-            data.get('capacity', 2),
-            str(data.get('amenities', [])),
-            str(data.get('images', [])),
-            data.get('available', 1),
-            data.get('featured', 0),
-            data.get('rating', 4.5)
-        ))
-        
-        conn.commit()
-        room_id = cursor.lastrowid
-        
-        new_room = conn.execute('SELECT * FROM rooms WHERE id = ?', (room_id,)).fetchone()
-        conn.close()
+        new_room = store.create_room(data)
+        room_id = new_room['id']
         
         room_dict = dict(new_room)
         room_dict['amenities'] = eval(room_dict.get('amenities', '[]'))
@@ -502,83 +478,21 @@ def create_booking():
         if not valid:
             return jsonify({"status": "error", "message": message}), 400
         
-        conn = get_db_connection()
-        
-        # 檢查房間可用性
-        room = conn.execute('''
-            SELECT * FROM rooms 
-            WHERE id = ? AND available = 1
-        ''', (data['room_id'],)).fetchone()
-        
-        if room is None:
-            conn.close()
-            return jsonify({"status": "error", "message": "房間不存在或不可預訂"}), 400
-        
-        # 檢查日期是否衝突
-        conflict = conn.execute('''
-            SELECT COUNT(*) FROM bookings 
-            WHERE room_id = ? 
-            AND status IN ('confirmed', 'checked_in')
-            AND (
-                (check_in <= ? AND check_out > ?) OR
-                (check_in < ? AND check_out >= ?)
+        # 檢查房間可用性與日期衝突後新增（同一個交易）
+        try:
+            new_booking = store.create_booking(
+                data, dates.parse_day(data['check_in']), dates.parse_day(data['check_out'])
             )
-        ''', (
-            data['room_id'],
-            data['check_out'], data['check_in'],
-            data['check_out'], data['check_in']
-        )).fetchone()[0]
-        
-        if conflict > 0:
-            conn.close()
-            return jsonify({"status": "error", "message": "該日期房間已被預訂"}), 400
-        
-        # 計算總價
-        total_price = calculate_total_price(
-            room['price'], data['check_in'], data['check_out']
-        )
-        
-        # 創建訂單
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO bookings (
-                room_id, guest_name, guest_email, guest_phone,
-                check_in, check_out, guests, total_price,
-                status, payment_method, special_requests
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['room_id'],
-            data['guest_name'],
-            data['guest_email'],
-            data.get('guest_phone', ''),
-            data['check_in'],
-            data['check_out'],
-            data.get('guests', 1),
-            total_price,
-            data.get('status', 'confirmed'),
-            data.get('payment_method', 'credit_card'),
-            data.get('special_requests', '')
-        ))
-        
-        conn.commit()
-        booking_id = cursor.lastrowid
-        
-        # 取得完整訂單資料
-        new_booking = conn.execute('''
-            SELECT b.*, r.name as room_name, r.price as room_price 
-            FROM bookings b
-            JOIN rooms r ON b.room_id = r.id
-            WHERE b.id = ?
-        ''', (booking_id,)).fetchone()
-        
-        conn.close()
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        booking_id = new_booking['id']
         
         logger.info(f"新訂單創建: ID={booking_id}, 房間={data['room_id']}, 客戶={data['guest_name']}")
         
         return jsonify({
             "status": "success",
             "message": "訂單創建成功",
-            "data": dict(new_booking)
+            "data": new_booking
         }), 201
         
     except Exception as e:
@@ -600,44 +514,21 @@ def get_bookings():
         per_page = request.args.get('per_page', 20, type=int)
         offset = (page - 1) * per_page
         
-        # 構建查詢
-        query = '''
-            SELECT b.*, r.name as room_name, r.price as room_price 
-            FROM bookings b
-            JOIN rooms r ON b.room_id = r.id
-            WHERE 1=1
-        '''
-        params = []
-        
-        if status:
-            query += ' AND b.status = ?'
-            params.append(status)
-        if guest_email:
-            query += ' AND b.guest_email LIKE ?'
-            params.append(f'%{guest_email}%')
-        if start_date:
-            query += ' AND b.check_in >= ?'
-            params.append(start_date)
-        if end_date:
-            query += ' AND b.check_out <= ?'
-            params.append(end_date)
-        
-        query += ' ORDER BY b.created_at DESC LIMIT ? OFFSET ?'
-        params.extend([per_page, offset])
-        
-        conn = get_db_connection()
-        bookings = conn.execute(query, params).fetchall()
-        
-        # 總數查詢
-        count_query = query.replace(
-            'SELECT b.*, r.name as room_name, r.price as room_price', 
-            'SELECT COUNT(*)'
-        ).split('ORDER BY')[0]
-        total = conn.execute(count_query, params[:-2]).fetchone()[0]
-        
-        conn.close()
-        
-        bookings_list = [dict(booking) for booking in bookings]
+        # 回傳欄位
+        try:
+            shape = BOOKING_FIELDS.parse(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        # 分頁後的訂單（新到舊）與不分頁的總數
+        bookings, total = store.list_bookings({
+            'status': status or None,
+            'guest_email': guest_email or None,
+            'start_date': start_date or None,
+            'end_date': end_date or None
+        }, per_page, offset, shape)
+        
+        bookings_list = [BOOKING_FIELDS.serialize(booking, shape) for booking in bookings]
         
         return jsonify({
             "status": "success",
@@ -676,37 +567,15 @@ def check_availability():
         if not valid:
             return jsonify({"status": "error", "message": message}), 400
         
-        conn = get_db_connection()
-        
-        # 檢查房間是否存在且可用
-        room = conn.execute('''
-            SELECT * FROM rooms 
-            WHERE id = ? AND available = 1
-        ''', (room_id,)).fetchone()
-        
-        if room is None:
-            conn.close()
+        # 房間不存在或不可預訂時為 None
+        available = store.room_available(room_id, dates.parse_day(check_in), dates.parse_day(check_out))
+        if available is None:
             return jsonify({
                 "status": "error", 
                 "message": "房間不存在或不可預訂",
                 "available": False
             }), 400
         
-        # 檢查日期衝突
-        conflict = conn.execute('''
-            SELECT COUNT(*) FROM bookings 
-            WHERE room_id = ? 
-            AND status IN ('confirmed', 'checked_in')
-            AND (
-                (check_in <= ? AND check_out > ?) OR
-                (check_in < ? AND check_out >= ?)
-            )
-        ''', (room_id, check_out, check_in, check_out, check_in)).fetchone()[0]
-        
-        conn.close()
-        
-        available = conflict == 0
-        
         return jsonify({
             "status": "success",
             "room_id": room_id,
@@ -720,70 +589,69 @@ def check_availability():
         logger.error(f"檢查可用性失敗: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/quotes', methods=['POST'])
+def batch_quotes():
+    """批次報價：多間房 × 多段住宿的可訂狀態與總價（取代逐一呼叫 check-availability）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            stays = quotes.parse_stays(data.get('stays'), 30)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        if len(stays) > Config.QUOTE_MAX_STAYS:
+            return jsonify({"status": "error", "message": f"一次最多 {Config.QUOTE_MAX_STAYS} 段住宿"}), 400
+        
+        room_ids = data.get('room_ids')
+        if room_ids is not None:
+            if not isinstance(room_ids, list) or not all(isinstance(room_id, int) for room_id in room_ids):
+                return jsonify({"status": "error", "message": "room_ids 必須是整數陣列"}), 400
+            room_ids = list(dict.fromkeys(room_ids))
+            if len(room_ids) > Config.QUOTE_MAX_ROOMS:
+                return jsonify({"status": "error", "message": f"一次最多 {Config.QUOTE_MAX_ROOMS} 間房"}), 400
+        guests = data.get('guests', 1)
+        if not isinstance(guests, int) or guests < 1:
+            return jsonify({"status": "error", "message": "guests 必須是正整數"}), 400
+        rooms = store.quote_rooms(room_ids or None)
+        
+        if len(rooms) * len(stays) > Config.QUOTE_MAX_CELLS:
+            return jsonify({"status": "error", "message": f"一次最多 {Config.QUOTE_MAX_CELLS} 格報價"}), 400
+        
+        matrix = store.quote_matrix(rooms, stays)
+        
+        rooms_list = [{
+            "room_id": room['id'],
+            "room_name": room['name'],
+            "quotes": [{"available": available and room['capacity'] >= guests, "total_price": total_price}
+                       for available, total_price in matrix[room['id']]]
+        } for room in rooms]
+        
+        return jsonify({
+            "status": "success",
+            "stays": [{
+                "check_in": dates.format_day(check_in_day),
+                "check_out": dates.format_day(check_out_day)
+            } for check_in_day, check_out_day in stays],
+            "count": len(rooms_list),
+            "data": rooms_list
+        })
+        
+    except Exception as e:
+        logger.error(f"批次報價失敗: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 # 統計資料 API
 @app.route('/api/stats')
 def get_stats():
     """取得統計資料"""
     try:
-        conn = get_db_connection()
-        
-        # 房間統計
-        room_stats = conn.execute('''
-            SELECT 
-                COUNT(*) as total_rooms,
-                SUM(CASE WHEN available = 1 THEN 1 ELSE 0 END) as available_rooms,
-                SUM(CASE WHEN featured = 1 THEN 1 ELSE 0 END) as featured_rooms,
-                AVG(price) as avg_price,
-                MAX(price) as max_price,
-                MIN(price) as min_price,
-                AVG(rating) as avg_rating
-            FROM rooms
-        ''').fetchone()
-        
-        # 訂單統計
-        booking_stats = conn.execute('''
-            SELECT 
-                COUNT(*) as total_bookings,
-                SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) as confirmed_bookings,
-                SUM(CASE WHEN status = 'checked_in' THEN 1 ELSE 0 END) as checked_in_bookings,
-                SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) as cancelled_bookings,
-                SUM(total_price) as total_revenue,
-                AVG(total_price) as avg_booking_price,
-                MIN(created_at) as first_booking,
-                MAX(created_at) as last_booking
-            FROM bookings
-        ''').fetchone()
-        
-        # 近期訂單
-        recent_bookings = conn.execute('''
-            SELECT b.*, r.name as room_name
-            FROM bookings b
-            JOIN rooms r ON b.room_id = r.id
-            ORDER BY b.created_at DESC
-            LIMIT 5
-        ''').fetchall()
-        
-        # 熱門房型
-        popular_rooms = conn.execute('''
-            SELECT r.id, r.name, r.price, COUNT(b.id) as booking_count,
-                   SUM(b.total_price) as revenue
-            FROM rooms r
-            LEFT JOIN bookings b ON r.id = b.room_id
-            GROUP BY r.id
-            ORDER BY booking_count DESC
-            LIMIT 5
-        ''').fetchall()
-        
-        conn.close()
+        # 房間統計、訂單統計、近期訂單與熱門房型
+        stats = store.stats()
         
-        return jsonify({
+        return jsonify(dict({
             "status": "success",
-            "timestamp": datetime.now().isoformat(),
-            "rooms": dict(room_stats),
-            "bookings": dict(booking_stats),
-            "recent_bookings": [dict(b) for b in recent_bookings],
-            "popular_rooms": [dict(r) for r in popular_rooms]
-        })
+            "timestamp": datetime.now().isoformat()
+        }, **stats))
         
     except Exception as e:
         logger.error(f"取得統計資料失敗: {e}")
@@ -798,34 +666,14 @@ def search():
         if not query:
             return jsonify({"status": "error", "message": "需要搜尋關鍵字"}), 400
         
-        conn = get_db_connection()
-        
-        # 搜尋房型
-        rooms = conn.execute('''
-            SELECT * FROM rooms 
-            WHERE name LIKE ? OR description LIKE ?
-            ORDER BY featured DESC, price ASC
-            LIMIT 10
-        ''', (f'%{query}%', f'%{query}%')).fetchall()
-        
-        # 搜尋訂單
-        bookings = conn.execute('''
-            SELECT b.*, r.name as room_name
-            FROM bookings b
-            JOIN rooms r ON b.room_id = r.id
-            WHERE b.guest_name LIKE ? OR b.guest_email LIKE ? 
-            OR b.id = ?
-            ORDER BY b.created_at DESC
-            LIMIT 10
-        ''', (f'%{query}%', f'%{query}%', query if query.isdigit() else 0)).fetchall()
-        
-        conn.close()
+        # 搜尋房型（名稱、說明）與訂單（住客姓名、email、訂單編號）
+        rooms, bookings = store.search(query, 10)
         
         return jsonify({
             "status": "success",
             "query": query,
-            "rooms": [dict(r) for r in rooms],
-            "bookings": [dict(b) for b in bookings],
+            "rooms": rooms,
+            "bookings": bookings,
             "counts": {
                 "rooms": len(rooms),
                 "bookings": len(bookings)
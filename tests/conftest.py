@@ -0,0 +1,92 @@
+import importlib
+import itertools
+from datetime import date, timedelta
+
+import pytest
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+_room_types = itertools.count(1)
+_properties = itertools.count(1)
+
+
+def day(offset):
+    """今天之後 offset 天的 'YYYY-MM-DD'"""
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    # app 在匯入時就會在目前目錄建立資料庫，先切到暫存目錄再匯入（各測試共用同一個資料庫）
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('RATE_LIMIT', '0')
+        mp.chdir(tmp_path_factory.mktemp('app'))
+        yield importlib.import_module('app')
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def room_type():
+    """每個測試各自的房型，房型庫存與其他測試的房間互不影響"""
+    return f'test-{next(_room_types)}'
+
+
+@pytest.fixture
+def shard(app_module, client):
+    """每個測試各自的館別，資料、變更序號與清理不影響其他測試"""
+    property_id = f'test-{next(_properties)}'
+    assert client.post('/api/properties', json={'property_id': property_id}, headers=ADMIN).status_code == 201
+    return app_module.shard_router.get(property_id)
+
+
+@pytest.fixture
+def make_room(client, room_type):
+    def make_room(**fields):
+        data = dict({'name': '測試房', 'price': 1000, 'room_type': room_type}, **fields)
+        response = client.post('/api/rooms', json=data, headers=ADMIN)
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()['data']
+    return make_room
+
+
+@pytest.fixture
+def book(client):
+    def book(room_id, check_in, check_out, **fields):
+        data = dict({'room_id': room_id, 'guest_name': '測試', 'guest_email': 'test@example.com',
+                     'check_in': check_in, 'check_out': check_out}, **fields)
+        return client.post('/api/bookings', json=data)
+    return book
+
+
+@pytest.fixture
+def mixed_writes(client, make_room, book, room_type):
+    """在測試房型上做一輪混合寫入：訂房、狀態轉換、取消、房型訂單分配與房間停售，回傳房間 id"""
+    def mixed_writes():
+        rooms = [make_room()['id'] for _ in range(3)]
+        ids = [book(rooms[0], day(10), day(13)).get_json()['data']['id'],
+               book(rooms[0], day(13), day(15)).get_json()['data']['id'],
+               book(rooms[1], day(11), day(14)).get_json()['data']['id'],
+               book(rooms[2], day(12), day(16)).get_json()['data']['id']]
+        assert client.delete(f'/api/bookings/{ids[1]}', headers=ADMIN).status_code == 200
+        status = client.post('/api/bookings/status', headers=ADMIN, json={'transitions': [
+            {'id': ids[0], 'status': 'checked_in'}, {'id': ids[2], 'status': 'cancelled'}]})
+        assert status.get_json()['updated_count'] == 2
+        assert client.post('/api/bookings/status', headers=ADMIN, json={
+            'ids': [ids[0]], 'status': 'checked_out'}).get_json()['updated_count'] == 1
+
+        type_booking = client.post('/api/type-bookings', json={
+            'room_type': room_type, 'guest_name': '測試', 'guest_email': 'test@example.com',
+            'check_in': day(12), 'check_out': day(14)}).get_json()['data']
+        client.post('/api/type-bookings', json={
+            'room_type': room_type, 'guest_name': '測試', 'guest_email': 'test@example.com',
+            'check_in': day(20), 'check_out': day(22)})
+        assert client.post(f'/api/type-bookings/{type_booking["id"]}/assign',
+                           headers=ADMIN).status_code == 200
+        assert client.patch(f'/api/rooms/{rooms[1]}', json={'available': False},
+                            headers=ADMIN).status_code == 200
+        return rooms
+    return mixed_writes
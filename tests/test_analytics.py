@@ -0,0 +1,105 @@
+import random
+import sqlite3
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pytest
+
+import analytics
+
+EPOCH = date(1970, 1, 1)
+START = (date(2026, 1, 20) - EPOCH).days
+END = (date(2026, 3, 10) - EPOCH).days
+ROOM_TYPES = ['double', 'single', None]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE rooms (id INTEGER PRIMARY KEY, room_type TEXT);
+        CREATE TABLE bookings (
+            id INTEGER PRIMARY KEY, room_id INTEGER, status TEXT,
+            check_in_day INTEGER, check_out_day INTEGER, total_price INTEGER
+        );
+    ''')
+    rng = random.Random(42)
+    conn.executemany('INSERT INTO rooms (room_type) VALUES (?)',
+                     [(ROOM_TYPES[i % 3],) for i in range(7)])
+    statuses = analytics.REVENUE_STATUSES + ('cancelled',)
+    rows = []
+    for _ in range(300):
+        check_in = rng.randrange(START - 15, END + 5)
+        rows.append((rng.randrange(1, 8), rng.choice(statuses), check_in,
+                     check_in + rng.randrange(1, 12), rng.randrange(1000, 20000)))
+    conn.executemany('''
+        INSERT INTO bookings (room_id, status, check_in_day, check_out_day, total_price)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    yield conn
+    conn.close()
+
+
+def _period_start(night, group_by):
+    day = EPOCH + timedelta(days=night)
+    if group_by == 'week':
+        day -= timedelta(days=day.weekday())
+    elif group_by == 'month':
+        day = day.replace(day=1)
+    return (day - EPOCH).days
+
+
+def _naive_report(conn, group_by, room_type=None):
+    """逐筆訂單、逐晚累加的對照實作"""
+    rooms = dict(conn.execute('SELECT id, COALESCE(room_type, \'\') FROM rooms').fetchall())
+    if room_type is not None:
+        rooms = {room_id: name for room_id, name in rooms.items() if name == room_type}
+    room_counts = defaultdict(int)
+    for name in rooms.values():
+        room_counts[name] += 1
+
+    sold = defaultdict(int)
+    revenue = defaultdict(float)
+    supply = defaultdict(int)
+    for night in range(START, END):
+        for name, count in room_counts.items():
+            supply[(_period_start(night, group_by), name)] += count
+    for room_id, status, check_in, check_out, price in conn.execute(
+            'SELECT room_id, status, check_in_day, check_out_day, total_price FROM bookings'):
+        if status not in analytics.REVENUE_STATUSES or room_id not in rooms:
+            continue
+        for night in range(max(check_in, START), min(check_out, END)):
+            key = (_period_start(night, group_by), rooms[room_id])
+            sold[key] += 1
+            revenue[key] += price / (check_out - check_in)
+
+    by_type = {key: (sold[key], supply[key], revenue[key]) for key in supply}
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for (period, _), values in by_type.items():
+        for index, value in enumerate(values):
+            totals[period][index] += value
+    return by_type, totals
+
+
+def _check(row, sold, supply, revenue):
+    assert row['room_nights_sold'] == sold
+    assert row['room_nights_available'] == supply
+    assert row['revenue'] == pytest.approx(revenue, abs=0.01)
+    assert row['occupancy'] == pytest.approx(sold / supply, abs=1e-4)
+    assert row['adr'] == pytest.approx(revenue / sold if sold else 0, abs=0.01)
+    assert row['revpar'] == pytest.approx(revenue / supply, abs=0.01)
+
+
+@pytest.mark.parametrize('group_by', analytics.GROUP_BY)
+@pytest.mark.parametrize('room_type', [None, 'single'])
+def test_report_matches_a_per_night_loop(conn, group_by, room_type):
+    by_type, totals = analytics.occupancy_report(conn, START, END, group_by, room_type)
+    expected_by_type, expected_totals = _naive_report(conn, group_by, room_type)
+
+    assert {(row['period_start'], row['room_type']) for row in by_type} == set(expected_by_type)
+    for row in by_type:
+        _check(row, *expected_by_type[(row['period_start'], row['room_type'])])
+    assert [row['period_start'] for row in totals] == sorted(expected_totals)
+    for row in totals:
+        assert row['room_type'] is None
+        _check(row, *expected_totals[row['period_start']])
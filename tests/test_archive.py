@@ -0,0 +1,64 @@
+import pytest
+
+from conftest import ADMIN, day
+
+
+@pytest.fixture
+def past_bookings(app_module, make_room, book):
+    """退房日在 100 天前、狀態分別為 completed / cancelled / confirmed 的訂單，以及一筆 10 天前退房的 completed"""
+    room = make_room()['id']
+    ids = [book(room, day(50 + 2 * i), day(51 + 2 * i), guest_email='archive@example.com').get_json()['data']['id']
+           for i in range(4)]
+    today = app_module.dates.today_day()
+    stays = [(today - 101, today - 100, 'completed'), (today - 102, today - 101, 'cancelled'),
+             (today - 104, today - 103, 'confirmed'), (today - 11, today - 10, 'completed')]
+    with app_module.shard_router.get().pool.connection() as conn:
+        for booking_id, (check_in, check_out, status) in zip(ids, stays):
+            conn.execute('''
+                UPDATE bookings SET check_in = ?, check_out = ?, check_in_day = ?, check_out_day = ?, status = ?
+                WHERE id = ?
+            ''', (app_module.dates.format_day(check_in), app_module.dates.format_day(check_out),
+                  check_in, check_out, status, booking_id))
+        conn.commit()
+    return room, ids
+
+
+def _hot_ids(app_module, ids):
+    with app_module.shard_router.get().pool.connection() as conn:
+        return [row[0] for row in conn.execute(
+            f'SELECT id FROM bookings WHERE id IN ({",".join("?" * len(ids))}) ORDER BY id', ids)]
+
+
+def test_archive_moves_old_finished_bookings(app_module, client, past_bookings):
+    room, ids = past_bookings
+    before = client.get(f'/api/bookings/{ids[0]}').get_json()['data']
+
+    assert app_module.run_archive(30, [app_module.DEFAULT_PROPERTY]) >= 2
+    # 仍在進行中與近期退房的訂單留在熱資料
+    assert _hot_ids(app_module, ids) == ids[2:]
+
+    # 已封存的訂單仍可依 id 讀取，並帶有 archived_at
+    for booking_id in ids[:2]:
+        response = client.get(f'/api/bookings/{booking_id}')
+        assert response.status_code == 200
+        assert response.get_json()['data']['archived_at']
+    archived = client.get(f'/api/bookings/{ids[0]}').get_json()['data']
+    assert {key: value for key, value in archived.items() if key != 'archived_at'} == \
+        {key: value for key, value in before.items() if key != 'archived_at'}
+    assert 'archived_at' not in client.get(f'/api/bookings/{ids[2]}').get_json()['data']
+
+    # 房間的訂單數改記在 archived_booking_count，仍不能刪除有訂單的房間
+    room_data = client.get(f'/api/rooms/{room}?fields=total_booking_count,archived_booking_count').get_json()['data']
+    assert (room_data['total_booking_count'], room_data['archived_booking_count']) == (2, 2)
+    assert client.delete(f'/api/rooms/{room}', headers=ADMIN).status_code == 400
+
+    # 住宿區間涵蓋封存期間的列表查詢會一併查封存檔
+    listed = client.get(f'/api/bookings?guest_email=archive@example.com&start={day(-120)}').get_json()['data']
+    assert sorted(booking['id'] for booking in listed) == ids
+
+
+def test_archive_is_idempotent(app_module, past_bookings):
+    _, ids = past_bookings
+    app_module.run_archive(30, [app_module.DEFAULT_PROPERTY])
+    assert app_module.run_archive(30, [app_module.DEFAULT_PROPERTY]) == 0
+    assert _hot_ids(app_module, ids) == ids[2:]
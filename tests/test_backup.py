@@ -0,0 +1,184 @@
+import os
+import sqlite3
+
+import pytest
+
+import backup
+
+
+def make_db(path, rows=200):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, body TEXT)')
+    conn.executemany('INSERT INTO items (body) VALUES (?)', [(f'{i:04d}' * 100,) for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def execute(path, *statements):
+    conn = sqlite3.connect(path)
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT id, body FROM items ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+def snapshot(database, directory, incremental=False, compress=True):
+    return backup.snapshot(str(database), str(directory), 'hotel', incremental, sleep=0, compress=compress)
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / 'hotel.db'
+    make_db(path)
+    return path
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return tmp_path / 'backups'
+
+
+def test_full_snapshot_restores_the_database(database, directory, tmp_path):
+    manifest = snapshot(database, directory)
+    assert manifest['kind'] == 'full'
+    assert manifest['depth'] == 0
+    assert manifest['file'].endswith('.db.gz')
+    assert manifest['changed_pages'] == manifest['page_count']
+
+    target = tmp_path / 'restored.db'
+    backup.restore(str(directory), manifest['name'], str(target))
+    assert rows(target) == rows(database)
+
+
+def test_uncompressed_full_snapshot_is_a_plain_database(database, directory):
+    manifest = snapshot(database, directory, compress=False)
+    assert manifest['file'].endswith('.db')
+    assert rows(directory / manifest['file']) == rows(database)
+
+
+def test_incremental_snapshot_stores_only_changed_pages(database, directory, tmp_path):
+    full = snapshot(database, directory)
+    before = rows(database)
+    execute(database, "UPDATE items SET body = 'changed' WHERE id = 1")
+    delta = snapshot(database, directory, incremental=True)
+
+    assert delta['kind'] == 'incremental'
+    assert delta['parent'] == full['name']
+    assert delta['depth'] == 1
+    assert 0 < delta['changed_pages'] < delta['page_count']
+    assert [manifest['name'] for manifest in backup.chain(str(directory), delta['name'])] == \
+        [full['name'], delta['name']]
+
+    backup.restore(str(directory), delta['name'], str(tmp_path / 'latest.db'))
+    assert rows(tmp_path / 'latest.db') == rows(database)
+    # 完整快照本身仍然還原成變更前的內容
+    backup.restore(str(directory), full['name'], str(tmp_path / 'earlier.db'))
+    assert rows(tmp_path / 'earlier.db') == before
+
+
+def test_incremental_snapshot_without_changes_writes_nothing(database, directory):
+    full = snapshot(database, directory)
+    again = snapshot(database, directory, incremental=True)
+    assert again['unchanged'] is True
+    assert again['name'] == full['name']
+    assert len(backup.list_snapshots(str(directory), 'hotel')) == 1
+
+
+def test_incremental_chain_is_capped(database, directory, monkeypatch):
+    monkeypatch.setattr(backup, 'MAX_CHAIN', 2)
+    kinds = []
+    for i in range(4):
+        execute(database, f"UPDATE items SET body = 'v{i}' WHERE id = 1")
+        kinds.append(snapshot(database, directory, incremental=True)['kind'])
+    # 第一份沒有上一份快照；深度到 MAX_CHAIN 之後重新做完整快照
+    assert kinds == ['full', 'incremental', 'incremental', 'full']
+
+
+def test_latest_can_skip_incrementals(database, directory):
+    full = snapshot(database, directory)
+    execute(database, "UPDATE items SET body = 'changed' WHERE id = 1")
+    delta = snapshot(database, directory, incremental=True)
+    assert backup.latest(str(directory), 'hotel')['name'] == delta['name']
+    assert backup.latest(str(directory), 'hotel', 'full')['name'] == full['name']
+    assert backup.latest(str(directory), 'other') is None
+
+
+def test_restore_refuses_to_overwrite_without_force(database, directory, tmp_path):
+    manifest = snapshot(database, directory)
+    target = tmp_path / 'existing.db'
+    target.write_bytes(b'keep me')
+
+    with pytest.raises(ValueError):
+        backup.restore(str(directory), manifest['name'], str(target))
+    assert target.read_bytes() == b'keep me'
+
+    backup.restore(str(directory), manifest['name'], str(target), force=True)
+    assert rows(target) == rows(database)
+
+
+def test_check_only_verifies_without_writing(database, directory, tmp_path):
+    manifest = snapshot(database, directory)
+    target = tmp_path / 'untouched.db'
+    assert backup.restore(str(directory), manifest['name'], str(target), check_only=True)['name'] == manifest['name']
+    assert not target.exists()
+    assert not os.path.exists(f'{target}.restore.tmp')
+
+
+def test_restore_rejects_a_tampered_snapshot(database, directory, tmp_path):
+    manifest = snapshot(database, directory, compress=False)
+    path = directory / manifest['file']
+    data = bytearray(path.read_bytes())
+    data[-10] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    target = tmp_path / 'restored.db'
+    with pytest.raises(ValueError):
+        backup.restore(str(directory), manifest['name'], str(target))
+    assert not target.exists()
+    with pytest.raises(ValueError):
+        backup.verify(str(path), manifest)
+
+
+def test_restore_rejects_a_missing_snapshot(directory, tmp_path):
+    with pytest.raises(ValueError):
+        backup.restore(str(directory), 'hotel-missing', str(tmp_path / 'restored.db'))
+
+
+def test_incremental_after_vacuum_restores_the_smaller_database(database, directory, tmp_path):
+    full = snapshot(database, directory)
+    execute(database, 'DELETE FROM items WHERE id > 20')
+    conn = sqlite3.connect(database)
+    conn.execute('VACUUM')
+    conn.close()
+    delta = snapshot(database, directory, incremental=True)
+
+    assert delta['kind'] == 'incremental'
+    assert delta['page_count'] < full['page_count']
+    target = tmp_path / 'restored.db'
+    backup.restore(str(directory), delta['name'], str(target))
+    assert os.path.getsize(target) == delta['size']
+    assert rows(target) == rows(database)
+
+
+def test_prune_keeps_whole_chains(database, directory, tmp_path):
+    names = []
+    for i, incremental in enumerate((False, True, False, True, False)):
+        execute(database, f"UPDATE items SET body = 'v{i}' WHERE id = 1")
+        names.append(snapshot(database, directory, incremental=incremental)['name'])
+
+    assert backup.prune(str(directory), 'hotel', 5) == []
+    assert backup.prune(str(directory), 'hotel', 2) == names[:2]
+    assert [manifest['name'] for manifest in backup.list_snapshots(str(directory), 'hotel')] == names[2:]
+    assert not any(name.startswith(tuple(names[:2])) for name in os.listdir(directory))
+
+    # 保留下來的增量仍然能從它的完整快照還原
+    backup.restore(str(directory), names[3], str(tmp_path / 'restored.db'), check_only=True)
@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import ADMIN, day
+
+
+@pytest.fixture
+def bookings(make_room, book):
+    room = make_room()['id']
+    return [book(room, day(40 + 2 * i), day(41 + 2 * i)).get_json()['data']['id'] for i in range(3)]
+
+
+def _statuses(client, ids):
+    response = client.get(f'/api/bookings/batch?ids={",".join(map(str, ids))}')
+    return [booking['status'] for booking in response.get_json()['data']]
+
+
+def _bulk(client, data):
+    return client.post('/api/bookings/status', json=data, headers=ADMIN)
+
+
+@pytest.mark.parametrize('make_data', [
+    lambda ids: {'ids': ids, 'status': 'pending'},
+    lambda ids: {'ids': ids},
+    # 其中一筆無效時整批都不套用
+    lambda ids: {'transitions': [{'id': ids[0], 'status': 'checked_in'}, {'id': ids[1], 'status': 'done'}]},
+])
+def test_unknown_status_is_rejected(client, bookings, make_data):
+    response = _bulk(client, make_data(bookings))
+    assert response.status_code == 400
+    assert _statuses(client, bookings) == ['confirmed'] * 3
+
+
+def test_invalid_ids_are_rejected(client, bookings):
+    assert _bulk(client, {'transitions': [{'id': 'x', 'status': 'checked_in'}]}).status_code == 400
+    assert _bulk(client, {'ids': [], 'status': 'checked_in'}).status_code == 400
+    assert client.post('/api/bookings/status', json={'ids': bookings, 'status': 'checked_in'}).status_code == 401
+
+
+def test_only_allowed_transitions_are_applied(client, bookings):
+    response = _bulk(client, {'transitions': [
+        {'id': bookings[0], 'status': 'checked_in'},
+        {'id': bookings[1], 'status': 'completed'},
+        {'id': bookings[2], 'status': 'cancelled'},
+        {'id': 999999999, 'status': 'cancelled'},
+    ]}).get_json()
+    assert response['updated'] == {'checked_in': [bookings[0]], 'cancelled': [bookings[2]]}
+    assert [(item['id'], item['status']) for item in response['rejected']] == [
+        (bookings[1], 'completed'), (999999999, 'cancelled')]
+    assert _statuses(client, bookings) == ['checked_in', 'confirmed', 'cancelled']
+
+    # 已取消的訂單不能再變更
+    response = _bulk(client, {'ids': [bookings[2]], 'status': 'confirmed'}).get_json()
+    assert response['updated_count'] == 0
+    assert response['rejected'][0]['id'] == bookings[2]
+
+
+def test_row_with_a_status_outside_the_state_machine_is_rejected(app_module, client, bookings):
+    with app_module.shard_router.get().pool.connection() as conn:
+        conn.execute("UPDATE bookings SET status = 'pending' WHERE id = ?", (bookings[0],))
+        conn.commit()
+    response = _bulk(client, {'ids': bookings[:2], 'status': 'checked_in'})
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload['updated'] == {'checked_in': [bookings[1]]}
+    assert payload['rejected'][0]['id'] == bookings[0]
@@ -0,0 +1,54 @@
+from conftest import day
+
+import dates
+
+
+def _assert_no_day_columns(booking):
+    assert booking['check_in'] and booking['check_out']
+    assert not set(dates.DAY_COLUMNS) & set(booking)
+
+
+def test_booking_responses_omit_day_numbers(client, make_room, book):
+    room = make_room()
+    since = client.get('/api/changes', headers={'X-Read-Primary': '1'}).get_json()['next_since']
+    created = book(room['id'], day(40), day(42), guest_email='days@example.com').get_json()['data']
+    _assert_no_day_columns(created)
+
+    updated = client.put(f"/api/bookings/{created['id']}", json={'guests': 2}).get_json()['data']
+    _assert_no_day_columns(updated)
+    _assert_no_day_columns(client.get(f"/api/bookings/{created['id']}").get_json()['data'])
+    for booking in client.get(f"/api/bookings?room_id={room['id']}").get_json()['data']:
+        _assert_no_day_columns(booking)
+    for booking in client.get(f"/api/rooms/{room['id']}/bookings").get_json()['bookings']:
+        _assert_no_day_columns(booking)
+    for booking in client.get('/api/bookings/guest/days@example.com').get_json()['bookings']:
+        _assert_no_day_columns(booking)
+
+    changes = client.get(f'/api/changes?since={since}&entity=booking').get_json()['data']
+    assert changes
+    for change in changes:
+        _assert_no_day_columns(change['data'])
+
+
+def test_day_numbers_are_not_a_selectable_field(client):
+    assert client.get('/api/bookings?fields=id,check_in_day').status_code == 400
+
+
+def _booking_table_columns(app_module):
+    conn = app_module.shard_router.get().pool.acquire()
+    try:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(bookings)').fetchall()]
+    finally:
+        conn.close()
+    return set(columns) - set(dates.DAY_COLUMNS)
+
+
+def test_room_and_guest_booking_lists_keep_their_columns(app_module, client, make_room, book):
+    # 房間的訂單列表只有訂單本身的欄位，客人的訂單列表另外附上房間名稱與價格
+    room = make_room()
+    book(room['id'], day(50), day(51), guest_email='columns@example.com')
+    columns = _booking_table_columns(app_module)
+    [room_booking] = client.get(f"/api/rooms/{room['id']}/bookings").get_json()['bookings']
+    assert set(room_booking) == columns
+    [guest_booking] = client.get('/api/bookings/guest/columns@example.com').get_json()['bookings']
+    assert set(guest_booking) == columns | {'room_name', 'room_price'}
@@ -0,0 +1,61 @@
+import pytest
+
+from conftest import ADMIN, day
+
+
+def _changes(client, shard, since, **params):
+    query = '&'.join(f'{key}={value}' for key, value in dict(params, since=since).items())
+    return client.get(f'/api/changes?property_id={shard.property_id}&{query}')
+
+
+def _write(client, shard):
+    """新增房間、訂房再取消，產生三筆變更"""
+    room = client.post(f'/api/rooms?property_id={shard.property_id}', headers=ADMIN,
+                       json={'name': '測試房', 'price': 1000}).get_json()['data']['id']
+    booking = client.post(f'/api/bookings?property_id={shard.property_id}', json={
+        'room_id': room, 'guest_name': '測試', 'guest_email': 'test@example.com',
+        'check_in': day(5), 'check_out': day(6)}).get_json()['data']['id']
+    client.delete(f'/api/bookings/{booking}?property_id={shard.property_id}', headers=ADMIN)
+    return room, booking
+
+
+def test_cursor_pages_through_changes(client, shard):
+    room, booking = _write(client, shard)
+    first = _changes(client, shard, 0, limit=2).get_json()
+    assert [(record['entity'], record['id'], record['op']) for record in first['data']] == [
+        ('room', room, 'insert'), ('booking', booking, 'insert')]
+    assert first['has_more']
+
+    rest = _changes(client, shard, first['next_since']).get_json()
+    assert [(record['op'], record['data']['status']) for record in rest['data']] == [('cancel', 'cancelled')]
+    assert not rest['has_more']
+    assert _changes(client, shard, rest['next_since']).get_json()['count'] == 0
+
+
+def test_cursor_ahead_of_the_log_is_gone(client, shard):
+    _write(client, shard)
+    latest = _changes(client, shard, 0).get_json()['next_since']
+    assert _changes(client, shard, latest).status_code == 200
+    # 例如資料庫還原到較早的備份，或用了其他館別的游標
+    assert _changes(client, shard, latest + 1).status_code == 410
+    stream = client.get(f'/api/changes/stream?property_id={shard.property_id}&since={latest + 1}')
+    assert stream.status_code == 410
+
+
+@pytest.mark.parametrize('expired', [1, 3])
+def test_cursor_behind_pruned_changes_is_gone(app_module, client, shard, expired):
+    _write(client, shard)
+    seqs = [record['seq'] for record in _changes(client, shard, 0).get_json()['data']]
+    with shard.pool.connection() as conn:
+        conn.execute(f'''
+            UPDATE changes SET created_at = datetime('now', '-30 days') WHERE seq IN ({','.join('?' * expired)})
+        ''', seqs[:expired])
+        assert app_module.changes.prune(conn, 7) == expired
+        conn.commit()
+
+    # 被清理的紀錄之前的游標無法接續；最後一筆被清理的序號之後仍可接續
+    assert _changes(client, shard, 0).status_code == 410
+    assert _changes(client, shard, seqs[expired - 1] - 1).status_code == 410
+    response = _changes(client, shard, seqs[expired - 1])
+    assert response.status_code == 200
+    assert [record['seq'] for record in response.get_json()['data']] == seqs[expired:]
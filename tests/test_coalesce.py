@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from coalesce import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, followers):
+    """先讓一個請求開始計算，再送出 followers 個相同 key 的請求，回傳所有 (結果或例外, 是否共用)"""
+    outcomes = []
+    lock = threading.Lock()
+
+    def call():
+        try:
+            outcome = flight.do(key, fn)
+        except Exception as e:
+            outcome = (e, None)
+        with lock:
+            outcomes.append(outcome)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    while not flight.stats().get('default', {}).get('executed'):
+        time.sleep(0.001)
+    threads = [threading.Thread(target=call) for _ in range(followers)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()['default']['coalesced'] < followers:
+        time.sleep(0.001)
+    return leader, threads, outcomes
+
+
+def test_identical_calls_share_one_computation():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    leader, threads, outcomes = _run_concurrently(flight, 'k', compute, 5)
+    release.set()
+    for thread in [leader] + threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert sorted(outcomes, key=lambda outcome: outcome[1]) == [('result', False)] + [('result', True)] * 5
+    assert flight.stats() == {'default': {'executed': 1, 'coalesced': 5}}
+
+
+def test_error_is_raised_in_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise ValueError('boom')
+
+    leader, threads, outcomes = _run_concurrently(flight, 'k', compute, 3)
+    release.set()
+    for thread in [leader] + threads:
+        thread.join(5)
+    assert len(outcomes) == 4
+    assert all(isinstance(error, ValueError) for error, _ in outcomes)
+
+
+def test_finished_call_is_not_reused():
+    flight = SingleFlight()
+    assert flight.do('k', lambda: 1) == (1, False)
+    assert flight.do('k', lambda: 2) == (2, False)
+    with pytest.raises(KeyError):
+        flight.do('k', lambda: {}['missing'])
+    assert flight.do('k', lambda: 3) == (3, False)
+
+
+def test_read_your_writes_requests_are_not_coalesced(app_module, client, monkeypatch):
+    shared = []
+    monkeypatch.setattr(app_module.single_flight, 'do',
+                        lambda key, fn, group='default': shared.append(key) or (fn(), False))
+    client.get('/api/rooms?coalesce-test=1')
+    client.get('/api/rooms?coalesce-test=1', headers={'X-Read-Primary': '1'})
+    assert len(shared) == 1
@@ -0,0 +1,37 @@
+def _counters(conn, rooms):
+    rows = conn.execute(f'''
+        SELECT id, active_booking_count, total_booking_count FROM rooms
+        WHERE id IN ({','.join('?' * len(rooms))}) ORDER BY id
+    ''', rooms).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def test_counters_match_a_recount_after_mixed_writes(app_module, mixed_writes):
+    rooms = mixed_writes()
+    with app_module.shard_router.get().pool.connection() as conn:
+        counters = _counters(conn, rooms)
+        conn.execute(app_module.RECOUNT_BOOKINGS_SQL)
+        recounted = _counters(conn, rooms)
+        conn.rollback()
+    # 觸發器維護的計數要和依訂單表重新計算的結果相同
+    assert counters == recounted
+    # 房型訂單分配到第一間沒有衝突的房間（第二間的訂單已取消）
+    assert counters == [(rooms[0], 0, 2), (rooms[1], 1, 2), (rooms[2], 1, 1)]
+
+
+def test_check_counters_command(app_module, mixed_writes):
+    mixed_writes()
+    runner = app_module.app.test_cli_runner()
+    result = runner.invoke(args=['check-counters'])
+    assert result.exit_code == 0, result.output
+    assert '訂單計數一致' in result.output
+
+    with app_module.shard_router.get().pool.connection() as conn:
+        room_id = conn.execute('SELECT MAX(id) FROM rooms').fetchone()[0]
+        conn.execute('UPDATE rooms SET total_booking_count = total_booking_count + 5 WHERE id = ?', (room_id,))
+        conn.commit()
+    result = runner.invoke(args=['check-counters'])
+    assert result.exit_code == 1
+    assert f'房間 {room_id}:' in result.output
+    assert runner.invoke(args=['check-counters', '--fix']).exit_code == 0
+    assert runner.invoke(args=['check-counters']).exit_code == 0
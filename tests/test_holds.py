@@ -0,0 +1,82 @@
+import sqlite3
+
+import holds
+from holds import TimingWheel
+
+
+def test_wheel_expires_after_due_tick():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0)
+    wheel.schedule('a', 3)
+    assert wheel.advance(2) == []
+    assert wheel.advance(3) == ['a']
+    assert len(wheel) == 0
+
+
+def test_wheel_keeps_entries_due_in_a_later_round():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0)
+    wheel.schedule('late', 20)  # 20 % 8 與 4 同一個槽位，要轉過兩圈才到期
+    wheel.schedule('early', 4)
+    assert wheel.advance(8) == ['early']
+    assert wheel.advance(16) == []
+    assert wheel.advance(20) == ['late']
+
+
+def test_wheel_jump_past_a_full_round_expires_everything_due():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0)
+    for key, expires_at in (('a', 3), ('b', 7), ('c', 30)):
+        wheel.schedule(key, expires_at)
+    assert sorted(wheel.advance(100)) == ['a', 'b', 'c']
+
+
+def test_wheel_past_expiry_fires_on_next_tick():
+    wheel = TimingWheel(tick=1.0, slots=8, now=10)
+    wheel.schedule('a', 5)
+    assert wheel.advance(10) == []
+    assert wheel.advance(11) == ['a']
+
+
+def test_wheel_cancel_and_reschedule():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0)
+    wheel.schedule('a', 2)
+    wheel.schedule('b', 2)
+    wheel.cancel('b')
+    wheel.schedule('a', 6)
+    assert wheel.advance(5) == []
+    assert wheel.advance(6) == ['a']
+    assert len(wheel) == 0
+
+
+def _holds_db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE rooms (id INTEGER PRIMARY KEY, room_type TEXT)')
+    conn.executemany('INSERT INTO rooms VALUES (?, ?)', [(1, 'standard'), (2, 'standard'), (3, 'suite')])
+    holds.install(conn)
+    return conn
+
+
+def test_held_by_night_counts_each_night_separately():
+    conn = _holds_db()
+    holds.create(conn, 1, 100, 102, ttl=60, now=0)
+    holds.create(conn, 2, 102, 104, ttl=60, now=0)
+    holds.create(conn, 3, 100, 104, ttl=60, now=0)
+    assert holds.held_by_night(conn, 'standard', 100, 104, now=1) == {100: 1, 101: 1, 102: 1, 103: 1}
+    assert holds.held_by_night(conn, 'standard', 101, 103, now=1) == {101: 1, 102: 1}
+
+
+def test_held_by_night_skips_expired_released_and_excluded():
+    conn = _holds_db()
+    expired = holds.create(conn, 1, 100, 102, ttl=10, now=0)
+    released = holds.create(conn, 2, 100, 102, ttl=60, now=0)
+    holds.release(conn, released.token)
+    assert holds.held_by_night(conn, 'standard', 100, 102, now=5) == {100: 1, 101: 1}
+    assert holds.held_by_night(conn, 'standard', 100, 102, exclude=expired.token, now=5) == {}
+    assert holds.held_by_night(conn, 'standard', 100, 102, now=20) == {}
+
+
+def test_active_for_client():
+    conn = _holds_db()
+    holds.create(conn, 1, 100, 101, ttl=60, client='ip:1.2.3.4', now=0)
+    holds.create(conn, 2, 100, 101, ttl=10, client='ip:1.2.3.4', now=0)
+    holds.create(conn, 3, 100, 101, ttl=60, client='ip:5.6.7.8', now=0)
+    assert holds.active_for_client(conn, 'ip:1.2.3.4', now=5) == 2
+    assert holds.active_for_client(conn, 'ip:1.2.3.4', now=20) == 1
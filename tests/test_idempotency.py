@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+import uuid
+
+import pytest
+
+import idempotency
+from conftest import day
+from idempotency import IdempotencyStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    database = str(tmp_path / 'idempotency.db')
+    conn = sqlite3.connect(database)
+    conn.execute('''
+        CREATE TABLE idempotency_keys (
+            key TEXT PRIMARY KEY,
+            request_hash TEXT NOT NULL,
+            status_code INTEGER,
+            body BLOB,
+            locked_until REAL NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.close()
+    return IdempotencyStore(database)
+
+
+def test_second_begin_sees_the_request_in_flight(store):
+    assert store.begin('k', 'hash') == (idempotency.NEW, None)
+    assert store.begin('k', 'hash') == (idempotency.IN_FLIGHT, None)
+    assert store.begin('k', 'other') == (idempotency.MISMATCH, None)
+
+
+def test_completed_response_is_replayed(store):
+    store.begin('k', 'hash')
+    store.complete('k', 201, b'{"id": 1}')
+    assert store.begin('k', 'hash') == (idempotency.DONE, (201, b'{"id": 1}'))
+    assert store.begin('k', 'other') == (idempotency.MISMATCH, None)
+
+
+def test_released_key_can_be_retried(store):
+    store.begin('k', 'hash')
+    store.release('k')
+    assert store.begin('k', 'hash') == (idempotency.NEW, None)
+
+
+def test_abandoned_lock_is_taken_over(store):
+    store.lock_timeout = -1
+    store.begin('k', 'hash')
+    assert store.begin('k', 'hash') == (idempotency.NEW, None)
+
+
+def _booking(room_id, **fields):
+    return dict({'room_id': room_id, 'guest_name': '測試', 'guest_email': 'idempotent@example.com',
+                 'check_in': day(70), 'check_out': day(72)}, **fields)
+
+
+def _room_booking_count(client, room_id):
+    return client.get(f'/api/rooms/{room_id}/bookings').get_json()['count']
+
+
+def test_retry_with_the_same_key_replays_the_response(client, make_room):
+    room = make_room()
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    first = client.post('/api/bookings', json=_booking(room['id']), headers=headers)
+    retry = client.post('/api/bookings', json=_booking(room['id']), headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_data() == first.get_data()
+    assert _room_booking_count(client, room['id']) == 1
+
+
+def test_same_key_with_a_different_body_is_rejected(client, make_room):
+    room = make_room()
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    assert client.post('/api/bookings', json=_booking(room['id']), headers=headers).status_code == 201
+    response = client.post('/api/bookings', json=_booking(room['id'], guests=2), headers=headers)
+    assert response.status_code == 422
+    assert _room_booking_count(client, room['id']) == 1
+
+
+def test_concurrent_requests_with_the_same_key_run_once(app_module, make_room):
+    room = make_room()
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    barrier = threading.Barrier(4)
+    responses = []
+
+    def post():
+        client = app_module.app.test_client()
+        barrier.wait(5)
+        response = client.post('/api/bookings', json=_booking(room['id']), headers=headers)
+        responses.append((response.status_code, response.get_data()))
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    # 等待中的重複請求回放第一個請求的回應，不會看到「已被預訂」
+    assert len(set(responses)) == 1
+    assert responses[0][0] == 201
+    assert _room_booking_count(app_module.app.test_client(), room['id']) == 1
@@ -0,0 +1,38 @@
+from conftest import day
+
+
+def test_room_without_room_type_can_be_booked(make_room, book):
+    # 沒有房型的房間不在房型庫存帳中，不能因為找不到帳列就當作售完
+    room = make_room(room_type=None)
+    assert book(room['id'], day(30), day(32)).status_code == 201
+    assert book(room['id'], day(31), day(33)).status_code == 400
+
+
+def test_room_without_room_type_can_be_held(client, make_room):
+    room = make_room(room_type=None)
+    stay = {'room_id': room['id'], 'check_in': day(30), 'check_out': day(32)}
+    assert client.post('/api/holds', json=stay).status_code == 201
+    assert client.post('/api/holds', json=stay).status_code == 400
+
+
+def _ledger(conn, room_type):
+    return conn.execute('''
+        SELECT night, available, sold FROM inventory WHERE room_type = ? ORDER BY night
+    ''', (room_type,)).fetchall()
+
+
+def test_ledger_matches_a_rebuild_after_mixed_writes(app_module, mixed_writes, room_type):
+    mixed_writes()
+    today = app_module.dates.today_day()
+    with app_module.shard_router.get().pool.connection() as conn:
+        ledger = [tuple(row) for row in _ledger(conn, room_type)]
+        app_module.inventory.rebuild_inventory(conn, today, today + app_module.INVENTORY_HORIZON_DAYS)
+        rebuilt = {row[0]: tuple(row) for row in _ledger(conn, room_type)}
+        conn.rollback()
+    # 帳列在訂房時才建立；已建立的帳列要和依房間與訂單重新計算的結果相同
+    assert ledger
+    assert ledger == [rebuilt[night] for night, _, _ in ledger]
+    sold = {night - today: sold for night, _, sold in ledger if sold}
+    assert sold == {12: 2, 13: 2, 14: 1, 15: 1, 20: 1, 21: 1}
+    # 停售的房間不計入可售房數
+    assert {available for _, available, _ in ledger} == {2}
@@ -0,0 +1,73 @@
+import itertools
+import sqlite3
+
+import pytest
+
+from query_builder import FilterQuery
+
+ROWS = [(i, 500 + 250 * (i % 7), i % 3 == 0, ('single', 'double')[i % 2]) for i in range(1, 41)]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE rooms (id INTEGER PRIMARY KEY, price INTEGER, available INTEGER, room_type TEXT)')
+    conn.executemany('INSERT INTO rooms VALUES (?, ?, ?, ?)', ROWS)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def query():
+    return FilterQuery(
+        'SELECT {columns} FROM rooms WHERE 1=1',
+        'SELECT COUNT(*) FROM rooms WHERE 1=1',
+        {
+            'price_between': 'price BETWEEN ? AND ?',
+            'room_type': 'room_type = ?',
+            'available': 'available = 1'
+        },
+        paginate=True
+    )
+
+
+def _matches(row, filters):
+    _, price, available, room_type = row
+    if filters.get('price_between') is not None:
+        low, high = filters['price_between']
+        if not low <= price <= high:
+            return False
+    if filters.get('room_type') is not None and room_type != filters['room_type']:
+        return False
+    return not (filters.get('available') is not None and not available)
+
+
+FILTER_VALUES = {
+    'price_between': [None, (750, 1500)],
+    'room_type': [None, 'double'],
+    'available': [None, True]
+}
+
+
+@pytest.mark.parametrize('values', list(itertools.product(*FILTER_VALUES.values())))
+def test_every_filter_shape_matches_a_python_filter(conn, query, values):
+    filters = dict(zip(FILTER_VALUES, values))
+    sql, params, count_sql, count_params = query.build(filters, 'price DESC, id', limit=5, offset=2, columns='id')
+    expected = sorted((row for row in ROWS if _matches(row, filters)), key=lambda row: (-row[1], row[0]))
+
+    assert [row[0] for row in conn.execute(sql, params)] == [row[0] for row in expected[2:7]]
+    assert conn.execute(count_sql, count_params).fetchone()[0] == len(expected)
+
+
+def test_sql_is_compiled_once_per_shape(query):
+    first = query.build({'room_type': 'single'}, 'id', limit=10)
+    second = query.build({'room_type': 'double', 'available': None}, 'id', limit=20, offset=20)
+    assert second[0] is first[0] and second[2] is first[2]
+    assert second[1] == ['double', 20, 20]
+    assert query.shape_count() == 1
+
+    # 條件、排序或欄位不同都是新的形狀
+    query.build({'room_type': 'single', 'available': True}, 'id')
+    query.build({'room_type': 'single'}, 'price')
+    query.build({'room_type': 'single'}, 'id', columns='id')
+    assert query.shape_count() == 4
@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+import quotes
+from quotes import Occupancy
+
+
+def _bookings_db(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE bookings (room_id INTEGER, check_in_day INTEGER, check_out_day INTEGER, status TEXT)
+    ''')
+    conn.executemany('INSERT INTO bookings VALUES (?, ?, ?, ?)',
+                     [row if len(row) == 4 else row + ('confirmed',) for row in rows])
+    return conn
+
+
+def _occupancy(rows, start_day=0, end_day=10, extra=None):
+    return Occupancy(_bookings_db(rows), [1], start_day, end_day, extra=extra)
+
+
+def test_empty_room_is_one_window():
+    occupancy = _occupancy([])
+    assert occupancy.is_free(1, 0, 10)
+    assert occupancy.free_windows(1, 2, 0, 10) == [(0, 8)]
+    assert occupancy.free_windows(1, 11, 0, 10) == []
+
+
+def test_gaps_at_range_edges():
+    # 範圍前後各有一段空檔，訂單在中間
+    occupancy = _occupancy([(1, 3, 6)])
+    assert occupancy.free_windows(1, 2, 0, 10) == [(0, 1), (6, 8)]
+    assert occupancy.free_windows(1, 3, 0, 10) == [(0, 0), (6, 7)]
+    assert occupancy.free_windows(1, 4, 0, 10) == [(6, 6)]
+    # 跨越範圍開頭與結尾的訂單只留下中間的空檔
+    occupancy = _occupancy([(1, -3, 2), (1, 8, 15)])
+    assert occupancy.free_windows(1, 2, 0, 10) == [(2, 6)]
+    assert occupancy.free_windows(1, 7, 0, 10) == []
+
+
+def test_back_to_back_bookings_leave_no_gap():
+    occupancy = _occupancy([(1, 0, 3), (1, 3, 10)])
+    assert occupancy.free_windows(1, 1, 0, 10) == []
+    assert not occupancy.is_free(1, 2, 4)
+
+
+def test_overlapping_and_nested_intervals():
+    # [2, 3) 包在 [1, 8) 裡：空檔要以前綴最大退房日計算，不是前一筆的退房日
+    occupancy = _occupancy([(1, 1, 8), (1, 2, 3), (1, 5, 7), (1, 9, 10)])
+    assert occupancy.free_windows(1, 1, 0, 10) == [(0, 0), (8, 8)]
+    assert not occupancy.is_free(1, 3, 4)
+    assert occupancy.is_free(1, 8, 9)
+    assert not occupancy.is_free(1, 8, 10)
+
+
+def test_cancelled_bookings_and_extra_intervals():
+    occupancy = _occupancy([(1, 2, 5, 'cancelled'), (1, 6, 8)], extra={1: [(0, 2)]})
+    assert occupancy.free_windows(1, 2, 0, 10) == [(2, 4), (8, 8)]
+    assert not occupancy.is_free(1, 1, 3)
+    assert occupancy.is_free(1, 2, 6)
+
+
+def test_nearest_free_orders_by_distance():
+    occupancy = _occupancy([(1, 1, 8), (1, 9, 10)])
+    # 兩個空檔距離相同時先給較早的日期
+    assert occupancy.nearest_free(1, 4, 1, 0, 10) == [(0, 1), (8, 9)]
+    assert occupancy.nearest_free(1, 6, 1, 0, 10) == [(8, 9), (0, 1)]
+    # 想入住的日子落在空檔內時直接使用
+    occupancy = _occupancy([(1, 0, 2)])
+    assert occupancy.nearest_free(1, 5, 2, 0, 10) == [(5, 7)]
+    assert occupancy.nearest_free(1, 0, 2, 0, 10) == [(2, 4)]
+
+
+def test_parse_stays_rejects_bad_input():
+    [(check_in_day, check_out_day)] = quotes.parse_stays([{"check_in": "2027-01-01", "check_out": "2027-01-03"}], 30)
+    assert check_out_day - check_in_day == 2
+    for items in ([], None, [{"check_in": "2027-01-01"}],
+                  [{"check_in": "2027-01-03", "check_out": "2027-01-01"}],
+                  [{"check_in": "2027-01-01", "check_out": "2027-03-01"}]):
+        with pytest.raises(ValueError):
+            quotes.parse_stays(items, 30)
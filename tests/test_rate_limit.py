@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import rate_limit
+from conftest import ADMIN
+from rate_limit import LoadShedder, TokenBucketLimiter
+
+# 子行程與測試共用同一個狀態檔，各自扣 token，印出放行的次數
+_CHILD = '''
+import sys
+from rate_limit import TokenBucketLimiter
+limiter = TokenBucketLimiter(sys.argv[1], 0.0001, 100)
+print(sum(limiter.allow('shared')[0] for _ in range(int(sys.argv[2]))))
+'''
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'ratelimit')
+
+
+def _spawn(path, attempts):
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(rate_limit.__file__)))
+    return subprocess.Popen([sys.executable, '-c', _CHILD, path, str(attempts)],
+                            stdout=subprocess.PIPE, text=True, env=env)
+
+
+def test_bucket_denies_after_burst_and_refills(path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: now[0])
+    limiter = TokenBucketLimiter(path, rate=2, burst=3)
+
+    assert [limiter.allow('a')[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.allow('a')
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
+    # 其他 key 有自己的 bucket
+    assert limiter.allow('b')[0]
+
+    now[0] += 0.5
+    assert limiter.allow('a')[0]
+    assert not limiter.allow('a')[0]
+    # 補充不超過桶容量
+    now[0] += 60
+    assert [limiter.allow('a')[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_bucket_is_shared_across_processes(path):
+    limiter = TokenBucketLimiter(path, 0.0001, 100)
+    assert sum(limiter.allow('shared')[0] for _ in range(30)) == 30
+
+    children = [_spawn(path, 60), _spawn(path, 60)]
+    allowed = sum(int(child.communicate(timeout=30)[0]) for child in children)
+    # 三個行程合計只拿到一桶 token
+    assert allowed == 70
+    assert not limiter.allow('shared')[0]
+
+
+def test_load_shedder_caps_inflight_requests():
+    shedder = LoadShedder(2)
+    assert shedder.enter() and shedder.enter()
+    assert not shedder.enter()
+    assert shedder.shed == 1
+    shedder.leave()
+    assert shedder.enter()
+
+
+@pytest.mark.parametrize('headers, identity', [
+    ({}, 'ip:10.0.0.1'),
+    # 未驗證的標頭值不會換到新的 bucket
+    ({'X-API-Key': 'unknown'}, 'ip:10.0.0.1'),
+    ({'X-Admin-Password': 'wrong'}, 'ip:10.0.0.1'),
+    ({'X-Forwarded-For': '1.2.3.4'}, 'ip:10.0.0.1'),
+    ({'X-API-Key': 'registered'}, rate_limit.client_identity('registered')),
+    (ADMIN, rate_limit.client_identity('admin123')),
+])
+def test_client_identity_only_trusts_verified_credentials(app_module, monkeypatch, headers, identity):
+    monkeypatch.setattr(app_module, 'API_KEYS', frozenset({'registered'}))
+    with app_module.app.test_request_context('/api/rooms', headers=headers,
+                                             environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        assert app_module.client_identity() == identity
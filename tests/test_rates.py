@@ -0,0 +1,50 @@
+from conftest import ADMIN, day
+
+
+def _compiled(conn, rooms):
+    return conn.execute(f'''
+        SELECT room_id, night, rate, cumulative FROM nightly_rates
+        WHERE room_id IN ({','.join('?' * len(rooms))}) ORDER BY room_id, night
+    ''', rooms).fetchall()
+
+
+def _add_rule(client, **rule):
+    response = client.post('/api/rates/rules', json=dict({'name': '測試規則'}, **rule), headers=ADMIN)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data']['id']
+
+
+def test_nightly_rates_match_a_full_compile_after_rule_changes(app_module, client, make_room, room_type):
+    rooms = [make_room()['id'], make_room(price=2000)['id']]
+    weekend = _add_rule(client, kind='weekday', room_type=room_type, weekdays=[5, 6], percent=20)
+    _add_rule(client, kind='season', room_id=rooms[0], start_date=day(5), end_date=day(15), amount=300)
+    season = _add_rule(client, kind='season', room_type=room_type, start_date=day(10), end_date=day(40),
+                       percent=-10, priority=1)
+    _add_rule(client, kind='length_of_stay', room_type=room_type, min_nights=3, percent=-5)
+
+    # 修改、刪除規則與變更底價都只重新編譯受影響的區間，之後的累計和整段平移
+    assert client.put(f'/api/rates/rules/{season}', headers=ADMIN, json={
+        'name': '測試規則', 'kind': 'season', 'room_type': room_type,
+        'start_date': day(20), 'end_date': day(30), 'percent': -10, 'priority': 1}).status_code == 200
+    assert client.delete(f'/api/rates/rules/{weekend}', headers=ADMIN).status_code == 200
+    _add_rule(client, kind='weekday', room_type=room_type, weekdays='0,1', amount=50)
+    assert client.patch(f'/api/rooms/{rooms[0]}', json={'price': 1500}, headers=ADMIN).status_code == 200
+
+    with app_module.shard_router.get().pool.connection() as conn:
+        compiled = [tuple(row) for row in _compiled(conn, rooms)]
+        last_night = compiled[-1][1]
+        conn.execute(f'DELETE FROM nightly_rates WHERE room_id IN ({",".join("?" * len(rooms))})', rooms)
+        app_module.rates.extend(conn, last_night + 1, rooms)
+        recompiled = [tuple(row) for row in _compiled(conn, rooms)]
+        conn.rollback()
+    assert compiled == recompiled
+
+
+def test_calendar_total_applies_length_of_stay_to_the_nightly_sum(client, make_room, room_type):
+    room = make_room()['id']
+    _add_rule(client, kind='season', room_type=room_type, start_date=day(3), end_date=day(5), amount=500)
+    _add_rule(client, kind='length_of_stay', room_type=room_type, min_nights=4, percent=-10)
+
+    calendar = client.get(f'/api/rooms/{room}/calendar?check_in={day(1)}&check_out={day(7)}').get_json()
+    assert [night['rate'] for night in calendar['nights']] == [1000, 1000, 1500, 1500, 1000, 1000]
+    assert calendar['total_price'] == 7000 * 90 // 100
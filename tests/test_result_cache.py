@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+import result_cache
+from conftest import ADMIN
+from result_cache import HIT, MISS, STALE, BYPASS, ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def _counter():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+    return compute, calls
+
+
+def test_expiry_is_aligned_to_the_ttl_bucket(clock):
+    cache = ResultCache()
+    compute, calls = _counter()
+    clock[0] = 1007.0
+    assert cache.get_or_compute('k', compute, ttl=10) == (1, MISS)
+    clock[0] = 1009.9
+    assert cache.get_or_compute('k', compute, ttl=10) == (1, HIT)
+    # 1010 是區間邊界，不是第一次計算後的 10 秒
+    clock[0] = 1010.0
+    assert cache.get_or_compute('k', compute, ttl=10) == (2, MISS)
+    assert len(calls) == 2
+
+
+def test_stale_value_is_served_while_refreshing(clock):
+    cache = ResultCache()
+    refreshed = threading.Event()
+    values = iter(['old', 'new'])
+
+    def compute():
+        value = next(values)
+        if value == 'new':
+            refreshed.set()
+        return value
+
+    assert cache.get_or_compute('k', compute, ttl=10, stale=30) == ('old', MISS)
+    clock[0] = 1015.0
+    assert cache.get_or_compute('k', compute, ttl=10, stale=30) == ('old', STALE)
+    assert refreshed.wait(5)
+    for _ in range(100):
+        if cache.peek('k') == 'new':
+            break
+        time.sleep(0.01)
+    assert cache.get_or_compute('k', compute, ttl=10, stale=30) == ('new', HIT)
+
+
+def test_past_the_stale_window_recomputes(clock):
+    cache = ResultCache()
+    compute, _ = _counter()
+    cache.get_or_compute('k', compute, ttl=10, stale=5)
+    clock[0] = 1016.0
+    assert cache.get_or_compute('k', compute, ttl=10, stale=5) == (2, MISS)
+
+
+def test_force_and_should_cache(clock):
+    cache = ResultCache()
+    compute, _ = _counter()
+    cache.get_or_compute('k', compute, ttl=10)
+    assert cache.get_or_compute('k', compute, ttl=10, force=True) == (2, BYPASS)
+    assert cache.get_or_compute('k', compute, ttl=10) == (2, HIT)
+
+    assert cache.get_or_compute('odd', compute, ttl=10, should_cache=lambda value: value % 2 == 0) == (3, MISS)
+    assert cache.peek('odd') is None
+    cache.invalidate('k')
+    assert cache.peek('k') is None
+
+
+def test_cached_route_headers(client):
+    first = client.get('/api/analytics/occupancy?cache-test=1', headers=ADMIN)
+    second = client.get('/api/analytics/occupancy?cache-test=1', headers=ADMIN)
+    assert first.status_code == 200
+    assert (first.headers['X-Cache'], second.headers['X-Cache']) in {(MISS, HIT), (HIT, HIT)}
+    assert second.get_data() == first.get_data()
+    # 要求讀到自己寫入的請求不使用快取
+    bypass = client.get('/api/analytics/occupancy?cache-test=1', headers=dict(ADMIN, **{'X-Read-Primary': '1'}))
+    assert bypass.headers['X-Cache'] == BYPASS
@@ -0,0 +1,67 @@
+import uuid
+
+from conftest import ADMIN, day
+
+
+def _room(client, property_id, **fields):
+    response = client.post(f'/api/rooms?property_id={property_id}', headers=ADMIN,
+                           json=dict({'name': '測試房', 'price': 1000}, **fields))
+    assert response.status_code == 201
+    return response.get_json()['data']['id']
+
+
+def test_unknown_property_is_not_found(client):
+    assert client.get('/api/rooms?property_id=missing').status_code == 404
+    assert client.post('/api/rooms?property_id=missing', json={'name': 'x', 'price': 1},
+                       headers=ADMIN).status_code == 404
+
+
+def test_create_property_validates_the_id(client, shard):
+    assert client.post('/api/properties', json={'property_id': '../etc'}, headers=ADMIN).status_code == 400
+    assert client.post('/api/properties', json={'property_id': shard.property_id},
+                       headers=ADMIN).status_code == 409
+
+
+def test_each_property_has_its_own_database(app_module, client, shard):
+    room = _room(client, shard.property_id, name='分館房')
+    assert shard.database != app_module.shard_router.get().database
+
+    rooms = client.get(f'/api/rooms?property_id={shard.property_id}').get_json()['data']
+    assert [item['name'] for item in rooms] == ['分館房']
+    # 預設館別中同 id 的房間（如果有）不是這一間
+    default_room = client.get(f'/api/rooms/{room}').get_json().get('data')
+    assert default_room is None or default_room['name'] != '分館房'
+
+    health = client.get(f'/api/health?property_id={shard.property_id}').get_json()
+    assert (health['room_count'], health['booking_count']) == (1, 0)
+
+
+def test_idempotency_keys_are_scoped_per_property(app_module, client):
+    first, second = f'idem-{uuid.uuid4().hex[:8]}', f'idem-{uuid.uuid4().hex[:8]}'
+    for property_id in (first, second):
+        client.post('/api/properties', json={'property_id': property_id}, headers=ADMIN)
+    headers = dict(ADMIN, **{'Idempotency-Key': 'same-key'})
+    data = {'name': '測試房', 'price': 1000}
+    responses = [client.post(f'/api/rooms?property_id={property_id}', json=data, headers=headers)
+                 for property_id in (first, second)]
+    assert [response.status_code for response in responses] == [201, 201]
+    assert 'Idempotent-Replayed' not in responses[1].headers
+    assert client.get(f'/api/rooms?property_id={second}').get_json()['count'] == 1
+
+
+def test_fan_out_search_merges_properties(client, shard):
+    email = f'{uuid.uuid4().hex[:8]}@example.com'
+    room = _room(client, shard.property_id)
+    booking = {'room_id': room, 'guest_name': '測試', 'guest_email': email,
+               'check_in': day(5), 'check_out': day(6)}
+    assert client.post(f'/api/bookings?property_id={shard.property_id}', json=booking).status_code == 201
+
+    response = client.get(f'/api/properties/bookings?guest_email={email}', headers=ADMIN).get_json()
+    assert [item['property_id'] for item in response['data']] == [shard.property_id]
+    assert response['counts'][shard.property_id] == 1
+    assert sum(response['counts'].values()) == 1
+
+    stats = client.get('/api/properties/stats?fresh=1', headers=ADMIN).get_json()
+    assert stats['properties'][shard.property_id]['bookings']['total_bookings'] == 1
+    assert stats['bookings']['total_bookings'] == sum(
+        item['bookings']['total_bookings'] for item in stats['properties'].values())
@@ -0,0 +1,95 @@
+import importlib
+import os
+from datetime import date, timedelta
+
+import pytest
+
+CHECK_IN = (date.today() + timedelta(days=10)).isoformat()
+CHECK_OUT = (date.today() + timedelta(days=13)).isoformat()
+
+# 兩個引擎都從相同的範例資料開始，依序執行；寫入後的讀取也必須一致
+REQUESTS = [
+    ('get', '/api/rooms', None),
+    ('get', '/api/rooms?sort_by=rating&sort_order=desc&per_page=3&page=2', None),
+    ('get', '/api/rooms?min_price=3000&fields=summary', None),
+    ('get', '/api/rooms?capacity=4&fields=id,name,price', None),
+    ('get', '/api/rooms/2', None),
+    ('get', '/api/rooms/99', None),
+    ('get', f'/api/rooms/available?check_in={CHECK_IN}&check_out={CHECK_OUT}&guests=2', None),
+    ('post', '/api/bookings', {'room_id': 1, 'guest_name': '測試', 'guest_email': 'test@example.com',
+                               'check_in': CHECK_IN, 'check_out': CHECK_OUT}),
+    ('post', '/api/bookings', {'room_id': 1, 'guest_name': '重複', 'guest_email': 'dup@example.com',
+                               'check_in': CHECK_IN, 'check_out': CHECK_OUT}),
+    ('post', '/api/bookings', {'room_id': 99, 'guest_name': '不存在', 'guest_email': 'none@example.com',
+                               'check_in': CHECK_IN, 'check_out': CHECK_OUT}),
+    ('get', f'/api/rooms/available?check_in={CHECK_IN}&check_out={CHECK_OUT}&guests=2', None),
+    ('get', f'/api/bookings/check-availability?room_id=1&check_in={CHECK_IN}&check_out={CHECK_OUT}', None),
+    ('get', f'/api/bookings/check-availability?room_id=2&check_in={CHECK_IN}&check_out={CHECK_OUT}', None),
+    ('get', '/api/bookings', None),
+    ('get', '/api/bookings?status=confirmed&per_page=2', None),
+    ('get', '/api/bookings?guest_email=example&fields=summary', None),
+    ('post', '/api/quotes', {'stays': [{'check_in': CHECK_IN, 'check_out': CHECK_OUT}], 'guests': 2}),
+    ('post', '/api/quotes', {'stays': [{'check_in': CHECK_IN, 'check_out': CHECK_OUT}], 'room_ids': [1, 3]}),
+    ('get', '/api/stats', None),
+    ('get', '/api/search?q=套房', None),
+    ('get', '/api/search?q=example', None),
+]
+
+
+# 建立時間取決於執行當下的秒數，兩個引擎不會完全相同
+TIMESTAMP_KEYS = {'timestamp', 'created_at', 'first_booking', 'last_booking'}
+
+
+def without_timestamps(value):
+    if isinstance(value, dict):
+        return {key: without_timestamps(item) for key, item in value.items() if key not in TIMESTAMP_KEYS}
+    if isinstance(value, list):
+        return [without_timestamps(item) for item in value]
+    return value
+
+
+@pytest.fixture(scope='module')
+def test_db(tmp_path_factory):
+    # test_db 在匯入時就會建立資料庫與日誌檔，先切到暫存目錄再匯入
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('RATE_LIMIT', '0')
+        mp.chdir(tmp_path_factory.mktemp('test_db'))
+        yield importlib.import_module('test_db')
+
+
+def open_engine(test_db, monkeypatch, engine):
+    monkeypatch.setattr(test_db.Config, 'STORAGE_ENGINE', engine)
+    return test_db.open_storage()
+
+
+def replay(test_db, monkeypatch, store):
+    monkeypatch.setattr(test_db, 'store', store)
+    client = test_db.app.test_client()
+    responses = []
+    for method, url, body in REQUESTS:
+        response = getattr(client, method)(url, json=body)
+        responses.append((method, url, response.status_code, without_timestamps(response.get_json())))
+    return responses
+
+
+def test_memory_engine_matches_sqlite(test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(test_db.Config, 'DATABASE', str(tmp_path / 'hotel.db'))
+    memory = replay(test_db, monkeypatch, open_engine(test_db, monkeypatch, 'memory'))
+    sqlite = replay(test_db, monkeypatch, open_engine(test_db, monkeypatch, 'sqlite'))
+    for expected, actual in zip(sqlite, memory):
+        assert actual == expected
+
+
+def test_memory_engine_does_not_touch_disk(test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(test_db.Config, 'DATABASE', str(tmp_path / 'hotel.db'))
+    replay(test_db, monkeypatch, open_engine(test_db, monkeypatch, 'memory'))
+    assert not os.path.exists(test_db.Config.DATABASE)
+
+
+def test_booking_conflict_is_rejected_by_both_engines(test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(test_db.Config, 'DATABASE', str(tmp_path / 'hotel.db'))
+    for engine in ('memory', 'sqlite'):
+        statuses = [status for method, url, status, payload
+                    in replay(test_db, monkeypatch, open_engine(test_db, monkeypatch, engine))
+                    if method == 'post' and url == '/api/bookings']
+        assert statuses == [201, 400, 400]
@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from conftest import day
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    database = str(tmp_path / 'queue.db')
+    conn = sqlite3.connect(database)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+    conn.close()
+    write_queue = WriteQueue(database, batch_size=32, max_wait=0.05)
+    yield write_queue
+    write_queue.close()
+
+
+def _names(queue):
+    conn = sqlite3.connect(queue.database)
+    try:
+        return [row[0] for row in conn.execute('SELECT name FROM items ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def _insert(conn, name):
+    conn.execute('INSERT INTO items (name) VALUES (?)', (name,))
+    return name
+
+
+def _insert_then_fail(conn, name):
+    conn.execute('INSERT INTO items (name) VALUES (?)', (name,))
+    raise ValueError(name)
+
+
+def _submit_in_one_batch(queue, jobs):
+    """先以一個工作卡住寫入執行緒，讓 jobs 排進同一個批次，回傳各工作的 (結果, 例外)"""
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(conn):
+        started.set()
+        release.wait(5)
+
+    blocking = threading.Thread(target=queue.submit, args=(blocker,))
+    blocking.start()
+    assert started.wait(5)
+
+    outcomes = [None] * len(jobs)
+
+    def submit(index, job, args):
+        try:
+            outcomes[index] = (queue.submit(job, *args), None)
+        except Exception as e:
+            outcomes[index] = (None, e)
+
+    threads = [threading.Thread(target=submit, args=(index, job, args)) for index, (job, args) in enumerate(jobs)]
+    for thread in threads:
+        thread.start()
+    while queue._queue.qsize() < len(jobs):
+        time.sleep(0.001)
+    batches = queue.batches
+    release.set()
+    for thread in threads + [blocking]:
+        thread.join(5)
+    return outcomes, queue.batches - batches
+
+
+def test_failing_job_rolls_back_only_its_own_savepoint(queue):
+    outcomes, batches = _submit_in_one_batch(queue, [
+        (_insert, ('a',)),
+        (_insert_then_fail, ('b',)),
+        (_insert, ('c',)),
+    ])
+    # 卡住的批次與三個工作的批次
+    assert batches == 2
+    assert outcomes[0] == ('a', None)
+    assert isinstance(outcomes[1][1], ValueError)
+    assert outcomes[2] == ('c', None)
+    assert _names(queue) == ['a', 'c']
+
+
+def test_jobs_in_a_batch_see_earlier_writes(queue):
+    def insert_unless_present(conn, name):
+        if conn.execute('SELECT 1 FROM items WHERE name = ?', (name,)).fetchone():
+            return False
+        _insert(conn, name)
+        return True
+
+    outcomes, _ = _submit_in_one_batch(queue, [(insert_unless_present, ('same',))] * 5)
+    assert sorted(result for result, _ in outcomes) == [False] * 4 + [True]
+    assert _names(queue) == ['same']
+
+
+def test_concurrent_identical_bookings_through_the_queue(app_module, monkeypatch, make_room):
+    monkeypatch.setattr(app_module, 'WRITE_QUEUE_ENABLED', True)
+    room = make_room()
+    data = {'room_id': room['id'], 'guest_name': '測試', 'guest_email': 'queue@example.com',
+            'check_in': day(60), 'check_out': day(62)}
+    barrier = threading.Barrier(8)
+    statuses = []
+
+    def post():
+        client = app_module.app.test_client()
+        barrier.wait(5)
+        statuses.append(client.post('/api/bookings', json=data).status_code)
+
+    threads = [threading.Thread(target=post) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(statuses) == [201] + [400] * 7
+    assert app_module.get_write_queue().jobs >= 8
@@ -0,0 +1,102 @@
+"""單一寫入者佇列：由專屬執行緒批次執行寫入工作並合併提交（group commit）"""
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteQueue:
+    """單一寫入執行緒
+
+    呼叫端以 submit(job, *args) 送出寫入工作，job 的簽名為 job(conn, *args)，
+    不可自行 commit。寫入執行緒一次取出最多 batch_size 個工作，放進同一個
+    BEGIN IMMEDIATE 交易中依序執行，每個工作包在自己的 SAVEPOINT 內，
+    某個工作失敗只會回滾它自己的變更。同一批次的工作看得到前面工作的寫入，
+    所以衝突檢查 + 新增不會產生重複訂房。
+    """
+
+    def __init__(self, database, batch_size=32, max_wait=0.002):
+        self.database = database
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._thread.start()
+
+    def submit(self, job, *args, timeout=None):
+        """送出寫入工作並等待結果（工作拋出的例外會在呼叫端重新拋出）"""
+        future = Future()
+        self._queue.put((job, args, future))
+        return future.result(timeout)
+
+    def close(self):
+        """停止寫入執行緒（佇列中已送出的工作會先處理完）"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, isolation_level=None, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _collect(self):
+        # 阻塞等待第一個工作，再在 max_wait 內盡量湊滿一個批次
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self._apply(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _apply(self, conn, batch):
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for job, args, future in batch:
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    result = job(conn, *args)
+                    conn.execute('RELEASE write_job')
+                    results.append((future, result, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    conn.execute('RELEASE write_job')
+                    results.append((future, None, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            # 整個批次提交失敗：所有工作都視為失敗
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.jobs += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)